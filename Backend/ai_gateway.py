@@ -0,0 +1,351 @@
+"""Shared gateway for OpenAI chat completions used by docstring generation and function summaries.
+
+One pooled client is reused by every request. Calls have a timeout and
+retry with exponential backoff (handled by the SDK). A semaphore bounds
+how many calls are in flight across the process; a caller that cannot get
+a slot within ``AI_QUEUE_TIMEOUT`` gets ``AIGatewayBusy`` instead of
+holding a web worker. Results are cached per function by a hash of the
+prompt inputs with a TTL, and the functions of one file that miss the
+cache are grouped into as few prompts as ``AI_BATCH_MAX_CHARS`` allows.
+
+Point ``OPENAI_BASE_URL`` at a local stub server to exercise the whole
+path without the real API (see ``benchmarks/bench_ai_gateway.py``).
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+from dotenv import load_dotenv
+
+from support import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Settings below are read at import, which may happen before app.py loads .env
+load_dotenv()
+
+AI_MODEL = os.getenv('AI_MODEL', 'gpt-4-turbo')
+# Seconds per HTTP attempt, and attempts after the first on 429/5xx/connection errors
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', '30'))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '2'))
+# Calls in flight across the process, and how long a caller waits for a slot
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4'))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', '5'))
+# Cached per-function results: lifetime in seconds and entry count
+AI_CACHE_TTL = float(os.getenv('AI_CACHE_TTL', '86400'))
+AI_CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', '4096'))
+# Source characters and functions per prompt when grouping a file's functions
+AI_BATCH_MAX_CHARS = int(os.getenv('AI_BATCH_MAX_CHARS', str(24 * 1024)))
+AI_BATCH_MAX_FUNCTIONS = int(os.getenv('AI_BATCH_MAX_FUNCTIONS', '25'))
+
+SUMMARY_PROMPT = (
+    "You review Python functions. For each function you are given, reply with a summary of what it "
+    "does including its inputs and outputs, a list of concrete refactoring suggestions (possibly "
+    "empty) and a complexity estimate of low, medium or high. Answer with a JSON object of the form "
+    '{"functions": [{"name": str, "summary": str, "suggestions": [str], "complexity": str}]} '
+    "with exactly one entry per function, in the order given."
+)
+DOCSTRING_PROMPT = (
+    "You write Google-style Python docstrings. For each function you are given, write a docstring "
+    "describing its purpose, Args, Returns and Raises where relevant. Give only the docstring text, "
+    "without quotes or indentation. Answer with a JSON object of the form "
+    '{"functions": [{"name": str, "docstring": str}]} with exactly one entry per function, in the order given.'
+)
+
+_JSON_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+
+class AIGatewayError(Exception):
+    """The completion could not be obtained or its reply could not be used."""
+
+
+class AIGatewayBusy(AIGatewayError):
+    """Every in-flight slot stayed taken for AI_QUEUE_TIMEOUT seconds."""
+
+
+def _batches(items: List[Dict[str, Any]], max_chars: int, max_items: int) -> List[List[Dict[str, Any]]]:
+    """Group items into consecutive batches of at most ``max_chars`` source characters and ``max_items`` items.
+
+    An item larger than ``max_chars`` gets a batch of its own.
+    """
+    batches, batch, size = [], [], 0
+    for item in items:
+        length = len(item['source'])
+        if batch and (size + length > max_chars or len(batch) >= max_items):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(item)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _parse_functions_reply(content: str, expected: int) -> List[Dict[str, Any]]:
+    match = _JSON_FENCE_RE.match(content or '')
+    try:
+        reply = json.loads(match.group(1) if match else content)
+    except (TypeError, ValueError) as e:
+        raise AIGatewayError(f'Reply is not valid JSON: {e}') from None
+    entries = reply.get('functions') if isinstance(reply, dict) else reply
+    if not isinstance(entries, list) or len(entries) != expected or not all(isinstance(e, dict) for e in entries):
+        raise AIGatewayError(f'Expected {expected} function entries in the reply')
+    return entries
+
+
+class _AsyncState:
+    """Per-event-loop counterparts of the gateway's client, slots and shared batches."""
+
+    def __init__(self, client: openai.AsyncOpenAI, max_concurrency: int):
+        self.client = client
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.inflight = {}
+
+
+class AIGateway:
+    """Pooled, bounded and cached access to the chat completions API.
+
+    ``summarize_functions`` and ``generate_docstrings`` take items of the
+    form ``{'name': str, 'source': str}`` and return one result per item,
+    in order. Functions whose source was answered before are served from
+    the cache; the rest are sent in batches, concurrently up to the
+    in-flight limit. The ``a``-prefixed coroutine variants do the same on
+    the running event loop with an async client, for the ASGI entry point.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, model: str = AI_MODEL,
+                 timeout: float = AI_TIMEOUT, max_retries: int = AI_MAX_RETRIES,
+                 max_concurrency: int = AI_MAX_CONCURRENCY, queue_timeout: float = AI_QUEUE_TIMEOUT,
+                 cache: Optional[TTLCache] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.cache = cache if cache is not None else TTLCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='ai-gateway')
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._async_states = weakref.WeakKeyDictionary()
+        self.requests = 0
+        self.busy_rejections = 0
+
+    @classmethod
+    def from_env(cls) -> 'AIGateway':
+        return cls(api_key=os.getenv('OPENAI_API_KEY'), base_url=os.getenv('OPENAI_BASE_URL') or None)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def client(self) -> openai.OpenAI:
+        with self._client_lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                    max_retries=self.max_retries,
+                    http_client=httpx.Client(limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency
+                    ))
+                )
+            return self._client
+
+    def _async_state(self) -> '_AsyncState':
+        """Client, slots and shared batches for the running event loop; asyncio objects cannot cross loops."""
+        if not self.enabled:
+            raise AIGatewayError('OPENAI_API_KEY is not set')
+        loop = asyncio.get_running_loop()
+        state = self._async_states.get(loop)
+        if state is None:
+            state = self._async_states[loop] = _AsyncState(openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                max_retries=self.max_retries,
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ))
+            ), self.max_concurrency)
+        return state
+
+    def _request(self, system: str, user: str, temperature: float) -> Dict[str, Any]:
+        if not self.enabled:
+            raise AIGatewayError('OPENAI_API_KEY is not set')
+        return {
+            'model': self.model,
+            'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': user}],
+            'temperature': temperature,
+            'response_format': {'type': 'json_object'}
+        }
+
+    def _busy(self) -> AIGatewayBusy:
+        self.busy_rejections += 1
+        return AIGatewayBusy(f'{self.max_concurrency} AI requests already in flight')
+
+    def complete(self, system: str, user: str, temperature: float = 0.2) -> str:
+        """Run one chat completion under the in-flight limit and return the reply text."""
+        request = self._request(system, user, temperature)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise self._busy()
+        try:
+            self.requests += 1
+            response = self.client.chat.completions.create(**request)
+        except openai.OpenAIError as e:
+            raise AIGatewayError(str(e)) from e
+        finally:
+            self._slots.release()
+        return response.choices[0].message.content
+
+    async def acomplete(self, system: str, user: str, temperature: float = 0.2) -> str:
+        """``complete`` for coroutines: waiting for a slot or a reply holds no thread."""
+        request = self._request(system, user, temperature)
+        state = self._async_state()
+        try:
+            await asyncio.wait_for(state.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._busy() from None
+        try:
+            self.requests += 1
+            response = await state.client.chat.completions.create(**request)
+        except openai.OpenAIError as e:
+            raise AIGatewayError(str(e)) from e
+        finally:
+            state.slots.release()
+        return response.choices[0].message.content
+
+    def _cache_key(self, kind: str, source: str) -> str:
+        digest = hashlib.sha256(f'{kind}\0{self.model}\0'.encode('utf-8'))
+        digest.update(source.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _batch_key(self, kind: str, batch: List[Dict[str, Any]]) -> bytes:
+        return hashlib.sha256('\0'.join(self._cache_key(kind, item['source']) for item in batch).encode()).digest()
+
+    @staticmethod
+    def _batch_prompt(batch: List[Dict[str, Any]]) -> str:
+        return '\n\n'.join(f"### Function {i}: {item['name']}\n```python\n{item['source']}\n```"
+                           for i, item in enumerate(batch, 1))
+
+    def _store_batch(self, kind: str, batch: List[Dict[str, Any]], content: str) -> List[Dict[str, Any]]:
+        entries = _parse_functions_reply(content, len(batch))
+        for item, entry in zip(batch, entries):
+            self.cache.put(self._cache_key(kind, item['source']), entry)
+        return entries
+
+    def _run_batch(self, kind: str, system: str, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Answer one batch, sharing the call with any concurrent caller that sent the same batch."""
+        batch_key = self._batch_key(kind, batch)
+        with self._inflight_lock:
+            shared = self._inflight.get(batch_key)
+            if shared is None:
+                future = self._inflight[batch_key] = concurrent.futures.Future()
+        if shared is not None:
+            return shared.result()
+        try:
+            entries = self._store_batch(kind, batch, self.complete(system, self._batch_prompt(batch)))
+            future.set_result(entries)
+            return entries
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[batch_key]
+
+    async def _arun_batch(self, kind: str, system: str, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """``_run_batch`` for coroutines; batches are shared between tasks of the same event loop."""
+        inflight = self._async_state().inflight
+        batch_key = self._batch_key(kind, batch)
+        task = inflight.get(batch_key)
+        if task is None:
+            task = inflight[batch_key] = asyncio.ensure_future(self._afetch_batch(kind, system, batch))
+            task.add_done_callback(lambda _: inflight.pop(batch_key, None))
+        # Shielded, so one caller giving up does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def _afetch_batch(self, kind: str, system: str, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self._store_batch(kind, batch, await self.acomplete(system, self._batch_prompt(batch)))
+
+    def _plan(self, kind: str, items: List[Dict[str, Any]]):
+        """Cached results per item (None where missing) and the batches that would fill the gaps."""
+        results = [self.cache.get(self._cache_key(kind, item['source'])) for item in items]
+        missing = [dict(item, index=i) for i, (item, result) in enumerate(zip(items, results)) if result is None]
+        return results, _batches(missing, AI_BATCH_MAX_CHARS, AI_BATCH_MAX_FUNCTIONS)
+
+    @staticmethod
+    def _fill(results: List, batches: List[List[Dict[str, Any]]], outcomes: List[List[Dict[str, Any]]]) -> List:
+        for batch, entries in zip(batches, outcomes):
+            for item, entry in zip(batch, entries):
+                results[item['index']] = entry
+        return results
+
+    def _map_functions(self, kind: str, system: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results, batches = self._plan(kind, items)
+        if len(batches) == 1:
+            # Common case: the calling thread makes the single call itself
+            outcomes = [self._run_batch(kind, system, batches[0])]
+        else:
+            futures = [self._executor.submit(self._run_batch, kind, system, batch) for batch in batches]
+            outcomes = [future.result() for future in futures]
+        return self._fill(results, batches, outcomes)
+
+    async def _amap_functions(self, kind: str, system: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results, batches = self._plan(kind, items)
+        outcomes = await asyncio.gather(*(self._arun_batch(kind, system, batch) for batch in batches))
+        return self._fill(results, batches, outcomes)
+
+    @staticmethod
+    def _summary(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'summary': str(entry.get('summary', '')),
+            'suggestions': [str(s) for s in entry.get('suggestions') or []],
+            'complexity': entry.get('complexity')
+        }
+
+    def summarize_functions(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """``{'summary', 'suggestions', 'complexity'}`` for each item."""
+        return [self._summary(entry) for entry in self._map_functions('summary', SUMMARY_PROMPT, items)]
+
+    async def asummarize_functions(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self._summary(entry) for entry in await self._amap_functions('summary', SUMMARY_PROMPT, items)]
+
+    def generate_docstrings(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Docstring text, without quotes or indentation, for each item."""
+        return [str(entry.get('docstring', '')).strip() for entry in self._map_functions('docstring', DOCSTRING_PROMPT, items)]
+
+    async def agenerate_docstrings(self, items: List[Dict[str, Any]]) -> List[str]:
+        entries = await self._amap_functions('docstring', DOCSTRING_PROMPT, items)
+        return [str(entry.get('docstring', '')).strip() for entry in entries]
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'model': self.model,
+            'requests': self.requests,
+            'busy_rejections': self.busy_rejections,
+            'max_concurrency': self.max_concurrency,
+            'cache': self.cache.stats()
+        }
+
+
+ai_gateway = AIGateway.from_env()
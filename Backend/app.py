@@ -1,19 +1,31 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, event, or_
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 import re
 import time
 import ast
 import astor
 import hashlib
-from functools import lru_cache, wraps
-import subprocess
+import math
+import itertools
+from functools import cached_property, lru_cache, partial, wraps
 import tempfile
+import shutil
+import struct
+import zlib
+import base64
 import os
-import openai
+from ai_gateway import AIGatewayBusy, AIGatewayError, ai_gateway
+from minifiers import (
+    C_FAMILY_LANGUAGES, format_uncached, minify_c_family, minify_java, minify_js, minify_python,
+    shorten_chunk, shorten_uncached, warm_formatter
+)
+from support import TTLCache
 import json
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, NamedTuple, Optional, Tuple
 from dotenv import load_dotenv
 import zipfile
 import io
@@ -21,26 +33,32 @@ from pathlib import Path
 import mimetypes
 import logging
 import bleach
-from collections import defaultdict
+from collections import Counter, defaultdict, OrderedDict
+import sqlite3
+import sys
+import threading
 import jwt
 from datetime import datetime, timedelta
 import secrets
-from pygments.lexers import guess_lexer_for_filename, get_lexer_by_name
-from pygments.util import ClassNotFound
 import concurrent.futures
+import multiprocessing
+import concurrent.futures.process
+import heapq
+import atexit
 # from your_analysis_tools import analyze_python_code, analyze_javascript_code # hypothetical functions
 
 logger = logging.getLogger(__name__)
 
 # Constants
-CODE_LENGTH_THRESHOLD = 5000
+# Bump whenever a minifier's output changes so cached results are not reused
+MINIFIER_VERSION = '3'
 MASKING_SUPPORTED_EXTENSIONS = {
 	'.txt', '.js', '.py', '.env', '.json', '.yml', '.yaml', '.html', '.php', '.java', '.c', '.cpp'
 }
 
 # Initialize Flask app first
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['X-Next-Cursor'])  # Enable CORS for all routes; let clients read the paging cursor
 
 # Load environment variables
 load_dotenv()
@@ -53,18 +71,63 @@ if _db_url.startswith('postgresql://') and 'render.com' in _db_url and 'sslmode=
     _db_url = _db_url + ('?sslmode=require' if '?' not in _db_url else '&sslmode=require')
 app.config['SQLALCHEMY_DATABASE_URI'] = _db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pool for server databases such as Postgres
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Seconds before a pooled connection is replaced, below typical server and proxy idle timeouts
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Test each connection on checkout, so one dropped by the server is replaced instead of failing a request
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') != '0'
+# Pragmas for SQLite database files: WAL lets readers run alongside the writer, and NORMAL skips
+# the fsync on each commit (a power loss can lose the last commits, but not corrupt the database)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+
+def database_engine_options(url: str) -> Dict[str, Any]:
+    """SQLALCHEMY_ENGINE_OPTIONS for ``url``; SQLite keeps the pool Flask-SQLAlchemy picks for it."""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS:d}')
+        cursor.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+    finally:
+        cursor.close()
+
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(_db_url)
 db = SQLAlchemy(app)
 
+
+def _is_sqlite_file() -> bool:
+    # In-memory databases have no journal to configure
+    return db.engine.dialect.name == 'sqlite' and db.engine.url.database not in (None, '', ':memory:')
+
+
+with app.app_context():
+    if _is_sqlite_file():
+        event.listen(db.engine, 'connect', _configure_sqlite_connection)
+
 # Load SECRET_KEY from environment variable, or generate a new one if not set
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 if not app.config['SECRET_KEY']:
     app.config['SECRET_KEY'] = secrets.token_hex(32)
     logger.warning("SECRET_KEY not set in environment, generating a new one. This will invalidate existing tokens on restart. For production, set a persistent SECRET_KEY environment variable.")
 
-# In-memory database for snippets (for demonstration purposes)
-# In a real application, this would be replaced with a persistent database
-snippets_db = {} 
-
 # SQLAlchemy model(s)
 class User(db.Model):
     __tablename__ = 'users'
@@ -72,6 +135,8 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Unix time before which tokens issued to this user are rejected (see revoke_user)
+    tokens_valid_after = db.Column(db.Integer, nullable=True)
 
     def set_password(self, password: str) -> None:
         self.password_hash = generate_password_hash(password)
@@ -79,189 +144,1370 @@ class User(db.Model):
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
 
-with app.app_context():
-    try:
-        db.create_all()
-    except Exception as e:
-        logger.error(f"DB init failed: {e}")
-
 # New SQLAlchemy models for processed files and comments
+class ContentBlob(db.Model):
+    """Text stored once per SHA-256 of its UTF-8 bytes, compressed when that makes it smaller"""
+    __tablename__ = 'content_blobs'
+    hash = db.Column(db.String(64), primary_key=True)
+    encoding = db.Column(db.String(8), nullable=False)  # 'raw', 'zlib' or 'zstd'
+    size = db.Column(db.Integer, nullable=False)  # UTF-8 bytes before compression
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @property
+    def text(self) -> str:
+        return decode_blob(self.encoding, self.data).decode('utf-8')
+
+
 class ProcessedFile(db.Model):
     __tablename__ = 'processed_files'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    original = db.Column(db.Text, nullable=False)
-    shortened = db.Column(db.Text, nullable=False)
+    # Inline copies written before content_blobs existed; empty for rows that reference blobs
+    original_inline = db.Column('original', db.Text, nullable=False, default='')
+    shortened_inline = db.Column('shortened', db.Text, nullable=False, default='')
+    original_hash = db.Column(db.String(64), db.ForeignKey('content_blobs.hash'), nullable=True)
+    shortened_hash = db.Column(db.String(64), db.ForeignKey('content_blobs.hash'), nullable=True)
     language = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     user = db.relationship('User', backref=db.backref('processed_files', lazy=True))
+    original_blob = db.relationship('ContentBlob', foreign_keys=[original_hash])
+    shortened_blob = db.relationship('ContentBlob', foreign_keys=[shortened_hash])
+
+    @property
+    def original(self) -> str:
+        return self.original_blob.text if self.original_hash else self.original_inline
+
+    @property
+    def shortened(self) -> str:
+        return self.shortened_blob.text if self.shortened_hash else self.shortened_inline
+
+
+class Snippet(db.Model):
+    """A saved code snippet, addressed by its short id and listed per user newest first"""
+    __tablename__ = 'snippets'
+    short_id = db.Column(db.String(16), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    code = db.Column(db.Text, nullable=False)
+    language = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Serves the keyset listing; short_id breaks ties between equal timestamps
+    __table_args__ = (db.Index('ix_snippets_user_created', 'user_id', 'created_at', 'short_id'),)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'short_id': self.short_id,
+            'user_id': str(self.user_id),
+            'code': self.code,
+            'language': self.language,
+            'title': self.title,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
 
 
 class Comment(db.Model):
     __tablename__ = 'comments'
     id = db.Column(db.Integer, primary_key=True)
-    file_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'), nullable=False, index=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'), nullable=False)
     username = db.Column(db.String(255), nullable=False)
     comment = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # Serves the keyset listing per file without a sort; id breaks ties between equal timestamps
+    __table_args__ = (db.Index('ix_comments_file_created', 'file_id', 'created_at', 'id'),)
+
     file = db.relationship('ProcessedFile', backref=db.backref('comments', lazy=True, cascade="all, delete-orphan"))
 
 
-with app.app_context():
-    try:
-        db.create_all()
-    except Exception as e:
-        logger.error(f"DB migration failed: {e}")
+class IdBlock(db.Model):
+    """Next unreserved id of a table whose ids are handed out in blocks before its rows are written"""
+    __tablename__ = 'id_blocks'
+    name = db.Column(db.String(64), primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
+
+
+class RevokedToken(db.Model):
+    """A login token rejected before its expiry, by its jti; rows are pruned once the token expires"""
+    __tablename__ = 'revoked_tokens'
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+
+class FunctionSummary(db.Model):
+    """AI summary of one function, keyed by its normalized AST hash and the model that wrote it"""
+    __tablename__ = 'function_summaries'
+    function_hash = db.Column(db.String(32), primary_key=True)
+    model = db.Column(db.String(64), primary_key=True)
+    summary = db.Column(db.Text, nullable=False)
+    suggestions = db.Column(db.Text, nullable=False, default='[]')  # JSON list of strings
+    complexity = db.Column(db.String(16), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+def _add_missing_columns(table) -> None:
+    """Add nullable columns declared on ``table`` but missing from the database."""
+    existing = {column['name'] for column in db.inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+_database_ready = False
+_database_lock = threading.Lock()
+
+
+def init_database() -> None:
+    """Create missing tables, columns and indexes and set the SQLite journal mode.
+
+    Runs at server startup (``python app.py``, the ASGI lifespan, ``flask init-db``)
+    or before the first request, never on import, so importing the module leaves
+    the database file untouched.
+    """
+    global _database_ready
+    with _database_lock:
+        if _database_ready:
+            return
+        with app.app_context():
+            try:
+                if _is_sqlite_file():
+                    # The journal mode is stored in the database file, so it is set once here
+                    with db.engine.connect() as connection:
+                        connection.exec_driver_sql(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}')
+                db.create_all()
+                # create_all skips existing tables, so columns and indexes added to them later are created here
+                _add_missing_columns(ProcessedFile.__table__)
+                _add_missing_columns(User.__table__)
+                for index in Comment.__table__.indexes:
+                    index.create(db.engine, checkfirst=True)
+            except Exception as e:
+                logger.error(f"DB migration failed: {e}")
+        _database_ready = True
+
+
+@app.before_request
+def _ensure_database():
+    if not _database_ready:
+        init_database()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or migrate the database schema."""
+    init_database()
 
 def generate_short_id():
     """Generates a unique short ID for snippets."""
     return secrets.token_urlsafe(6)
 
+# ===================== Authentication =====================
+
+# Hours a login token is valid
+TOKEN_LIFETIME_HOURS = int(os.getenv('TOKEN_LIFETIME_HOURS', '12'))
+# Verified tokens kept, and seconds one is trusted before its signature is checked again
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '300'))
+# Signed-in users kept, and seconds their identity is reused without a query
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '4096'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+
+class UserIdentity(NamedTuple):
+    """The parts of a User that authenticated requests need"""
+    id: int
+    email: str
+    tokens_valid_after: int
+
+
+_verified_tokens = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+_user_identities = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Claims of a valid HS256 token that has not been revoked; raises jwt.InvalidTokenError otherwise.
+
+    The claims of a verified token are cached until its ``exp`` or for
+    TOKEN_CACHE_TTL seconds, so repeat requests skip the signature check and
+    the revoked_tokens lookup. A token revoked by another worker is
+    therefore rejected here within TOKEN_CACHE_TTL seconds. The returned
+    dict is shared; do not modify it.
+    """
+    entry = _verified_tokens.get(token)
+    if entry is None or entry[1] <= time.time():
+        claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        if claims.get('jti') and db.session.get(RevokedToken, claims['jti']) is not None:
+            raise jwt.InvalidTokenError('Token has been revoked')
+        entry = (claims, claims.get('exp', math.inf))
+        _verified_tokens.put(token, entry)
+    return entry[0]
+
+
+def authenticate(token: str) -> Tuple[Dict[str, Any], UserIdentity]:
+    """Claims and identity for ``token``; raises jwt.InvalidTokenError if it is invalid, revoked or its user is gone."""
+    claims = decode_token(token)
+    identity = get_user_identity(int(claims.get('user_id')))
+    if identity is None:
+        raise jwt.InvalidTokenError('Unknown user')
+    if claims.get('iat', 0) < identity.tokens_valid_after:
+        raise jwt.InvalidTokenError('Token has been revoked')
+    return claims, identity
+
+
+def revoke_token(token: str) -> None:
+    """Reject ``token`` from now on, e.g. at logout; a token without a jti revokes its user's tokens."""
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return
+    if not claims.get('jti'):
+        revoke_user(int(claims['user_id']))
+        return
+    now = int(time.time())
+    expires_at = int(claims.get('exp', now + TOKEN_LIFETIME_HOURS * 3600))
+    db.session.execute(db.delete(RevokedToken).where(RevokedToken.expires_at < now))
+    db.session.merge(RevokedToken(jti=claims['jti'], expires_at=expires_at))
+    db.session.commit()
+    _verified_tokens.discard(token)
+
+
+def revoke_user(user_id: int) -> None:
+    """Reject tokens issued to ``user_id`` before the current second, e.g. after a password change.
+
+    Other workers pick this up when their cached identity expires, within
+    USER_CACHE_TTL seconds. Token ``iat`` claims are whole seconds, so a
+    token issued later in the same second, such as one from logging in
+    again, stays valid.
+    """
+    db.session.execute(db.update(User).where(User.id == user_id).values(tokens_valid_after=int(time.time())))
+    db.session.commit()
+    _user_identities.discard(user_id)
+
+
+def get_user_identity(user_id: int) -> Optional[UserIdentity]:
+    """``UserIdentity`` of a user, loaded at most once per USER_CACHE_TTL seconds; None if there is no such user."""
+    identity = _user_identities.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = UserIdentity(user.id, user.email, user.tokens_valid_after or 0)
+        _user_identities.put(user_id, identity)
+    return identity
+
+
+def _bearer_token() -> Optional[str]:
+    auth_header = request.headers.get('Authorization', '')
+    if isinstance(auth_header, str) and auth_header.lower().startswith('bearer '):
+        return auth_header.split(' ', 1)[1].strip() or None
+    return None
+
+
+def _request_token() -> Optional[str]:
+    return _bearer_token() or request.headers.get('x-access-token')
+
+
 def jwt_required(f):
     """
     Decorator to protect API routes, ensuring a valid JWT is present.
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization', '')
-        if isinstance(auth_header, str) and auth_header.lower().startswith('bearer '):
-            token = auth_header.split(' ', 1)[1].strip()
-        if not token and 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
+        token = _request_token()
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = data['user_id']
+            claims, _ = authenticate(token)
+            current_user = claims['user_id']
         except Exception as e:
             return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
         return f(current_user, *args, **kwargs)
     return decorated
 
 
-def _get_current_user_optional() -> Optional[User]:
-    """Attempt to decode Authorization bearer token and return the User or None."""
+def _get_current_user_optional() -> Optional[UserIdentity]:
+    """Identity of the user whose bearer token is on the request, or None."""
     try:
-        auth_header = request.headers.get('Authorization', '')
-        token = None
-        if isinstance(auth_header, str) and auth_header.lower().startswith('bearer '):
-            token = auth_header.split(' ', 1)[1].strip()
+        token = _bearer_token()
         if not token:
             return None
-        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-        user_id = int(data.get('user_id'))
-        return db.session.get(User, user_id)
+        return authenticate(token)[1]
     except Exception:
         return None
 
-def fast_strip(code_str):
-    """Quickly strip comments and blank lines from Python code"""
-    lines = code_str.split('\n')
-    result_lines = []
-    in_multiline_comment = False
-    
-    for line in lines:
-        # Handle multiline comments
-        if '"""' in line or "'''" in line:
-            in_multiline_comment = not in_multiline_comment
-            continue
-        if in_multiline_comment:
-            continue
-            
-        # Remove inline comments and leading/trailing whitespace
-        temp = re.sub(r'#.*', '', line).rstrip()
-        if temp:
-            result_lines.append(temp)
-    
-    return '\n'.join(result_lines)
+# ===================== Content Store =====================
+
+# Compression for new blobs: zlib, zstd (needs the zstandard package) or none
+BLOB_COMPRESSION = os.getenv('BLOB_COMPRESSION', 'zlib').lower()
+# Blobs smaller than this are stored raw
+BLOB_COMPRESS_MIN_BYTES = int(os.getenv('BLOB_COMPRESS_MIN_BYTES', '256'))
+# Hashes remembered as stored, so repeated content skips the existence query
+BLOB_KNOWN_HASHES = int(os.getenv('BLOB_KNOWN_HASHES', '65536'))
+# Hashes per existence query, below SQLite's bound parameter limit
+_BLOB_QUERY_CHUNK = 500
+
+_known_blobs = OrderedDict()
+_known_blobs_lock = threading.Lock()
 
-def minify_python(code):
-    """Minify Python code using either fast_strip or AST-based approach"""
+
+@lru_cache(maxsize=1)
+def _zstd():
+    """Import zstandard once and return the module, or None if it is not installed"""
     try:
-        # For long code, try fast_strip first
-        if len(code) > CODE_LENGTH_THRESHOLD:
-            fast_stripped = fast_strip(code)
+        import zstandard
+    except ImportError:
+        logger.warning("zstandard is not installed; blobs are compressed with zlib instead")
+        return None
+    return zstandard
+
+
+def blob_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def encode_blob(data: bytes) -> Tuple[str, bytes]:
+    """``(encoding, stored bytes)`` for ``data`` under BLOB_COMPRESSION, raw when compression does not pay."""
+    if len(data) >= BLOB_COMPRESS_MIN_BYTES and BLOB_COMPRESSION in ('zlib', 'zstd'):
+        zstandard = _zstd() if BLOB_COMPRESSION == 'zstd' else None
+        if zstandard is not None:
+            encoding, packed = 'zstd', zstandard.ZstdCompressor().compress(data)
+        else:
+            encoding, packed = 'zlib', zlib.compress(data)
+        if len(packed) < len(data):
+            return encoding, packed
+    return 'raw', data
+
+
+def decode_blob(encoding: str, data: bytes) -> bytes:
+    if encoding == 'raw':
+        return data
+    if encoding == 'zlib':
+        return zlib.decompress(data)
+    if encoding == 'zstd':
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd blobs')
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f'Unknown blob encoding: {encoding}')
+
+
+def _blobs_known(hashes) -> bool:
+    with _known_blobs_lock:
+        for digest in hashes:
+            if digest not in _known_blobs:
+                return False
+            _known_blobs.move_to_end(digest)
+        return True
+
+
+def _remember_blobs(hashes) -> None:
+    with _known_blobs_lock:
+        for digest in hashes:
+            _known_blobs[digest] = True
+            _known_blobs.move_to_end(digest)
+        while len(_known_blobs) > BLOB_KNOWN_HASHES:
+            _known_blobs.popitem(last=False)
+
+
+def save_processed_files(rows: List[Dict[str, Any]]) -> None:
+    """Insert ProcessedFile rows (``id``, ``user_id``, ``original``, ``shortened``, ``language``) in one commit.
+
+    Each distinct text is stored once in content_blobs, and only texts not
+    stored yet are written. If another request stores the same blob first,
+    the insert is retried once against the stored copy.
+    """
+    texts = {}
+    records = []
+    for row in rows:
+        original_hash, shortened_hash = blob_hash(row['original']), blob_hash(row['shortened'])
+        texts[original_hash] = row['original']
+        texts[shortened_hash] = row['shortened']
+        records.append({'id': row['id'], 'user_id': row['user_id'], 'original_hash': original_hash,
+                        'shortened_hash': shortened_hash, 'language': row['language'],
+                        'created_at': row.get('created_at') or datetime.utcnow()})
+    for attempt in range(2):
+        try:
+            if not _blobs_known(texts):
+                unknown = list(texts)
+                stored = set()
+                for start in range(0, len(unknown), _BLOB_QUERY_CHUNK):
+                    stored.update(db.session.scalars(db.select(ContentBlob.hash).where(
+                        ContentBlob.hash.in_(unknown[start:start + _BLOB_QUERY_CHUNK]))))
+                blobs = []
+                for digest in unknown:
+                    if digest not in stored:
+                        data = texts[digest].encode('utf-8', 'surrogatepass')
+                        encoding, packed = encode_blob(data)
+                        blobs.append({'hash': digest, 'encoding': encoding, 'size': len(data), 'data': packed})
+                if blobs:
+                    db.session.execute(db.insert(ContentBlob), blobs)
+            db.session.execute(db.insert(ProcessedFile), records)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
+            continue
+        except Exception:
+            db.session.rollback()
+            raise
+        _remember_blobs(texts)
+        return
+
+
+def save_processed_file(user_id: Optional[int], original: str, shortened: str, language: str) -> int:
+    """Insert one ProcessedFile now, without the write-behind queue; returns its id."""
+    file_id = processed_file_ids.next()
+    save_processed_files([{'id': file_id, 'user_id': user_id, 'original': original,
+                           'shortened': shortened, 'language': language}])
+    return file_id
+
+
+# ===================== Write-Behind Persistence =====================
+
+# 'sync': /api/shorten answers once its row is committed, sharing the commit with concurrent requests.
+# 'async': it answers at once and the row is committed within PERSIST_BATCH_WINDOW_MS.
+PERSIST_MODE = os.getenv('PERSIST_MODE', 'sync').lower()
+# Rows per commit, and how long async mode waits for a batch to fill
+PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE', '500'))
+PERSIST_BATCH_WINDOW_MS = int(os.getenv('PERSIST_BATCH_WINDOW_MS', '50'))
+# Queued rows beyond which submitters wait for the writer
+PERSIST_QUEUE_MAX = int(os.getenv('PERSIST_QUEUE_MAX', '10000'))
+# Seconds a sync request waits for its commit, and attempts per batch before its rows are dropped
+PERSIST_SYNC_TIMEOUT = float(os.getenv('PERSIST_SYNC_TIMEOUT', '10'))
+PERSIST_ATTEMPTS = 3
+# Ids reserved per round trip to id_blocks
+PERSIST_ID_BLOCK = int(os.getenv('PERSIST_ID_BLOCK', '1000'))
+
+
+class IdAllocator:
+    """Hands out ids for ``column``'s table from blocks reserved in id_blocks, so rows can be written later.
+
+    A block is reserved by advancing the table's id_blocks row in its own
+    transaction, which the database serializes, so processes never share
+    ids. The first reservation starts above the table's highest id. Ids of
+    a block left unused when a process exits are skipped.
+    """
+
+    def __init__(self, column, block_size: int):
+        self.column = column
+        self.name = column.table.name
+        self.block_size = block_size
+        self._ids = iter(())
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            file_id = next(self._ids, None)
+            if file_id is None:
+                self._ids = iter(self._reserve())
+                file_id = next(self._ids)
+            return file_id
+
+    def _reserve(self) -> range:
+        size = self.block_size
+        for _ in range(2):
             try:
-                # Validate the stripped code
-                compile(fast_stripped, '<string>', 'exec')
-                return fast_stripped
-            except SyntaxError:
-                # Fall back to AST-based minification if fast_strip fails
-                pass
-        
-        # AST-based minification for shorter code or if fast_strip failed
-        tree = ast.parse(code)
-        
-        # Remove comments and docstrings
-        for node in ast.walk(tree):
-            # Remove docstrings
-            if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Module)):
-                if (len(node.body) > 0 and 
-                    isinstance(node.body[0], ast.Expr) and 
-                    isinstance(node.body[0].value, ast.Str)):
-                    node.body.pop(0)
-        
-        # Convert back to source code
-        minified = astor.to_source(tree)
-        
-        # Clean up extra newlines and spaces
-        minified = re.sub(r'\n\s*\n', '\n', minified)  # Remove multiple newlines
-        minified = re.sub(r'^\s+', '', minified, flags=re.MULTILINE)  # Remove leading spaces
-        minified = re.sub(r'\s+$', '', minified, flags=re.MULTILINE)  # Remove trailing spaces
-        
-        return minified.strip()
-    except Exception as e:
-        print(f"Error minifying Python code: {e}")
-        return code
+                with db.engine.begin() as connection:
+                    advanced = connection.execute(db.update(IdBlock).where(IdBlock.name == self.name).values(
+                        next_id=IdBlock.next_id + size)).rowcount
+                    if advanced:
+                        end = connection.execute(db.select(IdBlock.next_id).where(IdBlock.name == self.name)).scalar()
+                        return range(end - size, end)
+                    start = (connection.execute(db.select(db.func.max(self.column))).scalar() or 0) + 1
+                    connection.execute(db.insert(IdBlock).values(name=self.name, next_id=start + size))
+                    return range(start, start + size)
+            except IntegrityError:
+                # Another process created the row first; advance it instead
+                continue
+        raise RuntimeError(f'Could not reserve ids for {self.name}')
+
+
+processed_file_ids = IdAllocator(ProcessedFile.id, PERSIST_ID_BLOCK)
+
+
+class ProcessedFileWriter:
+    """Write-behind queue that commits ProcessedFile rows in batches on a background thread.
+
+    ``submit`` takes the row's id from ``processed_file_ids`` and queues it.
+    In sync mode it returns once the batch holding the row has committed;
+    rows queued while a commit is running go into the next one, so
+    concurrent requests share commits. In async mode it returns at once, and
+    a batch is committed after ``window`` seconds or ``batch_size`` rows.
+    A sync request whose batch is not committed within PERSIST_SYNC_TIMEOUT
+    gets its id anyway, as in async mode, since the row is still queued.
+    A failed batch is retried ``PERSIST_ATTEMPTS`` times in all, then its
+    rows are inserted one by one, so only rows that fail alone are dropped.
+    ``close``, registered with atexit, commits whatever is still queued.
+    """
+
+    def __init__(self, mode: str, batch_size: int, window: float, max_queued: int):
+        if mode not in ('sync', 'async'):
+            raise ValueError(f"PERSIST_MODE must be 'sync' or 'async', not {mode!r}")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.window = window
+        self.max_queued = max_queued
+        self._queue = []
+        self._pending = {}  # id -> Future, until its batch is committed or dropped
+        self._flush_now = False
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, user_id: Optional[int], original: str, shortened: str, language: str) -> int:
+        file_id = processed_file_ids.next()
+        row = {'id': file_id, 'user_id': user_id, 'original': original, 'shortened': shortened,
+               'language': language, 'created_at': datetime.utcnow()}
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('ProcessedFileWriter is closed')
+            while len(self._queue) >= self.max_queued:
+                self._cond.wait()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='processed-file-writer', daemon=True)
+                self._thread.start()
+            self._queue.append((row, future))
+            self._pending[file_id] = future
+            self._cond.notify_all()
+        if self.mode == 'sync':
+            try:
+                future.result(timeout=PERSIST_SYNC_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                logger.warning(f"Processed file {file_id} not committed within {PERSIST_SYNC_TIMEOUT:g}s; "
+                               "it stays queued")
+        return file_id
+
+    def wait_for(self, file_id: int, timeout: float = PERSIST_SYNC_TIMEOUT) -> bool:
+        """Commit ``file_id`` now if it is still queued; False if it was not queued."""
+        with self._cond:
+            future = self._pending.get(file_id)
+            if future is None:
+                return False
+            self._flush_now = True
+            self._cond.notify_all()
+        future.result(timeout=timeout)
+        return True
+
+    def close(self, timeout: float = 30) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"{len(self._queue)} processed files were still queued at shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'mode': self.mode, 'queued': len(self._queue), 'batches': self.batches, 'rows': self.rows}
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self.mode == 'async':
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.batch_size and not (self._flush_now or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+            self._flush_now = bool(self._flush_now and self._queue)
+            self._cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            error = None
+            for attempt in range(PERSIST_ATTEMPTS):
+                try:
+                    with app.app_context():
+                        save_processed_files([row for row, _ in batch])
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    time.sleep(0.1 * 2 ** attempt)
+            errors = [error] * len(batch)
+            if error is not None and len(batch) > 1:
+                # Find the rows at fault, so the rest of the batch is still stored
+                errors = [self._save_alone(row) for row, _ in batch]
+            with self._cond:
+                for row, _ in batch:
+                    del self._pending[row['id']]
+                saved = errors.count(None)
+                self.batches += bool(saved)
+                self.rows += saved
+            for (_, future), row_error in zip(batch, errors):
+                if row_error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(row_error)
+            if saved < len(batch):
+                logger.error(f"Dropped {len(batch) - saved} of {len(batch)} processed files after "
+                             f"{PERSIST_ATTEMPTS} attempts: {next(e for e in errors if e is not None)}")
+
+    @staticmethod
+    def _save_alone(row: Dict[str, Any]) -> Optional[Exception]:
+        try:
+            with app.app_context():
+                save_processed_files([row])
+        except Exception as e:
+            return e
+        return None
+
+
+processed_file_writer = ProcessedFileWriter(PERSIST_MODE, PERSIST_BATCH_SIZE, PERSIST_BATCH_WINDOW_MS / 1000,
+                                            PERSIST_QUEUE_MAX)
+atexit.register(processed_file_writer.close)
+
 
-def minify_js(code: str) -> str:
-    """Placeholder for JavaScript minification."""
-    # You would implement actual JavaScript minification logic here
-    return code
-
-def minify_java(code: str) -> str:
-    """Placeholder for Java minification."""
-    # You would implement actual Java minification logic here
-    return code
-
-def detect_language_simple(code):
-    """Simple language detection based on code patterns"""
-    if 'def ' in code or 'import ' in code or 'print(' in code:
-        return 'Python'
-    elif 'function ' in code or 'const ' in code or 'let ' in code:
-        return 'JavaScript'
-    elif 'public class' in code or 'void ' in code:
-        return 'Java'
-    return 'unknown'
+# ===================== Minification Cache =====================
+
+class MinifyCache:
+    """Content-addressed LRU cache of minified code, bounded by total byte size.
+
+    Entries are keyed by a SHA-256 of (code, language, compression level,
+    MINIFIER_VERSION). When ``db_path`` is given, entries are also written to
+    an SQLite table so results survive restarts and are shared between
+    worker processes on the same host. Access times of disk hits are
+    written in batches of ``touch_batch``, or with the next put, so a read
+    does not cost a commit.
+    """
+
+    def __init__(self, max_bytes: int, db_path: Optional[str] = None, db_max_rows: int = 100_000,
+                 touch_batch: int = 256):
+        self.max_bytes = max_bytes
+        self.db_max_rows = db_max_rows
+        self.touch_batch = touch_batch
+        self._touched = {}  # key -> access time of disk hits not yet written
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS minify_cache '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL)'
+                )
+                self._db.execute('CREATE INDEX IF NOT EXISTS ix_minify_cache_accessed ON minify_cache (accessed_at)')
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Minify cache DB init failed: {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(code: str, lang: Optional[str], compression_percent, options: str = '') -> str:
+        digest = hashlib.sha256()
+        digest.update(
+            f"{MINIFIER_VERSION}\0{(lang or '').lower()}\0{compression_percent}\0{options}\0".encode('utf-8')
+        )
+        digest.update(code.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _entry_size(key: str, value: str) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if self._db is not None:
+                try:
+                    row = self._db.execute('SELECT value FROM minify_cache WHERE key = ?', (key,)).fetchone()
+                    if row is not None:
+                        self._touched[key] = time.time()
+                        if len(self._touched) >= self.touch_batch:
+                            self._flush_touched()
+                            self._db.commit()
+                        self.disk_hits += 1
+                        self._store(key, row[0])
+                        return row[0]
+                except sqlite3.Error as e:
+                    logger.warning(f"Minify cache DB read failed: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._store(key, value)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO minify_cache (key, value, accessed_at) VALUES (?, ?, ?)',
+                        (key, value, time.time())
+                    )
+                    self._db_puts += 1
+                    self._flush_touched()
+                    if self._db_puts % 256 == 0:
+                        self._prune_db()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Minify cache DB write failed: {e}")
+
+    def _store(self, key: str, value: str) -> None:
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= self._entry_size(key, previous)
+        self._entries[key] = value
+        self._size += size
+        while self._size > self.max_bytes:
+            old_key, old_value = self._entries.popitem(last=False)
+            self._size -= self._entry_size(old_key, old_value)
+            self.evictions += 1
+
+    def get_or_minify(self, key: str, minify: Callable[[], str]) -> str:
+        """Cached value of ``key``, or ``minify()`` stored under it."""
+        value = self.get(key)
+        if value is None:
+            value = minify()
+            self.put(key, value)
+        return value
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._db.executemany('UPDATE minify_cache SET accessed_at = ? WHERE key = ?',
+                                 [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+    def _prune_db(self) -> None:
+        (count,) = self._db.execute('SELECT COUNT(*) FROM minify_cache').fetchone()
+        excess = count - self.db_max_rows
+        if excess > 0:
+            self._db.execute(
+                'DELETE FROM minify_cache WHERE key IN '
+                '(SELECT key FROM minify_cache ORDER BY accessed_at LIMIT ?)',
+                (excess,)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'persistent': self._db is not None
+            }
+
+
+minify_cache = MinifyCache(
+    max_bytes=int(os.getenv('MINIFY_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    db_path=os.getenv('MINIFY_CACHE_DB') or None
+)
+
+# ===================== Language Detection =====================
+
+# Language implied by a file extension; a tuple lists the candidates content scoring picks from
+LANGUAGE_EXTENSIONS = {
+    '.py': 'Python', '.pyw': 'Python', '.js': 'JavaScript', '.mjs': 'JavaScript',
+    '.cjs': 'JavaScript', '.jsx': 'JSX', '.ts': 'TypeScript', '.tsx': 'TypeScript',
+    '.java': 'Java', '.c': 'C', '.h': ('C', 'C++'), '.cpp': 'C++', '.cc': 'C++', '.cxx': 'C++',
+    '.hpp': 'C++', '.hh': 'C++', '.cs': 'C#', '.php': 'PHP', '.go': 'Go', '.kt': 'Kotlin',
+    '.kts': 'Kotlin', '.swift': 'Swift', '.rb': 'Ruby', '.rs': 'Rust', '.html': 'HTML',
+    '.htm': 'HTML', '.css': 'CSS', '.scss': 'CSS', '.sql': 'SQL', '.sh': 'Shell', '.bash': 'Shell'
+}
+
+# Only this much of the input is scored; a file's opening is representative and keeps detection O(1)
+DETECT_SAMPLE_CHARS = int(os.getenv('DETECT_SAMPLE_CHARS', str(8 * 1024)))
+# Occurrences of one feature beyond this add nothing, so a single repeated token can't swamp the rest
+_DETECT_COUNT_CAP = 10
+# Score at which a clear winner is reported with full confidence
+_DETECT_CONFIDENT_SCORE = 30.0
+
+_DETECT_TOKEN_RE = re.compile(r'[A-Za-z_]\w*(?:!(?!=))?|<\?php|</|===|!==|:=|::|->|=>|<-|\?\.|\?:|[;{$@]')
+
+# Per-language weight of each token; a token may count towards several languages
+_LANGUAGE_TOKEN_WEIGHTS = {
+    'Python': {
+        'def': 2, 'elif': 4, 'self': 1.5, 'None': 3, 'True': 1.5, 'False': 1.5, 'lambda': 2,
+        'print': 1, 'import': 1, 'from': 1, '__init__': 4, '__name__': 4, 'pass': 2, 'and': 1,
+        'or': 1, 'not': 1, 'is': 0.5, 'in': 0.5, 'with': 0.5, 'except': 4, 'raise': 3,
+        'range': 1, 'len': 1, 'nonlocal': 4, 'yield': 0.5, 'async': 0.5, 'await': 0.5,
+        ';': -0.5, '{': -0.5,
+    },
+    'JavaScript': {
+        'function': 3, 'const': 1.5, 'let': 1.5, 'var': 1.5, 'console': 4, 'document': 3,
+        'window': 3, 'undefined': 3, 'require': 2, 'exports': 3, 'module': 1, 'typeof': 2,
+        'this': 1, 'null': 0.5, 'new': 0.5, 'import': 1, 'export': 1.5, 'from': 0.5,
+        'prototype': 3, 'async': 0.5, 'await': 0.5, 'extends': 1, '=>': 1.5, '===': 2, '!==': 2,
+        '?.': 1, '$': 0.2, ';': 0.2,
+    },
+    'TypeScript': {
+        'function': 2.5, 'const': 1.2, 'let': 1.2, 'var': 1.2, 'console': 3.5, 'undefined': 2.5,
+        'typeof': 1.5, 'this': 1, 'import': 1, 'export': 1.5, 'interface': 2, 'type': 0.5,
+        'string': 0.5, 'number': 0.5, 'boolean': 0.5, 'any': 0.5, 'readonly': 2, 'keyof': 5,
+        'implements': 1, 'extends': 1, 'private': 1, 'public': 0.5, 'enum': 0.5, 'namespace': 1,
+        'declare': 3, 'unknown': 0.5, 'never': 0.5, '=>': 1.2, '===': 1.5, '!==': 1.5, '?.': 1, ';': 0.2,
+    },
+    'Java': {
+        'public': 1.5, 'private': 1, 'protected': 1, 'static': 1.5, 'void': 2, 'class': 1,
+        'String': 2, 'System': 3, 'println': 1, 'extends': 2, 'implements': 3, 'final': 2,
+        'boolean': 2, 'package': 2, 'import': 1, 'throws': 4, 'new': 1, 'this': 1, 'null': 1,
+        'int': 1.5, 'char': 1, 'interface': 1.5, 'Override': 3, 'ArrayList': 3, 'HashMap': 3,
+        'List': 1, 'instanceof': 2, 'synchronized': 3, 'enum': 0.5, '@': 1, ';': 0.3,
+    },
+    'C': {
+        'include': 2, 'define': 2, 'printf': 3, 'malloc': 4, 'free': 2, 'sizeof': 2, 'struct': 2,
+        'typedef': 3, 'unsigned': 2, 'char': 2, 'int': 1.5, 'void': 2, 'static': 1, 'const': 0.5,
+        'NULL': 3, 'size_t': 2, 'ifdef': 1, 'ifndef': 1, 'endif': 1, 'enum': 0.5, 'extern': 1,
+        'uint8_t': 2, 'uint32_t': 2, 'uint64_t': 2, '->': 1, ';': 0.3,
+    },
+    'C++': {
+        'include': 2, 'define': 1, 'printf': 1, 'malloc': 1, 'sizeof': 1.5, 'struct': 1,
+        'typedef': 2, 'unsigned': 1.5, 'char': 1.5, 'int': 1.5, 'void': 1.5, 'static': 1,
+        'const': 0.5, 'NULL': 1.5, 'size_t': 1.5, 'std': 5, 'cout': 5, 'cin': 5, 'endl': 5,
+        'template': 4, 'typename': 4, 'namespace': 2, 'nullptr': 5, 'virtual': 3, 'auto': 1,
+        'vector': 3, 'using': 1.5, 'delete': 0.5, 'constexpr': 5, 'operator': 2, 'override': 1,
+        'public': 0.5, 'private': 0.5, 'class': 1, 'bool': 1, 'this': 0.5, 'new': 0.3,
+        'noexcept': 5, 'ifdef': 1, 'ifndef': 1, 'endif': 1, 'enum': 0.5, '::': 2, '->': 1,
+        ';': 0.3,
+    },
+    'C#': {
+        'public': 1.5, 'private': 1, 'protected': 1, 'static': 1.5, 'void': 2, 'class': 1,
+        'string': 1.5, 'String': 0.5, 'System': 1, 'Console': 5, 'namespace': 3, 'using': 2,
+        'var': 1, 'new': 1, 'this': 1, 'null': 1, 'int': 1.5, 'char': 1, 'interface': 1.5,
+        'get': 1, 'set': 1, 'foreach': 3, 'override': 2, 'virtual': 1.5, 'Task': 3, 'List': 1,
+        'internal': 2, 'sealed': 2, 'readonly': 1.5, 'out': 1, 'ref': 1, 'bool': 2, 'Main': 2,
+        'partial': 3, 'async': 0.5, 'await': 0.5, 'enum': 0.5, '=>': 1.5, '?.': 1, ';': 0.3,
+    },
+    'PHP': {
+        'php': 5, '<?php': 10, 'echo': 2, 'array': 2, 'foreach': 2, 'elseif': 3, 'isset': 4,
+        'empty': 2, 'unset': 4, 'endif': 2, 'endforeach': 4, 'function': 2, 'public': 0.5,
+        'private': 0.5, 'static': 0.5, 'extends': 1, 'implements': 2, 'final': 1,
+        'namespace': 1, 'use': 1, 'require_once': 5, 'include_once': 5, 'this': 0.5, 'null': 1,
+        'new': 0.5, '$': 1.5, '->': 2, '=>': 1.5, '::': 1, '===': 2, '!==': 2, '?:': 1, ';': 0.3,
+    },
+    'Go': {
+        'func': 3, 'package': 3, 'import': 1, 'fmt': 5, 'chan': 4, 'defer': 3, 'go': 1,
+        'nil': 2, 'err': 2, 'range': 2, 'make': 1.5, 'map': 0.5, 'interface': 1, 'struct': 1.5,
+        'type': 1, 'string': 1.5, 'int': 0.5, 'var': 0.5, 'select': 0.5, 'byte': 2,
+        'int64': 2, 'uint64': 2, 'float64': 3, 'rune': 4, ':=': 4, '<-': 3,
+    },
+    'Kotlin': {
+        'fun': 5, 'val': 3, 'var': 1, 'when': 2, 'object': 1.5, 'companion': 5, 'data': 0.5,
+        'suspend': 5, 'lateinit': 5, 'it': 1, 'listOf': 4, 'mapOf': 4, 'mutableListOf': 4,
+        'Unit': 3, 'init': 1.5, 'println': 3, 'override': 1, 'package': 2, 'import': 1,
+        'private': 1, 'internal': 1.5, 'sealed': 2, 'String': 1, 'Int': 1, 'Boolean': 1,
+        'null': 1, 'List': 1, '?:': 1.5, '?.': 1, '->': 1,
+    },
+    'Swift': {
+        'func': 3, 'guard': 5, 'Foundation': 5, 'UIKit': 5, 'SwiftUI': 5, 'let': 1.5, 'var': 1,
+        'Int': 1.5, 'Double': 1.5, 'Bool': 1.5, 'String': 1.5, 'protocol': 4, 'extension': 3,
+        'inout': 4, 'weak': 2, 'mutating': 5, 'self': 0.5, 'Self': 1, 'nil': 2, 'init': 1.5,
+        'defer': 2, 'struct': 1.5, 'print': 1, 'import': 1, 'override': 1, 'private': 1,
+        'static': 0.5, 'enum': 0.5, 'case': 0.5, 'some': 0.5, '?.': 1, '->': 1,
+    },
+    'Ruby': {
+        'def': 2, 'end': 3, 'puts': 4, 'elsif': 5, 'unless': 3, 'attr_accessor': 5,
+        'attr_reader': 5, 'module': 2, 'require': 2, 'do': 1.5, 'begin': 4, 'rescue': 4,
+        'ensure': 4, 'nil': 2, 'each': 1, 'yield': 1, 'then': 1, 'self': 0.5, '=>': 1, '::': 0.5,
+        '@': 0.5, '{': -0.2,
+    },
+    'Rust': {
+        'fn': 3, 'mut': 5, 'impl': 4, 'pub': 3, 'crate': 5, 'Vec': 2, 'Option': 2, 'Some': 2,
+        'Ok': 2, 'Err': 2, 'usize': 3, 'i32': 3, 'u8': 3, 'u32': 3, 'i64': 3, 'u64': 3,
+        'f64': 3, 'str': 1, 'println!': 5, 'vec!': 5, 'format!': 5, 'panic!': 5, 'match': 2, 'trait': 4, 'loop': 2, 'mod': 2, 'use': 2, 'let': 1.5,
+        'struct': 1.5, 'enum': 0.5, 'self': 0.5, 'Self': 1, 'bool': 1, 'const': 0.5, '::': 2,
+        '->': 1, '=>': 1, ';': 0.3,
+    },
+    'HTML': {
+        'div': 2, 'span': 2, 'html': 3, 'body': 1.5, 'head': 1.5, 'href': 3, 'DOCTYPE': 5,
+        'src': 1, 'meta': 2, 'charset': 1, 'li': 1, 'ul': 1, 'td': 1, 'tr': 1, '</': 3,
+    },
+    'CSS': {
+        'px': 3, 'em': 2, 'rem': 2, 'rgba': 2, 'margin': 2, 'padding': 2, 'color': 2,
+        'display': 2, 'border': 2, 'font': 2, 'background': 2, 'important': 3, 'media': 2,
+        'flex': 1, 'auto': 0.5, 'solid': 2, 'none': 1, ';': 0.3,
+    },
+    'SQL': {
+        'SELECT': 2, 'FROM': 2, 'WHERE': 2, 'INSERT': 2, 'INTO': 2, 'VALUES': 2, 'UPDATE': 2,
+        'CREATE': 2, 'TABLE': 2, 'JOIN': 2, 'GROUP': 2, 'ORDER': 2, 'BY': 1, 'NOT': 1,
+        'NULL': 1, 'PRIMARY': 3, 'KEY': 1, 'VARCHAR': 4, 'INTEGER': 2, 'select': 1, 'where': 1,
+        'insert': 1, 'into': 1, 'values': 1, 'create': 1, 'table': 1, 'varchar': 4, ';': 0.3,
+    },
+    'Shell': {
+        'fi': 4, 'esac': 4, 'done': 2, 'then': 3, 'elif': 2, 'echo': 2, 'export': 1.5,
+        'local': 2, 'sudo': 2, 'grep': 2, 'awk': 3, 'sed': 3, 'mkdir': 2, 'chmod': 3, 'do': 1.5,
+        '$': 1,
+    },
+}
+
+# Features a line starts with, after indentation: (regex, {language: weight}).
+# They are matched as one alternation, so at most one counts per line.
+_DETECT_LINE_FEATURES = [
+    (r'def\s+\w+\s*\(.*\)[^:\n]*:[ \t]*(?:#.*)?$', {'Python': 4}),
+    (r'(?:class|if|elif|else|for|while|with|try|except|finally)\b[^;{\n]*:[ \t]*(?:#.*)?$', {'Python': 3}),
+    (r'def\s+[\w.]+[?!]?(?:\([^)\n]*\))?[ \t]*$', {'Ruby': 4}),
+    (r'#include\s*<(?:iostream|vector|string|map|memory|algorithm)>', {'C': 3, 'C++': 11}),
+    (r'#\s*(?:include|define|ifn?def|pragma)\b', {'C': 3, 'C++': 3}),
+    (r'import\s+(?:static\s+)?[\w.]+(?:\.\*)?;[ \t]*$', {'Java': 4}),
+    (r'package\s+[\w.]+;[ \t]*$', {'Java': 6}),
+    (r'package\s+\w+[ \t]*$', {'Go': 3}),
+    (r'using\s+namespace\s+\w+;', {'C++': 6}),
+    (r'using\s+[\w.]+;[ \t]*$', {'C#': 4}),
+    (r'(?:import|export)[ \t]+type\b', {'TypeScript': 8}),
+    (r'(?:import|export)\b.*\bfrom[ \t]+[\'"]', {'JavaScript': 3, 'TypeScript': 3}),
+    (r'[\w-]+[ \t]*:[ \t]*[^;{}\n]+;[ \t]*$', {'CSS': 1}),
+    (r'(?:if|while)\s+\[\[?\s', {'Shell': 5}),
+]
+
+# Features matched anywhere in the sample: (compiled regex, {language: weight})
+_DETECT_TEXT_FEATURES = [
+    (re.compile(r'\$this->|\$_(?:GET|POST|SERVER)\b'), {'PHP': 5}),
+    (re.compile(r'<!DOCTYPE\s+html|<html\b', re.I), {'HTML': 40}),
+    (re.compile(r'^[A-Za-z_]\w*=[\'"$\w]', re.M), {'Shell': 3}),
+    (re.compile(r':[ \t]*(?:string|number|boolean|any|unknown|Promise<|readonly)\b'), {'TypeScript': 3}),
+    (re.compile(r'\)[ \t]*:[ \t]*\w+(?:<[^>\n]*>)?(?:\[\])?[ \t]*(?:\{|=>)'), {'TypeScript': 3}),
+]
+
+# Shebang interpreter -> language; a shebang is decisive on its own
+_SHEBANG_RE = re.compile(r'#!\s*\S*?/(?:env\s+)?(python|node|ruby|php|bash|sh|zsh)\w*')
+_SHEBANG_LANGUAGES = {'python': 'Python', 'node': 'JavaScript', 'ruby': 'Ruby', 'php': 'PHP',
+                      'bash': 'Shell', 'sh': 'Shell', 'zsh': 'Shell'}
+
+
+def _build_detect_tables():
+    """Invert _LANGUAGE_TOKEN_WEIGHTS into token -> ((language, weight), ...) and
+    compile _DETECT_LINE_FEATURES into one regex whose group names index their weights."""
+    table = defaultdict(list)
+    for language, weights in _LANGUAGE_TOKEN_WEIGHTS.items():
+        for token, weight in weights.items():
+            table[token].append((language, weight))
+    line_re = re.compile(r'^[ \t]*(?:' + '|'.join(
+        f'(?P<f{index}>{pattern})' for index, (pattern, _) in enumerate(_DETECT_LINE_FEATURES)) + ')', re.M)
+    line_weights = {f'f{index}': weights for index, (_, weights) in enumerate(_DETECT_LINE_FEATURES)}
+    return {token: tuple(entries) for token, entries in table.items()}, line_re, line_weights
+
+
+_DETECT_TOKEN_TABLE, _DETECT_LINE_RE, _DETECT_LINE_WEIGHTS = _build_detect_tables()
+
+
+def score_languages(code: str, candidates=None) -> Dict[str, float]:
+    """Score every language (or only ``candidates``) against a sample of ``code``.
+
+    Each feature contributes ``weight * min(occurrences, cap)``; scores are
+    not normalised, only their relative size is meaningful.
+    """
+    sample = code[:DETECT_SAMPLE_CHARS]
+    scores = defaultdict(float)
+    for token, count in Counter(_DETECT_TOKEN_RE.findall(sample)).items():
+        entries = _DETECT_TOKEN_TABLE.get(token)
+        if entries:
+            count = min(count, _DETECT_COUNT_CAP)
+            for language, weight in entries:
+                scores[language] += weight * count
+    line_counts = Counter(match.lastgroup for match in _DETECT_LINE_RE.finditer(sample))
+    features = [(_DETECT_LINE_WEIGHTS[name], count) for name, count in line_counts.items()]
+    features += [(weights, len(pattern.findall(sample))) for pattern, weights in _DETECT_TEXT_FEATURES]
+    for weights, count in features:
+        count = min(count, _DETECT_COUNT_CAP)
+        for language, weight in weights.items():
+            scores[language] += weight * count
+    if candidates is not None:
+        return {language: scores[language] for language in candidates}
+    return dict(scores)
+
+
+def detect_code_language(code: str, filename: Optional[str] = None):
+    """Detect the language of ``code``, returning ``(language, confidence)``.
+
+    An unambiguous filename extension wins outright (confidence 1.0); an
+    ambiguous one such as ``.h`` narrows scoring to its candidates. A shebang
+    line is likewise decisive. Otherwise the token-frequency scores decide,
+    and confidence grows with both the winner's lead over the runner-up and
+    the amount of evidence. Returns ``('unknown', 0.0)`` when nothing scores.
+    """
+    candidates = None
+    if filename:
+        mapped = LANGUAGE_EXTENSIONS.get(Path(filename).suffix.lower())
+        if isinstance(mapped, str):
+            return mapped, 1.0
+        candidates = mapped
+
+    if code.startswith('#!'):
+        shebang = _SHEBANG_RE.match(code)
+        if shebang and (candidates is None or _SHEBANG_LANGUAGES[shebang.group(1)] in candidates):
+            return _SHEBANG_LANGUAGES[shebang.group(1)], 1.0
+
+    scores = score_languages(code, candidates)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] <= 0:
+        return (candidates[0], 0.0) if candidates else ('unknown', 0.0)
+    best, top = ranked[0]
+    runner_up = max(ranked[1][1], 0.0) if len(ranked) > 1 else 0.0
+    confidence = (top - runner_up) / top * min(1.0, top / _DETECT_CONFIDENT_SCORE)
+    return best, round(confidence, 3)
 
 def shorten_code(code, compression_percent=50, language=None):
     """Shorten code based on language and compression percentage"""
     if language is None:
-        language = detect_language_simple(code)
-    
-    if language == 'Python':
-        return minify_python(code)
-    
-    # For non-Python code, use the existing regex-based approach
-    compression_ratio = compression_percent / 100.0
-    
-    if compression_ratio > 0:
-        code = re.sub(r'//.*', '', code)
-    
-    if compression_ratio > 0.3:
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    
-    if compression_ratio > 0.5:
-        code = re.sub(r'\n\s*\n', '\n', code)
-        code = re.sub(r'^\s+', '', code, flags=re.MULTILINE)
-    
-    if compression_ratio > 0.7:
-        code = re.sub(r'\s+', ' ', code)
-    
-    return code.strip()
+        language, _ = detect_code_language(code)
+
+    return minify_cache.get_or_minify(minify_cache.make_key(code, language, compression_percent),
+                                      lambda: shorten_uncached(code, compression_percent, language))
+
+# ===================== Python Source Context =====================
+
+# Parsed sources kept for reuse; consumers that see the same code share one parse.
+# Larger sources are still parsed once per python_source() caller, just not retained.
+PY_SOURCE_CACHE_SIZE = int(os.getenv('PY_SOURCE_CACHE_SIZE', '32'))
+PY_SOURCE_CACHE_MAX_CHARS = int(os.getenv('PY_SOURCE_CACHE_MAX_CHARS', str(128 * 1024)))
+# Total characters of retained sources; their trees and node lists take many times this
+PY_SOURCE_CACHE_TOTAL_CHARS = int(os.getenv('PY_SOURCE_CACHE_TOTAL_CHARS', str(512 * 1024)))
+
+_PY_LINE_RE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z')
+
+
+class PythonSource:
+    """One Python source string with its derived views, each computed on first use.
+
+    ``tree`` is parsed once and shared by every consumer, so it must be treated
+    as read-only; ``tree`` and everything derived from it raise the parse error
+    for code that does not parse. Obtain instances through ``python_source`` so
+    repeated analysis of the same code reuses them.
+    """
+
+    def __init__(self, code: str):
+        self.code = code
+
+    @cached_property
+    def _parsed(self):
+        try:
+            return ast.parse(self.code), None
+        except (SyntaxError, ValueError) as e:
+            return None, e
+
+    @property
+    def tree(self) -> ast.Module:
+        tree, error = self._parsed
+        if error is not None:
+            # Invalid code is parsed once too; every consumer gets the same error
+            raise error
+        return tree
+
+    @cached_property
+    def _raw_lines(self) -> List[str]:
+        # Split where the parser counts lines, so indexes agree with node.lineno
+        return _PY_LINE_RE.findall(self.code)
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return [line.rstrip('\r\n') for line in self._raw_lines]
+
+    @cached_property
+    def line_offsets(self) -> List[int]:
+        """Character offset at which each line starts, indexed by ``lineno - 1``."""
+        return [0, *itertools.accumulate(len(line) for line in self._raw_lines)]
+
+    @cached_property
+    def nodes(self) -> List[ast.AST]:
+        """Every node of ``tree`` in ``ast.walk`` order."""
+        return list(ast.walk(self.tree))
+
+    @cached_property
+    def functions(self) -> List[ast.AST]:
+        """Function and async function definitions, outermost first."""
+        return [node for node in self.nodes if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+    @cached_property
+    def metrics(self) -> Dict[str, Any]:
+        """See compute_python_metrics."""
+        return compute_python_metrics(self)
+
+    def segment(self, node: ast.AST) -> str:
+        """Source text of ``node``, like ``ast.get_source_segment`` without re-splitting the code."""
+        start = self.line_offsets[node.lineno - 1] + len(
+            self.lines[node.lineno - 1].encode('utf-8')[:node.col_offset].decode('utf-8', 'replace'))
+        end = self.line_offsets[node.end_lineno - 1] + len(
+            self.lines[node.end_lineno - 1].encode('utf-8')[:node.end_col_offset].decode('utf-8', 'replace'))
+        return self.code[start:end]
+
+
+_py_sources = OrderedDict()
+_py_sources_chars = 0
+_py_sources_lock = threading.Lock()
+
+
+def _cached_python_source(code: str) -> PythonSource:
+    """LRU of PythonSource objects, bounded by entry count and total source length"""
+    global _py_sources_chars
+    with _py_sources_lock:
+        source = _py_sources.get(code)
+        if source is not None:
+            _py_sources.move_to_end(code)
+            return source
+        source = _py_sources[code] = PythonSource(code)
+        _py_sources_chars += len(code)
+        while len(_py_sources) > PY_SOURCE_CACHE_SIZE or _py_sources_chars > PY_SOURCE_CACHE_TOTAL_CHARS:
+            old_code, _ = _py_sources.popitem(last=False)
+            _py_sources_chars -= len(old_code)
+        return source
+
+
+def python_source(code: str) -> PythonSource:
+    """PythonSource for ``code``, shared with earlier callers unless the code is too large to retain."""
+    if len(code) > min(PY_SOURCE_CACHE_MAX_CHARS, PY_SOURCE_CACHE_TOTAL_CHARS):
+        return PythonSource(code)
+    return _cached_python_source(code)
+
+
+# ===================== Code Metrics =====================
+
+# Metrics kept per content hash; entries are small, so this is a count rather than a byte budget
+METRICS_CACHE_SIZE = int(os.getenv('METRICS_CACHE_SIZE', '4096'))
+
+_CC_LOOP_NODES = (ast.For, ast.AsyncFor, ast.While)
+_CC_RANKS = ((5, 'A'), (10, 'B'), (20, 'C'), (30, 'D'), (40, 'E'))
+_HALSTEAD_OPERAND_FIELDS = {ast.Name: 'id', ast.Attribute: 'attr', ast.Constant: 'value'}
+# A '#' reached after skipping code and one-line string literals starts an inline comment
+_PY_INLINE_COMMENT_RE = re.compile(r'''(?:[^#'"]|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")*#''')
+
+_metrics_cache = OrderedDict()
+_metrics_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _ast_child_fields(node_type) -> tuple:
+    """Fields of ``node_type`` that can hold child nodes, minus the context and operator
+    singletons, which carry no metrics and would otherwise be most of the walk."""
+    return tuple(name for name in node_type._fields if name not in ('ctx', 'op', 'ops'))
+
+
+def cc_rank(complexity: int) -> str:
+    """Letter grade for a cyclomatic complexity, A (1-5) to F (over 40)."""
+    for limit, rank in _CC_RANKS:
+        if complexity <= limit:
+            return rank
+    return 'F'
+
+
+def mi_rank(maintainability: float) -> str:
+    """Letter grade for a maintainability index: A above 19, B above 9, else C."""
+    return 'A' if maintainability > 19 else 'B' if maintainability > 9 else 'C'
+
+
+def _halstead(operators: Counter, operands: Counter) -> Dict[str, float]:
+    distinct_operators, distinct_operands = len(operators), len(operands)
+    total_operators, total_operands = sum(operators.values()), sum(operands.values())
+    vocabulary = distinct_operators + distinct_operands
+    length = total_operators + total_operands
+    volume = length * math.log2(vocabulary) if vocabulary else 0.0
+    difficulty = distinct_operators * total_operands / (2 * distinct_operands) if distinct_operands else 0.0
+    return {
+        'vocabulary': vocabulary,
+        'length': length,
+        'volume': round(volume, 2),
+        'difficulty': round(difficulty, 2),
+        'effort': round(difficulty * volume, 2)
+    }
+
+
+def _maintainability_index(volume: float, complexity: int, lloc: int, comment_percent: float) -> float:
+    """Maintainability index on a 0-100 scale (the normalised SEI formula Radon uses)."""
+    if volume <= 0 or lloc <= 0:
+        return 100.0
+    raw = (171 - 5.2 * math.log(volume) - 0.23 * complexity - 16.2 * math.log(lloc)
+           + 50 * math.sin(math.sqrt(2.46 * math.radians(comment_percent))))
+    return min(max(0.0, raw * 100 / 171), 100.0)
+
+
+def compute_python_metrics(source: PythonSource) -> Dict[str, Any]:
+    """Compute complexity, Halstead and size metrics from one pass over ``source.tree``.
+
+    Cyclomatic complexity follows Radon's rules: one per ``if``/ternary,
+    ``assert``, non-wildcard ``case`` and comprehension ``for``/``if``, one plus
+    ``else`` per loop, one per ``except`` plus ``else`` on ``try``, and one per
+    extra boolean operand. Each function is scored on its own body, excluding
+    nested functions. Halstead counts come from arithmetic, boolean, unary,
+    comparison and augmented-assignment operators and their operands.
+    Raises SyntaxError if the code does not parse.
+    """
+    tree = source.tree
+    module = {'complexity': 1}
+    functions = []
+    operators, operands = Counter(), Counter()
+    logical_lines = 0
+    docstring_lines = set()   # lines of multi-line bare string statements (docstrings)
+    string_lines = set()      # lines a string literal continues onto
+    single_comment_lines = set()
+
+    def add_operands(owner, nodes):
+        context = owner.get('name')
+        for operand in nodes:
+            field = _HALSTEAD_OPERAND_FIELDS.get(type(operand))
+            operands[context, getattr(operand, field) if field else operand] += 1
+
+    stack = [(child, module, '') for child in reversed(tree.body)]
+    while stack:
+        node, owner, prefix = stack.pop()
+        kind = type(node)
+        if isinstance(node, ast.stmt):
+            # Decorators and 'else:'/'finally:' headers are logical lines of their own
+            logical_lines += 1 + len(getattr(node, 'decorator_list', ())) + bool(getattr(node, 'finalbody', None))
+            orelse = getattr(node, 'orelse', None)
+            if orelse and not (kind is ast.If and len(orelse) == 1 and type(orelse[0]) is ast.If
+                               and source.lines[orelse[0].lineno - 1].lstrip().startswith('elif')):
+                logical_lines += 1
+        if kind is ast.FunctionDef or kind is ast.AsyncFunctionDef:
+            block = {
+                'name': prefix + node.name,
+                'start_line': node.lineno,
+                'end_line': node.end_lineno,
+                'complexity': 1,
+                'has_docstring': ast.get_docstring(node, clean=False) is not None
+            }
+            functions.append(block)
+            stack.extend((child, block, '') for child in reversed(node.body))
+            stack.extend((child, owner, prefix) for child in reversed(node.decorator_list))
+            stack.append((node.args, owner, prefix))
+            continue
+        if kind is ast.ClassDef:
+            stack.extend((child, owner, f'{prefix}{node.name}.') for child in reversed(node.body))
+            stack.extend((child, owner, prefix) for child in reversed(node.bases + node.decorator_list))
+            continue
+
+        if kind is ast.If or kind is ast.IfExp or kind is ast.Assert:
+            owner['complexity'] += 1
+        elif kind in _CC_LOOP_NODES:
+            owner['complexity'] += 1 + bool(node.orelse)
+        elif kind is ast.Try or kind is getattr(ast, 'TryStar', None):
+            owner['complexity'] += len(node.handlers) + bool(node.orelse)
+            logical_lines += len(node.handlers)
+        elif kind is ast.comprehension:
+            owner['complexity'] += 1 + len(node.ifs)
+        elif kind is ast.Match:
+            wildcard = any(isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None
+                           for case in node.cases)
+            owner['complexity'] += max(0, len(node.cases) - wildcard)
+        elif kind is ast.BoolOp:
+            owner['complexity'] += len(node.values) - 1
+            operators[type(node.op)] += 1
+            add_operands(owner, node.values)
+        elif kind is ast.BinOp:
+            operators[type(node.op)] += 1
+            add_operands(owner, (node.left, node.right))
+        elif kind is ast.UnaryOp:
+            operators[type(node.op)] += 1
+            add_operands(owner, (node.operand,))
+        elif kind is ast.Compare:
+            operators.update(type(op) for op in node.ops)
+            add_operands(owner, (node.left, *node.comparators))
+        elif kind is ast.AugAssign:
+            operators[type(node.op)] += 1
+            add_operands(owner, (node.target, node.value))
+        elif kind is ast.Expr and type(node.value) is ast.Constant and isinstance(node.value.value, str):
+            # Docstrings and other bare string statements are documentation, not source
+            if node.end_lineno > node.lineno:
+                docstring_lines.update(range(node.lineno, node.end_lineno + 1))
+            else:
+                single_comment_lines.add(node.lineno)
+            continue
+        elif kind is ast.Constant and node.end_lineno > node.lineno:
+            # Continuation lines of a multi-line string are neither blank nor comments
+            string_lines.update(range(node.lineno + 1, node.end_lineno + 1))
+        for field in reversed(_ast_child_fields(kind)):
+            value = getattr(node, field, None)
+            if type(value) is list:
+                stack.extend((child, owner, prefix) for child in reversed(value) if isinstance(child, ast.AST))
+            elif isinstance(value, ast.AST):
+                stack.append((value, owner, prefix))
+
+    # Line classes as Radon defines them: every line is exactly one of blank,
+    # multi (docstring), single comment (comment or one-line docstring) or source
+    blank = multi = single_comments = comments = 0
+    for lineno, line in enumerate(source.lines, 1):
+        stripped = line.strip()
+        if not stripped:
+            blank += 1
+        elif lineno in docstring_lines:
+            multi += 1
+        elif lineno in string_lines:
+            continue
+        elif stripped[0] == '#':
+            single_comments += 1
+            comments += 1
+        elif lineno in single_comment_lines:
+            single_comments += 1
+        elif '#' in stripped and _PY_INLINE_COMMENT_RE.match(stripped):
+            comments += 1
+    loc = len(source.lines)
+    sloc = loc - blank - multi - single_comments
+
+    total_complexity = module['complexity'] + sum(block['complexity'] - 1 for block in functions)
+    halstead = _halstead(Counter({op.__name__: n for op, n in operators.items()}), operands)
+    comment_percent = (comments + multi) / sloc * 100 if sloc > 0 else 0.0
+    maintainability = round(_maintainability_index(halstead['volume'], total_complexity, logical_lines,
+                                                   comment_percent), 2)
+    for block in functions:
+        block['rank'] = cc_rank(block['complexity'])
+    return {
+        'loc': loc,
+        'lloc': logical_lines,
+        'sloc': sloc,
+        'comments': comments,
+        'single_comments': single_comments,
+        'multi': multi,
+        'blank': blank,
+        'complexity': total_complexity,
+        'average_complexity': round(sum(b['complexity'] for b in functions) / len(functions), 2) if functions else 0.0,
+        'max_complexity': max((b['complexity'] for b in functions), default=0),
+        'functions': functions,
+        'halstead': halstead,
+        'maintainability': maintainability,
+        'maintainability_rank': mi_rank(maintainability)
+    }
+
+
+def python_metrics(code: str) -> Dict[str, Any]:
+    """Metrics for ``code``, cached by content hash; treat the result as read-only.
+
+    Raises SyntaxError if the code does not parse.
+    """
+    key = hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _metrics_cache_lock:
+        metrics = _metrics_cache.get(key)
+        if metrics is not None:
+            _metrics_cache.move_to_end(key)
+            return metrics
+    metrics = python_source(code).metrics
+    with _metrics_cache_lock:
+        _metrics_cache[key] = metrics
+        if len(_metrics_cache) > METRICS_CACHE_SIZE:
+            _metrics_cache.popitem(last=False)
+    return metrics
+
 
 def calculate_stats(original, shortened):
     """Calculate detailed statistics about the code transformation"""
@@ -279,35 +1525,15 @@ def calculate_stats(original, shortened):
     }
 
 def calculate_complexity(code):
-    """Calculate code complexity using Python's ast module"""
+    """Summarise python_metrics: total cyclomatic complexity, maintainability index and line counts"""
     try:
-        tree = ast.parse(code)
-        complexity = 0
-        
-        # Count control flow statements
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.If, ast.While, ast.For, ast.FunctionDef, 
-                               ast.Try, ast.ExceptHandler, ast.With)):
-                complexity += 1
-            elif isinstance(node, ast.BoolOp):
-                complexity += len(node.values) - 1
-            elif isinstance(node, ast.Return):
-                complexity += 1
-        
-        # Calculate maintainability index
-        loc = len(code.splitlines())
-        comment_lines = len([line for line in code.splitlines() if line.strip().startswith('#')])
-        code_lines = loc - comment_lines
-        
-        # Simple maintainability score (0-100)
-        maintainability = max(0, min(100, 100 - (complexity * 2) - (code_lines * 0.1)))
-        
+        metrics = python_metrics(code)
         return {
-            'score': complexity,
-            'maintainability': maintainability,
-            'loc': loc,
-            'code_lines': code_lines,
-            'comment_lines': comment_lines
+            'score': metrics['complexity'],
+            'maintainability': metrics['maintainability'],
+            'loc': metrics['loc'],
+            'code_lines': metrics['sloc'],
+            'comment_lines': metrics['comments']
         }
     except Exception as e:
         return {
@@ -323,12 +1549,16 @@ def estimate_runtime_diff(original, shortened):
     """Estimate runtime difference between original and shortened code"""
     try:
         # Simple benchmark by executing both versions
+        # Parse both sides up front (the trees are shared with other consumers) so only code generation is timed.
+        # Compile afresh each time: a cached code object would time as zero.
+        original_tree, shortened_tree = python_source(original).tree, python_source(shortened).tree
+
         start_orig = time.time()
-        compile(original, '<string>', 'exec')
+        compile(original_tree, '<string>', 'exec')
         orig_time = time.time() - start_orig
 
         start_short = time.time()
-        compile(shortened, '<string>', 'exec')
+        compile(shortened_tree, '<string>', 'exec')
         short_time = time.time() - start_short
 
         diff_ms = (short_time - orig_time) * 1000
@@ -342,7 +1572,7 @@ def estimate_runtime_diff(original, shortened):
 def refactor_identifiers(code: str) -> str:
     """Refactor non-descriptive variable names"""
     try:
-        tree = ast.parse(code)
+        tree = python_source(code).tree
         # Implementation of variable refactoring
         return astor.to_source(tree)
     except Exception:
@@ -351,40 +1581,83 @@ def refactor_identifiers(code: str) -> str:
 def add_type_annotations(code: str) -> str:
     """Add type annotations to functions"""
     try:
-        tree = ast.parse(code)
+        tree = python_source(code).tree
         # Implementation of type annotation addition
         return astor.to_source(tree)
     except Exception:
         return code
 
-def format_code(code: str) -> str:
-    """Format code using black"""
+def _quote_docstring(text: str, indent: str, newline: str) -> str:
+    text = text.replace('\\', '\\\\').replace('"""', '\\"\\"\\"')
+    lines = text.splitlines() or ['']
+    if len(lines) == 1:
+        return f'{indent}"""{lines[0]}"""{newline}'
+    body = ''.join(f'{indent}{line}{newline}' if line.strip() else newline for line in lines[1:])
+    return f'{indent}"""{lines[0]}{newline}{body}{indent}"""{newline}'
+
+
+def docstring_targets(code: str):
+    """(PythonSource, functions without a docstring) for ``code``; raises SyntaxError if it does not parse.
+
+    One-line functions (``def f(): return 1``) are left out, since a docstring
+    cannot be inserted above their body.
+    """
+    source = python_source(code)
+    return source, [
+        node for node in source.functions
+        if ast.get_docstring(node, clean=False) is None and node.body[0].lineno > node.lineno
+    ]
+
+
+def _first_statement_line(node: ast.AST) -> int:
+    """Line on which the body of ``node`` starts, counting decorators of a nested def or class"""
+    first = node.body[0]
+    return min([first.lineno] + [decorator.lineno for decorator in getattr(first, 'decorator_list', [])])
+
+
+def insert_docstrings(source: PythonSource, targets: List[ast.AST], docstrings: List[str]) -> str:
+    """Source text with each docstring inserted above the first statement of its target function.
+
+    The original code is returned if the result would not parse.
+    """
+    lines = list(source._raw_lines)
+    newline = next((line[len(line.rstrip('\r\n')):] for line in lines if line.endswith(('\n', '\r'))), '\n')
+    if lines and not lines[-1].endswith(('\n', '\r')):
+        lines[-1] += newline
+    # Bottom-up, so earlier insertions do not shift the line numbers still to be used
+    for node, docstring in sorted(zip(targets, docstrings), key=lambda pair: _first_statement_line(pair[0]),
+                                  reverse=True):
+        if docstring:
+            lineno = _first_statement_line(node)
+            indent = source.lines[node.body[0].lineno - 1][:node.body[0].col_offset]
+            lines.insert(lineno - 1, _quote_docstring(docstring, indent, newline))
+    documented = ''.join(lines)
     try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp:
-            temp.write(code)
-            temp_path = temp.name
+        ast.parse(documented)
+    except (SyntaxError, ValueError) as e:
+        logger.warning(f"Docstring insertion skipped, the result does not parse: {e}")
+        return source.code
+    return documented
 
-        subprocess.run(['black', temp_path], check=True)
-        
-        with open(temp_path, 'r') as temp:
-            formatted_code = temp.read()
-        
-        os.unlink(temp_path)
-        return formatted_code
-    except Exception:
-        return code
 
 def generate_docstrings_via_openai(code: str) -> str:
-    """Generate docstrings using OpenAI API"""
+    """Insert AI-written docstrings into Python functions that have none.
+
+    All such functions in the file go to the AI gateway together. Code that
+    does not parse, or an unavailable gateway, leaves the code unchanged.
+    """
+    if not ai_gateway.enabled:
+        return code
     try:
-        prompt = f"Generate Google-style docstrings for each function in the following Python code:\n\n{code}"
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response['choices'][0]['message']['content']
-    except Exception:
+        source, targets = docstring_targets(code)
+        if not targets:
+            return code
+        docstrings = ai_gateway.generate_docstrings(
+            [{'name': node.name, 'source': source.segment(node)} for node in targets])
+    except (SyntaxError, ValueError, AIGatewayError) as e:
+        logger.warning(f"Docstring generation skipped: {e}")
         return code
+    return insert_docstrings(source, targets, docstrings)
 
 def modernize_syntax(code: str) -> str:
     """Modernize Python 2 syntax to Python 3"""
@@ -403,57 +1676,660 @@ def is_code_file(filename):
     }
     return Path(filename).suffix.lower() in code_extensions
 
-def process_zip_file(zip_data):
-    """Process a zip file and return processed files information"""
-    results = []
-    
-    with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_ref:
-        # Get list of files in zip
-        file_list = zip_ref.namelist()
-        
-        # Process each file
-        for filename in file_list:
+# ===================== Code Formatting =====================
+
+# Formatted results kept in memory, keyed by content hash
+FORMAT_CACHE_SIZE = int(os.getenv('FORMAT_CACHE_SIZE', '1024'))
+# Worker processes for batch formatting (0 = one per core)
+FORMAT_WORKERS = int(os.getenv('FORMAT_WORKERS', '0')) or (os.cpu_count() or 1)
+# Below this many bytes of unformatted code a batch is formatted inline
+FORMAT_PARALLEL_MIN_BYTES = int(os.getenv('FORMAT_PARALLEL_MIN_BYTES', str(64 * 1024)))
+# Chunks per worker when mapping sources onto the pool
+FORMAT_CHUNKS_PER_WORKER = 4
+
+_format_cache = OrderedDict()
+_format_cache_lock = threading.Lock()
+_format_pool = None
+_format_pool_workers = 0
+_format_pool_lock = threading.Lock()
+# The server has request and writer threads, so pool workers must not be forked from it with their
+# locks held. Workers started this way import only minifiers.py, which has no import side effects.
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+if _POOL_CONTEXT.get_start_method() == 'forkserver':
+    # The default preload is __main__, which re-imports app.py when it is run as a script
+    _POOL_CONTEXT.set_forkserver_preload(['minifiers'])
+
+
+def _format_cache_key(code: str) -> bytes:
+    return hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def _format_cache_put(key: bytes, formatted: str):
+    with _format_cache_lock:
+        _format_cache[key] = formatted
+        _format_cache.move_to_end(key)
+        if len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
+
+
+def _format_cache_get(key: bytes) -> Optional[str]:
+    with _format_cache_lock:
+        formatted = _format_cache.get(key)
+        if formatted is not None:
+            _format_cache.move_to_end(key)
+        return formatted
+
+
+def format_code(code: str) -> str:
+    """Format Python code with black in-process; unparsable code is returned unchanged"""
+    key = _format_cache_key(code)
+    formatted = _format_cache_get(key)
+    if formatted is None:
+        formatted = format_uncached(code)
+        _format_cache_put(key, formatted)
+    return formatted
+
+
+def _get_format_pool(workers: int):
+    global _format_pool, _format_pool_workers
+    with _format_pool_lock:
+        if _format_pool is None or _format_pool_workers != workers:
+            if _format_pool is not None:
+                _format_pool.shutdown(wait=False, cancel_futures=True)
+            _format_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=_POOL_CONTEXT, initializer=warm_formatter)
+            _format_pool_workers = workers
+        return _format_pool
+
+
+def _reset_format_pool():
+    global _format_pool
+    with _format_pool_lock:
+        if _format_pool is not None:
+            _format_pool.shutdown(wait=False, cancel_futures=True)
+        _format_pool = None
+
+
+def format_batch(codes: List[str], workers: Optional[int] = None) -> List[str]:
+    """Format many sources, returning results in input order.
+
+    Cache hits and duplicate sources are resolved on the calling thread; the
+    remaining sources go to a pool of workers that already have black
+    imported, unless there is too little code for the pool to pay off.
+    """
+    workers = workers or FORMAT_WORKERS
+    results = [None] * len(codes)
+    pending = {}
+    for index, code in enumerate(codes):
+        key = _format_cache_key(code)
+        formatted = _format_cache_get(key)
+        if formatted is not None:
+            results[index] = formatted
+        else:
+            pending.setdefault(key, (code, []))[1].append(index)
+
+    if not pending:
+        return results
+    keys = list(pending)
+    sources = [pending[key][0] for key in keys]
+    if workers <= 1 or len(sources) == 1 or sum(map(len, sources)) < FORMAT_PARALLEL_MIN_BYTES:
+        formatted_sources = [format_uncached(code) for code in sources]
+    else:
+        chunksize = max(1, len(sources) // (workers * FORMAT_CHUNKS_PER_WORKER))
+        try:
+            formatted_sources = list(_get_format_pool(workers).map(format_uncached, sources, chunksize=chunksize))
+        except concurrent.futures.process.BrokenProcessPool:
+            _reset_format_pool()
+            formatted_sources = [format_uncached(code) for code in sources]
+
+    for key, formatted in zip(keys, formatted_sources):
+        _format_cache_put(key, formatted)
+        for index in pending[key][1]:
+            results[index] = formatted
+    return results
+
+
+# ===================== Upload Spooling =====================
+
+# Uploads and generated archives larger than this are spooled to a temp file on disk
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Serializes seek+read pairs on spooled files shared between concurrent downloads
+_spool_read_lock = threading.Lock()
+
+
+def new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, mode='w+b')
+
+
+def spool_upload(file_storage):
+    """Copy an uploaded file into a spooled temp file that outlives the request"""
+    spool = new_spool()
+    shutil.copyfileobj(file_storage.stream, spool, SPOOL_CHUNK_SIZE)
+    spool.seek(0)
+    return spool
+
+
+def upload_stream(file_storage):
+    """Return a seekable stream over an upload without copying it into memory.
+
+    Werkzeug already spools large multipart uploads to a temporary file, so
+    that stream is used directly when it supports seeking.
+    """
+    stream = file_storage.stream
+    try:
+        if stream.seekable():
+            stream.seek(0)
+            return stream
+    except (AttributeError, OSError, ValueError):
+        pass
+    return spool_upload(file_storage)
+
+
+def _zip_source(data):
+    """Accept raw bytes or a seekable binary file where zipfile.ZipFile is opened"""
+    return io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+
+
+def spool_size(spool) -> int:
+    with _spool_read_lock:
+        spool.seek(0, io.SEEK_END)
+        return spool.tell()
+
+
+def iter_spool(spool, chunk_size: int = SPOOL_CHUNK_SIZE):
+    """Yield a spooled file's contents in chunks; safe with concurrent readers"""
+    position = 0
+    while True:
+        with _spool_read_lock:
+            spool.seek(position)
+            chunk = spool.read(chunk_size)
+        if not chunk:
+            return
+        position += len(chunk)
+        yield chunk
+
+# ===================== Parallel Zip Processing =====================
+
+# Worker processes for CPU-bound archive minification (0 = one per core)
+ZIP_WORKERS = int(os.getenv('ZIP_WORKERS', '0')) or (os.cpu_count() or 1)
+# Per-member minification time limit in seconds (0 disables)
+ZIP_FILE_TIMEOUT = float(os.getenv('ZIP_FILE_TIMEOUT', '30'))
+# Below this many bytes of pending code the pool overhead outweighs the gain
+ZIP_PARALLEL_MIN_BYTES = int(os.getenv('ZIP_PARALLEL_MIN_BYTES', str(256 * 1024)))
+# Chunks per worker; more chunks even out stragglers at some IPC cost
+ZIP_CHUNKS_PER_WORKER = 4
+# Pending code per flush when /process-zip streams NDJSON
+ZIP_STREAM_WINDOW_BYTES = int(os.getenv('ZIP_STREAM_WINDOW_BYTES', str(4 * 1024 * 1024)))
+
+_zip_pool = None
+_zip_pool_workers = 0
+_zip_pool_lock = threading.Lock()
+
+
+def _get_zip_pool(workers: int):
+    global _zip_pool, _zip_pool_workers
+    with _zip_pool_lock:
+        if _zip_pool is None or _zip_pool_workers != workers:
+            if _zip_pool is not None:
+                _zip_pool.shutdown(wait=False, cancel_futures=True)
+            _zip_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT)
+            _zip_pool_workers = workers
+        return _zip_pool
+
+
+def _reset_zip_pool(terminate: bool = False):
+    """Drop the pool; with ``terminate``, also kill workers still busy with a chunk."""
+    global _zip_pool
+    with _zip_pool_lock:
+        if _zip_pool is not None:
+            processes = list((getattr(_zip_pool, '_processes', None) or {}).values())
+            _zip_pool.shutdown(wait=False, cancel_futures=True)
+            if terminate:
+                for process in processes:
+                    process.terminate()
+        _zip_pool = None
+
+
+def _balanced_chunks(sizes: List[int], n_chunks: int) -> List[List[int]]:
+    """Split item indexes into n_chunks groups of similar total size (largest-first greedy)"""
+    n_chunks = max(1, min(n_chunks, len(sizes)))
+    heap = [(0, i) for i in range(n_chunks)]
+    chunks = [[] for _ in range(n_chunks)]
+    for index in sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True):
+        load, chunk = heapq.heappop(heap)
+        chunks[chunk].append(index)
+        heapq.heappush(heap, (load + sizes[index], chunk))
+    return [sorted(chunk) for chunk in chunks if chunk]
+
+
+def shorten_batch(items, workers: Optional[int] = None, timeout: Optional[float] = None) -> List[tuple]:
+    """Shorten (index, code, language) items across a process pool.
+
+    Items are grouped into size-balanced chunks so each worker gets a similar
+    amount of code. Returns (index, shortened, error) tuples in input order.
+    """
+    workers = workers or ZIP_WORKERS
+    timeout = ZIP_FILE_TIMEOUT if timeout is None else timeout
+    if not items:
+        return []
+
+    sizes = [len(code) for _, code, _ in items]
+    if workers <= 1 or len(items) == 1 or sum(sizes) < ZIP_PARALLEL_MIN_BYTES:
+        return shorten_chunk(items, timeout)
+
+    chunks = _balanced_chunks(sizes, workers * ZIP_CHUNKS_PER_WORKER)
+    pool = _get_zip_pool(workers)
+    futures = [(pool.submit(shorten_chunk, [items[i] for i in chunk], timeout), chunk) for chunk in chunks]
+
+    # Backstop for workers that cannot enforce the per-file limit themselves. A running chunk
+    # cannot be cancelled, so a pool with an overdue chunk is replaced and its workers killed.
+    deadline = time.monotonic() + (timeout * len(items) / workers + 10 if timeout > 0 else float('inf'))
+    by_index = {}
+    overdue = False
+    for future, chunk in futures:
+        try:
+            remaining = max(0.0, deadline - time.monotonic()) if timeout > 0 else None
+            for index, shortened, error in future.result(timeout=remaining):
+                by_index[index] = (index, shortened, error)
+        except concurrent.futures.TimeoutError:
+            overdue = True
+            for i in chunk:
+                by_index[items[i][0]] = (items[i][0], None, f'Timed out after {timeout:g}s')
+        except Exception as e:
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                _reset_zip_pool()
+            for i in chunk:
+                by_index[items[i][0]] = (items[i][0], None, str(e))
+    if overdue:
+        _reset_zip_pool(terminate=True)
+    return [by_index[index] for index, _, _ in items]
+
+
+def iter_zip_results(zip_data, workers: Optional[int] = None, file_timeout: Optional[float] = None,
+                     window_bytes: Optional[int] = None):
+    """Yield processed file records for a zip archive in archive order.
+
+    Members are read and decoded on the calling thread; cache misses are
+    minified by shorten_batch. When ``window_bytes`` is set, records are
+    flushed every time that much code is pending, so memory stays bounded
+    and the first records are available before the archive is finished.
+    """
+    window = []
+    pending = []
+    pending_bytes = 0
+
+    def flush():
+        for index, shortened, error in shorten_batch(pending, workers, file_timeout):
+            record = window[index]
+            cache_key = record.pop('_cache_key')
+            if error is not None:
+                window[index] = {'filename': record['filename'], 'error': error}
+                continue
+            minify_cache.put(cache_key, shortened)
+            window[index] = _zip_result(record, shortened)
+        yield from window
+        window.clear()
+        pending.clear()
+
+    with zipfile.ZipFile(_zip_source(zip_data)) as zip_ref:
+        for filename in zip_ref.namelist():
             if not is_code_file(filename):
                 continue
-                
+
             try:
-                # Read file content
                 with zip_ref.open(filename) as file:
                     content = file.read().decode('utf-8')
-                
-                # Detect language
-                language = detect_language_simple(content)
-                
-                # Shorten code
-                shortened = shorten_code(content, language=language)
-                
-                # Calculate stats
-                stats = calculate_stats(content, shortened)
-                
-                # Add to results
-                results.append({
-                    'filename': filename,
-                    'language': language,
-                    'original': content,
-                    'shortened': shortened,
-                    'stats': stats
-                })
-                
+                language, _ = detect_code_language(content, filename)
+                record = {'filename': filename, 'language': language, 'original': content}
+                cache_key = minify_cache.make_key(content, language, 50)
+                shortened = minify_cache.get(cache_key)
             except Exception as e:
-                results.append({
-                    'filename': filename,
-                    'error': str(e)
-                })
-    
-    return results
+                record, shortened = {'filename': filename, 'error': str(e)}, None
+
+            if shortened is not None or 'error' in record:
+                # Already complete; emit straight away unless earlier members are still pending
+                window.append(record if shortened is None else _zip_result(record, shortened))
+                if not pending:
+                    yield from window
+                    window.clear()
+                continue
+
+            record['_cache_key'] = cache_key
+            pending.append((len(window), content, language))
+            window.append(record)
+            pending_bytes += len(content)
+            if window_bytes is not None and pending_bytes >= window_bytes:
+                yield from flush()
+                pending_bytes = 0
+
+    yield from flush()
+
+
+def process_zip_file(zip_data, workers: Optional[int] = None, file_timeout: Optional[float] = None):
+    """Process a zip file and return processed files information"""
+    return list(iter_zip_results(zip_data, workers, file_timeout))
+
+
+def _zip_result(record: dict, shortened: str) -> dict:
+    try:
+        stats = calculate_stats(record['original'], shortened)
+    except Exception as e:
+        return {'filename': record['filename'], 'error': str(e)}
+    record['shortened'] = shortened
+    record['stats'] = stats
+    return record
 
 # ===================== Sensitive Data Masking =====================
 
 # Thread pool for async processing
 executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
 
-# In-memory job store; only masked outputs are stored
-masking_jobs = {}
+# ===================== Masking Job Store =====================
+
+# Finished jobs and their archives are dropped this many seconds after creation
+MASK_JOB_TTL = float(os.getenv('MASK_JOB_TTL', '3600'))
+# Total size of stored result archives before the oldest finished jobs are evicted
+MASK_JOB_MAX_BYTES = int(os.getenv('MASK_JOB_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+
+class _BaseJobStore:
+    """Shared eviction policy for masking job stores.
+
+    Jobs are plain dicts of JSON-serializable fields. Stores only keep masked
+    outputs and reports, never the original upload.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _select_evictions(self, rows, now: float) -> List[str]:
+        """Pick job ids to drop from (job_id, created_ts, result_size, status) rows"""
+        evict = [job_id for job_id, created_ts, _, _ in rows if now - created_ts > self.ttl]
+        expired = set(evict)
+        kept = [row for row in rows if row[0] not in expired]
+        total = sum(size for _, _, size, _ in kept)
+        for job_id, _, size, status in sorted(kept, key=lambda row: row[1]):
+            if total <= self.max_bytes:
+                break
+            if status in ('done', 'error') and size:
+                evict.append(job_id)
+                total -= size
+        return evict
+
+
+class LocalJobStore(_BaseJobStore):
+    """In-process job store; results stay in spooled temp files. Intended for tests."""
+
+    def __init__(self, ttl: float = MASK_JOB_TTL, max_bytes: int = MASK_JOB_MAX_BYTES):
+        super().__init__(ttl, max_bytes)
+        self._jobs = {}
+        self._results = {}
+        # Open downloads per result spool, and evicted spools that are closed when their last download ends
+        self._readers = {}
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id] = {'created_ts': time.time(), 'result_size': 0, **fields}
+            self._prune()
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def save_result(self, job_id: str, spool) -> None:
+        size = spool_size(spool)
+        with self._lock:
+            if job_id not in self._jobs:
+                spool.close()
+                return
+            self._results[job_id] = spool
+            self._jobs[job_id]['result_size'] = size
+            self._prune()
+
+    def iter_result(self, job_id: str):
+        """Return (chunk iterator, size) for a stored archive, or None
+
+        The spool stays open until the iterator is exhausted or closed, even
+        if the job is evicted meanwhile.
+        """
+        with self._lock:
+            spool = self._results.get(job_id)
+            if spool is None:
+                return None
+            self._readers[spool] = self._readers.get(spool, 0) + 1
+        return _ResultReader(iter_spool(spool), partial(self._release, spool)), spool_size(spool)
+
+    def _release(self, spool) -> None:
+        with self._lock:
+            self._readers[spool] -= 1
+            if self._readers[spool]:
+                return
+            del self._readers[spool]
+            if spool in self._retired:
+                self._retired.discard(spool)
+                spool.close()
+
+    def _prune(self) -> None:
+        rows = [(job_id, job['created_ts'], job['result_size'], job.get('status'))
+                for job_id, job in self._jobs.items()]
+        for job_id in self._select_evictions(rows, time.time()):
+            self._jobs.pop(job_id, None)
+            spool = self._results.pop(job_id, None)
+            if spool is None:
+                continue
+            if spool in self._readers:
+                self._retired.add(spool)
+            else:
+                spool.close()
+
+
+class _ResultReader:
+    """Chunk iterator for a download that calls ``release`` once, when exhausted or closed"""
+
+    def __init__(self, chunks, release: Callable[[], None]):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        # WSGI servers call close() on the response iterable, also for aborted downloads
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name != 'posix':
+        return True  # no safe liveness probe; os.kill would terminate the process
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SQLiteJobStore(_BaseJobStore):
+    """Job store shared by every worker process on a host.
+
+    Job fields live in an SQLite table and result archives are files in the
+    same directory, so status and download work from any gunicorn worker and
+    survive restarts. ``status`` has its own column, next to the id of the
+    process running the job, so eviction is decided in SQL. Jobs run on the
+    executor of the process that accepted them; unfinished jobs whose process
+    is gone are marked as errors when a store is opened.
+    """
+
+    def __init__(self, directory: str, ttl: float = MASK_JOB_TTL, max_bytes: int = MASK_JOB_MAX_BYTES):
+        super().__init__(ttl, max_bytes)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._db_path = os.path.join(directory, 'jobs.db')
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS masking_jobs ('
+                'job_id TEXT PRIMARY KEY, created_ts REAL NOT NULL, '
+                'result_size INTEGER NOT NULL DEFAULT 0, status TEXT, owner_pid INTEGER, data TEXT NOT NULL)'
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(masking_jobs)')}
+            if 'status' not in columns:
+                conn.execute('ALTER TABLE masking_jobs ADD COLUMN status TEXT')
+                conn.execute('ALTER TABLE masking_jobs ADD COLUMN owner_pid INTEGER')
+                conn.execute("UPDATE masking_jobs SET status = json_extract(data, '$.status')")
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_masking_jobs_created ON masking_jobs (created_ts)')
+        self._fail_orphaned_jobs()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.zip")
+
+    def create(self, job_id: str, **fields) -> None:
+        conn = self._connect()
+        status = fields.pop('status', None)
+        conn.execute(
+            'INSERT INTO masking_jobs (job_id, created_ts, status, owner_pid, data) VALUES (?, ?, ?, ?, ?)',
+            (job_id, time.time(), status, os.getpid(), json.dumps(fields))
+        )
+        self._prune()
+
+    def update(self, job_id: str, **fields) -> None:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT status, data FROM masking_jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is not None:
+                status = fields.pop('status', row[0])
+                data = json.loads(row[1])
+                data.update(fields)
+                conn.execute('UPDATE masking_jobs SET status = ?, data = ? WHERE job_id = ?',
+                             (status, json.dumps(data), job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT created_ts, result_size, status, data FROM masking_jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'created_ts': row[0], 'result_size': row[1], **json.loads(row[3]), 'status': row[2]}
+
+    def save_result(self, job_id: str, spool) -> None:
+        path = self._result_path(job_id)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.part', delete=False) as out:
+            for chunk in iter_spool(spool):
+                out.write(chunk)
+            size = out.tell()
+        spool.close()
+        os.replace(out.name, path)
+        cursor = self._connect().execute(
+            'UPDATE masking_jobs SET result_size = ? WHERE job_id = ?', (size, job_id)
+        )
+        if cursor.rowcount == 0:
+            os.unlink(path)
+        self._prune()
+
+    def iter_result(self, job_id: str):
+        """Return (chunk iterator, size) for a stored archive, or None"""
+        path = self._result_path(job_id)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        def chunks():
+            with handle:
+                while True:
+                    chunk = handle.read(SPOOL_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks(), os.fstat(handle.fileno()).st_size
+
+    def _fail_orphaned_jobs(self) -> None:
+        """Mark queued or processing jobs whose process has exited as errors; nothing would finish them"""
+        rows = self._connect().execute(
+            "SELECT job_id, owner_pid FROM masking_jobs WHERE status IN ('queued', 'processing')"
+        ).fetchall()
+        for job_id, owner_pid in rows:
+            if owner_pid is None or owner_pid == os.getpid() or not _process_alive(owner_pid):
+                self.update(job_id, status='error', error='interrupted', updated_ts=time.time())
+
+    def _prune(self) -> None:
+        """Same policy as _select_evictions, reading only the rows it drops"""
+        conn = self._connect()
+        evict = [job_id for (job_id,) in conn.execute(
+            'SELECT job_id FROM masking_jobs WHERE created_ts < ?', (time.time() - self.ttl,)
+        )]
+        for job_id in evict:
+            conn.execute('DELETE FROM masking_jobs WHERE job_id = ?', (job_id,))
+        (total,) = conn.execute('SELECT COALESCE(SUM(result_size), 0) FROM masking_jobs').fetchone()
+        evict_for_size = []
+        if total > self.max_bytes:
+            for job_id, size in conn.execute(
+                "SELECT job_id, result_size FROM masking_jobs WHERE status IN ('done', 'error') "
+                "AND result_size > 0 ORDER BY created_ts"
+            ):
+                evict_for_size.append(job_id)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        for job_id in evict_for_size:
+            conn.execute('DELETE FROM masking_jobs WHERE job_id = ?', (job_id,))
+        for job_id in evict + evict_for_size:
+            try:
+                os.unlink(self._result_path(job_id))
+            except FileNotFoundError:
+                pass
+
+
+def create_job_store():
+    """Build the masking job store selected by MASK_JOB_STORE ('sqlite' or 'local')"""
+    if os.getenv('MASK_JOB_STORE', 'sqlite').lower() == 'local':
+        return LocalJobStore()
+    directory = os.getenv('MASK_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'code-shortener-mask-jobs')
+    try:
+        return SQLiteJobStore(directory)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Masking job store at {directory} unavailable, using in-process store: {e}")
+        return LocalJobStore()
+
+
+masking_jobs = create_job_store()
 
 def _mask_keep_last(value: str, keep: int = 4) -> str:
     if not value:
@@ -469,56 +2345,142 @@ def _mask_keep_prefix_and_last(value: str, prefix_len: int = 0, keep_last: int =
     remainder = value[prefix_len:]
     return f"{prefix}{_mask_keep_last(remainder, keep_last)}"
 
-def get_masking_patterns():
-    # Compiled regex patterns with masking strategies
-    patterns = [
+def _build_masking_rules():
+    """Compile the masking rules once at import.
+
+    Every match of a rule's regex contains one of its casefolded ``literals``
+    and starts at most ``anchor`` characters before it, or, for ``'line'``,
+    at the start of a line reached by walking back over identifier
+    characters and whitespace. mask_sensitive_content uses this to run each
+    regex only where a match can begin instead of scanning the whole text.
+    """
+    return [
         {
             'name': 'OpenAI API Key',
             'regex': re.compile(r"\b(sk-[A-Za-z0-9]{20,})\b"),
+            'literals': ('sk-',),
+            'anchor': 0,
             'mask': lambda m: _mask_keep_prefix_and_last(m.group(1), prefix_len=3, keep_last=4)
         },
         {
             'name': 'AWS Access Key ID',
             'regex': re.compile(r"\b((?:AKIA|ASIA|ANPA)[A-Z0-9]{16})\b"),
+            'literals': ('akia', 'asia', 'anpa'),
+            'anchor': 0,
             'mask': lambda m: _mask_keep_last(m.group(1), keep=4)
         },
         {
             'name': 'AWS Secret Access Key',
             'regex': re.compile(r"(?i)(aws_?secret_?access_?key\s*[:=]\s*[\"\']?)([A-Za-z0-9/+=]{40})([\"\']?)"),
+            'literals': ('secret',),
+            'anchor': 4,
             'mask': lambda m: f"{m.group(1)}{'*' * 8}{m.group(3)}"
         },
         {
             'name': 'Private Key Block',
             'regex': re.compile(r"(-----BEGIN [A-Z ]*PRIVATE KEY-----)([\s\S]*?)(-----END [A-Z ]*PRIVATE KEY-----)", re.MULTILINE),
+            'literals': ('-----begin ',),
+            'anchor': 0,
             'mask': lambda m: f"{m.group(1)}\n***MASKED PRIVATE KEY***\n{m.group(3)}"
         },
         {
             'name': 'Bearer JWT Token',
             'regex': re.compile(r"(?i)(Bearer\s+)([A-Za-z0-9-_]+\.[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+)"),
+            'literals': ('bearer',),
+            'anchor': 0,
             'mask': lambda m: f"{m.group(1)}***.***.***"
         },
         {
             'name': 'Password Assignment',
             'regex': re.compile(r"(?i)(?:\b(password|pwd|pass|db_pass|db_password)\b\s*[:=]\s*)([\"\']?)([^\n\"\']+)(\2)"),
-            'mask': lambda m: re.sub(re.escape(m.group(3)), '********', m.group(0))
+            'literals': ('pass', 'pwd'),
+            'anchor': 3,
+            'mask': lambda m: m.group(0).replace(m.group(3), '********')
         },
         {
             'name': 'Generic Token/Secret Assignment',
             'regex': re.compile(r"(?i)(?:\b(token|secret|api[_-]?key|access[_-]?token)\b\s*[:=]\s*)([\"\']?)([A-Za-z0-9._-]{8,})(\2)"),
-            'mask': lambda m: re.sub(re.escape(m.group(3)), _mask_keep_last(m.group(3), 4), m.group(0))
+            'literals': ('token', 'secret', 'key'),
+            'anchor': 7,
+            'mask': lambda m: m.group(0).replace(m.group(3), _mask_keep_last(m.group(3), 4))
         },
         {
             'name': 'URL Credential Parameter',
             'regex': re.compile(r"(?i)([?&](?:api[_-]?key|access[_-]?token|token|key)=)([^&\s]+)"),
+            'literals': ('key=', 'token='),
+            'anchor': 8,
             'mask': lambda m: f"{m.group(1)}{'*' * 8}"
         },
         {
             'name': '.env Sensitive Variable',
             'regex': re.compile(r"(?im)^(\s*[A-Z0-9_]*(?:SECRET|TOKEN|PASSWORD|PASS|API_KEY|AWS_ACCESS_KEY_ID|AWS_SECRET_ACCESS_KEY|OPENAI_API_KEY)[A-Z0-9_]*\s*=\s*)(.+)$"),
+            'literals': ('secret', 'token', 'pass', '_key'),
+            'anchor': 'line',
             'mask': lambda m: f"{m.group(1)}********"
         },
     ]
-    return patterns
+
+MASKING_RULES = _build_masking_rules()
+
+def get_masking_patterns():
+    # Compiled regex patterns with masking strategies
+    return MASKING_RULES
+
+def _literal_positions(folded: str, literals) -> List[int]:
+    positions = set()
+    for literal in literals:
+        index = folded.find(literal)
+        while index != -1:
+            positions.add(index)
+            index = folded.find(literal, index + 1)
+    return sorted(positions)
+
+def _line_starts_before(text: str, position: int) -> List[int]:
+    """Line starts a '^\\s*[A-Z0-9_]*' prefix could begin at and still reach position"""
+    start = position
+    while start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+        start -= 1
+    while start > 0 and text[start - 1].isspace():
+        start -= 1
+    starts = [] if start and text[start - 1] != '\n' else [start]
+    index = text.find('\n', start, position)
+    while index != -1:
+        starts.append(index + 1)
+        index = text.find('\n', index + 1, position)
+    return starts
+
+def _candidate_starts(rule: dict, text: str, folded: str):
+    """Yield, in ascending order, every position where a match of rule could start"""
+    anchor = rule['anchor']
+    last = -1
+    for position in _literal_positions(folded, rule['literals']):
+        if anchor == 'line':
+            starts = _line_starts_before(text, position)
+        else:
+            starts = range(max(last + 1, position - anchor), position + 1)
+        for start in starts:
+            if start > last:
+                last = start
+                yield start
+
+def _apply_masking_rule(rule: dict, text: str, folded: str):
+    """Equivalent to rule['regex'].subn(rule['mask'], text), trying only candidate starts"""
+    regex, mask = rule['regex'], rule['mask']
+    pieces = []
+    end = 0
+    for start in _candidate_starts(rule, text, folded):
+        if start < end:
+            continue
+        match = regex.match(text, start)
+        if match is None:
+            continue
+        pieces.append(text[end:match.start()])
+        pieces.append(mask(match))
+        end = match.end()
+    if not pieces:
+        return text, 0
+    pieces.append(text[end:])
+    return ''.join(pieces), (len(pieces) - 1) // 2
 
 def mask_sensitive_content(filename: str, text: str) -> dict:
     # Only process if supported extension
@@ -533,13 +2495,24 @@ def mask_sensitive_content(filename: str, text: str) -> dict:
 
     masked_text = text
     detections_map = {}
-
-    for rule in get_masking_patterns():
-        def _replace(match):
-            masked_segment = rule['mask'](match)
-            detections_map[rule['name']] = detections_map.get(rule['name'], 0) + 1
-            return masked_segment
-        masked_text, num = rule['regex'].subn(_replace, masked_text)
+    # Candidate positions are only exact when case folding keeps offsets, i.e.
+    # for ASCII text; otherwise literals just decide which regexes run at all.
+    # Masking only removes characters or inserts '*', so a literal absent from
+    # the original text cannot appear after earlier rules have run.
+    positional = text.isascii()
+    folded = text.lower() if positional else text.casefold()
+
+    for rule in MASKING_RULES:
+        if not any(literal in folded for literal in rule['literals']):
+            continue
+        if positional:
+            masked_text, num = _apply_masking_rule(rule, masked_text, folded)
+        else:
+            masked_text, num = rule['regex'].subn(rule['mask'], masked_text)
+        if num:
+            detections_map[rule['name']] = num
+            if positional:
+                folded = masked_text.lower()
 
     detections = [{'type': k, 'count': v} for k, v in detections_map.items()]
     return {
@@ -549,22 +2522,93 @@ def mask_sensitive_content(filename: str, text: str) -> dict:
         'masked': len(detections) > 0
     }
 
-def process_zip_for_masking(zip_bytes: bytes) -> dict:
-    in_mem = io.BytesIO(zip_bytes)
-    report = {'files': [], 'summary': {'total_files': 0, 'files_masked': 0, 'detections_by_type': {}}}
-    out_zip_mem = io.BytesIO()
+MASKING_REPORT_NAME = 'masking_report.json'
+# Local file header layout details used by _copy_zip_member_raw
+_ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+_ZIP64_EXTRA_ID = 0x0001
+_ZIP_FH_FILENAME_LENGTH = 10
+_ZIP_FH_EXTRA_FIELD_LENGTH = 11
 
-    with zipfile.ZipFile(in_mem, 'r') as zin, zipfile.ZipFile(out_zip_mem, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
-        for info in zin.infolist():
-            if info.is_dir():
-                continue
+def _copy_zip_member_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """Append a member's compressed stream to zout without inflating and re-deflating it.
+
+    zipfile has no public API for this, so the member is written through the
+    same ZipFile internals that ZipFile.open(mode='w') uses. Callers fall back
+    to zin.read()/zout.writestr() if this raises.
+    """
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    for attr in ('compress_type', 'comment', 'create_system', 'create_version', 'extract_version',
+                 'volume', 'internal_attr', 'external_attr', 'CRC', 'compress_size', 'file_size'):
+        setattr(zinfo, attr, getattr(info, attr))
+    # Sizes go in the local header, so no trailing data descriptor is written
+    zinfo.flag_bits = info.flag_bits & ~_ZIP_FLAG_DATA_DESCRIPTOR
+    strip_extra = getattr(zipfile, '_strip_extra', None)
+    zinfo.extra = strip_extra(info.extra, (_ZIP64_EXTRA_ID,)) if strip_extra else b''
+
+    with zin._lock:
+        zin.fp.seek(info.header_offset)
+        header = zin.fp.read(zipfile.sizeFileHeader)
+        if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for {info.filename!r}")
+        fields = struct.unpack(zipfile.structFileHeader, header)
+        zin.fp.seek(fields[_ZIP_FH_FILENAME_LENGTH] + fields[_ZIP_FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+        raw_start = zin.fp.tell()
+
+        with zout._lock:
+            if zout._writing:
+                raise ValueError("Another member is being written to the archive")
+            zout._writecheck(zinfo)
+            zout._didModify = True
+            zout.fp.seek(zout.start_dir)
+            zinfo.header_offset = zout.fp.tell()
+            zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+            zout.fp.write(zinfo.FileHeader(zip64))
+            remaining = zinfo.compress_size
+            zin.fp.seek(raw_start)
+            while remaining:
+                chunk = zin.fp.read(min(remaining, SPOOL_CHUNK_SIZE))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"Truncated data for {info.filename!r}")
+                zout.fp.write(chunk)
+                remaining -= len(chunk)
+            zout.start_dir = zout.fp.tell()
+            zout.filelist.append(zinfo)
+            zout.NameToInfo[zinfo.filename] = zinfo
+
+def _copy_zip_member(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo, data: Optional[bytes] = None) -> None:
+    """Copy a member unchanged, raw when possible and via inflate/deflate otherwise"""
+    try:
+        _copy_zip_member_raw(zin, zout, info)
+    except Exception:
+        zout.writestr(info.filename, data if data is not None else zin.read(info))
+
+def process_zip_for_masking(zip_source, on_progress=None) -> dict:
+    """Mask every supported text member of an archive into a new spooled archive.
+
+    Members without detections and unsupported (binary) members are copied as
+    their original compressed streams; the JSON report is appended as
+    MASKING_REPORT_NAME in the same pass. ``on_progress(files_done,
+    files_total, bytes_processed)`` is called at every member boundary and
+    may raise MaskingCancelled to stop the job there.
+    """
+    report = {'files': [], 'summary': {'total_files': 0, 'files_masked': 0, 'detections_by_type': {}}}
+    out_zip = new_spool()
+
+    with zipfile.ZipFile(_zip_source(zip_source), 'r') as zin, zipfile.ZipFile(out_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
+        members = [info for info in zin.infolist() if not info.is_dir()]
+        bytes_processed = 0
+        for files_done, info in enumerate(members):
+            if on_progress is not None:
+                on_progress(files_done, len(members), bytes_processed)
+            bytes_processed += info.file_size
             filename = info.filename
             report['summary']['total_files'] += 1
+            data = None
 
             try:
-                data = zin.read(info.filename)
                 suffix = Path(filename).suffix.lower()
                 if suffix and suffix in MASKING_SUPPORTED_EXTENSIONS:
+                    data = zin.read(info)
                     try:
                         text = data.decode('utf-8')
                     except Exception:
@@ -584,8 +2628,11 @@ def process_zip_for_masking(zip_bytes: bytes) -> dict:
                         'detections': file_detections
                     })
 
-                    # Write masked text back preserving filename
-                    zout.writestr(filename, result['masked_text'])
+                    if result['masked']:
+                        # Write masked text back preserving filename
+                        zout.writestr(filename, result['masked_text'])
+                    else:
+                        _copy_zip_member(zin, zout, info, data)
                 else:
                     # Not a supported text file; copy as-is and record as unprocessed
                     report['files'].append({
@@ -593,7 +2640,7 @@ def process_zip_for_masking(zip_bytes: bytes) -> dict:
                         'masked': False,
                         'detections': []
                     })
-                    zout.writestr(filename, data)
+                    _copy_zip_member(zin, zout, info)
             except Exception as e:
                 # Write original file back unchanged on error, but do not log sensitive content
                 report['files'].append({
@@ -602,13 +2649,17 @@ def process_zip_for_masking(zip_bytes: bytes) -> dict:
                     'error': 'processing_error'
                 })
                 try:
-                    zout.writestr(filename, data)
+                    _copy_zip_member(zin, zout, info, data)
                 except Exception:
                     # Skip if even writing fails
                     pass
 
-    out_zip_mem.seek(0)
-    return {'zip_bytes': out_zip_mem.read(), 'report': report}
+        if on_progress is not None:
+            on_progress(len(members), len(members), bytes_processed)
+        zout.writestr(MASKING_REPORT_NAME, json.dumps(report, indent=2))
+
+    out_zip.seek(0)
+    return {'zip_file': out_zip, 'report': report}
 
 def process_single_file_for_masking(filename: str, file_bytes: bytes) -> dict:
     try:
@@ -632,53 +2683,156 @@ def process_single_file_for_masking(filename: str, file_bytes: bytes) -> dict:
         }
 
         # Return as a zip with the single masked file and JSON report
-        out_zip_mem = io.BytesIO()
-        with zipfile.ZipFile(out_zip_mem, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
+        out_zip = new_spool()
+        with zipfile.ZipFile(out_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
             zout.writestr(filename, result['masked_text'])
-        out_zip_mem.seek(0)
-        return {'zip_bytes': out_zip_mem.read(), 'report': report}
+            zout.writestr(MASKING_REPORT_NAME, json.dumps(report, indent=2))
+        out_zip.seek(0)
+        return {'zip_file': out_zip, 'report': report}
     except Exception:
         # On failure, return the original bytes zipped without logging content
-        out_zip_mem = io.BytesIO()
-        with zipfile.ZipFile(out_zip_mem, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
+        report = {'files': [{'filename': filename, 'masked': False, 'error': 'processing_error'}], 'summary': {'total_files': 1, 'files_masked': 0, 'detections_by_type': {}}}
+        out_zip = new_spool()
+        with zipfile.ZipFile(out_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
             zout.writestr(filename, file_bytes)
-        out_zip_mem.seek(0)
-        return {'zip_bytes': out_zip_mem.read(), 'report': {'files': [{'filename': filename, 'masked': False, 'error': 'processing_error'}], 'summary': {'total_files': 1, 'files_masked': 0, 'detections_by_type': {}}}}
+            zout.writestr(MASKING_REPORT_NAME, json.dumps(report, indent=2))
+        out_zip.seek(0)
+        return {'zip_file': out_zip, 'report': report}
+
+MASK_JOB_TERMINAL_STATES = ('done', 'error', 'cancelled')
+# Minimum seconds between progress writes to the job store
+MASK_PROGRESS_INTERVAL = 0.5
+# Upper bound for ?wait= long-polls on /api/mask/status
+MASK_STATUS_MAX_WAIT = 30.0
+# Seconds between keep-alive comments on /api/mask/events while a job is unchanged
+MASK_EVENTS_KEEPALIVE = 15.0
+
+
+class MaskingCancelled(Exception):
+    """Raised at a member boundary once a masking job has been cancelled"""
+
+
+# Jobs submitted by this process: job_id -> (future, upload spool)
+_mask_futures = {}
+_mask_futures_lock = threading.Lock()
+# Cancels requested through this process; other processes see the store flag
+_cancel_requested = set()
+# Wakes long-polls and event streams when a job in this process changes
+_job_changed = threading.Condition()
+# updated_ts of unfinished jobs running in this process, guarded by _job_changed
+_job_updated_ts = {}
+# Callables run on every change to a local job, for waiters on an event loop (see asgi.py)
+_job_listeners = set()
+
+
+def add_job_listener(listener: Callable[[], None]) -> None:
+    with _job_changed:
+        _job_listeners.add(listener)
+
+
+def remove_job_listener(listener: Callable[[], None]) -> None:
+    with _job_changed:
+        _job_listeners.discard(listener)
+
+
+def local_job_changed(job_id: str, since: float) -> Optional[bool]:
+    """Whether a job running in this process changed after ``since``; None if it is not running here"""
+    with _job_changed:
+        updated_ts = _job_updated_ts.get(job_id)
+    return None if updated_ts is None else updated_ts > since
+
+
+def _notify_job_changed() -> None:
+    # Called with _job_changed held
+    _job_changed.notify_all()
+    for listener in _job_listeners:
+        listener()
+
+
+def _update_job(job_id: str, **fields) -> None:
+    updated_ts = time.time()
+    masking_jobs.update(job_id, updated_ts=updated_ts, **fields)
+    with _job_changed:
+        if job_id in _job_updated_ts:
+            _job_updated_ts[job_id] = updated_ts
+        _notify_job_changed()
+
+
+def _forget_local_job(job_id: str) -> None:
+    with _mask_futures_lock:
+        _mask_futures.pop(job_id, None)
+    _cancel_requested.discard(job_id)
+    with _job_changed:
+        _job_updated_ts.pop(job_id, None)
+        _notify_job_changed()
+
+
+class _MaskingProgress:
+    """on_progress callback that records job progress and enforces cancellation"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.last_write = 0.0
+        self.last_cancel_check = 0.0
+        self.progress = {'files_done': 0, 'files_total': 0, 'bytes_processed': 0, 'bytes_per_second': 0}
+
+    def cancelled(self, now: float) -> bool:
+        if self.job_id in _cancel_requested:
+            return True
+        if now - self.last_cancel_check < MASK_PROGRESS_INTERVAL:
+            return False
+        self.last_cancel_check = now
+        job = masking_jobs.get(self.job_id)
+        return job is None or bool(job.get('cancel_requested'))
+
+    def __call__(self, files_done: int, files_total: int, bytes_processed: int) -> None:
+        now = time.monotonic()
+        elapsed = now - self.started
+        self.progress = {
+            'files_done': files_done,
+            'files_total': files_total,
+            'bytes_processed': bytes_processed,
+            'bytes_per_second': round(bytes_processed / elapsed) if elapsed > 0 else 0
+        }
+        if files_done < files_total and self.cancelled(now):
+            raise MaskingCancelled()
+        if now - self.last_write >= MASK_PROGRESS_INTERVAL or files_done == files_total:
+            self.last_write = now
+            _update_job(self.job_id, progress=self.progress)
+
 
-def _run_masking_job(job_id: str, original_filename: str, upload_bytes: bytes):
+def _run_masking_job(job_id: str, original_filename: str, upload):
     try:
-        masking_jobs[job_id]['status'] = 'processing'
+        progress = _MaskingProgress(job_id)
+        if progress.cancelled(time.monotonic()):
+            raise MaskingCancelled()
+        _update_job(job_id, status='processing')
         # Decide if input is a zip
         is_zip = False
         try:
-            is_zip = zipfile.is_zipfile(io.BytesIO(upload_bytes))
+            is_zip = zipfile.is_zipfile(upload)
         except Exception:
             is_zip = False
 
+        upload.seek(0)
         if is_zip:
-            result = process_zip_for_masking(upload_bytes)
+            result = process_zip_for_masking(upload, on_progress=progress)
         else:
-            result = process_single_file_for_masking(original_filename, upload_bytes)
-
-        # Append a masking_report.json inside the zip
-        zip_with_report = io.BytesIO()
-        with zipfile.ZipFile(io.BytesIO(result['zip_bytes']), 'r') as base_zip, zipfile.ZipFile(zip_with_report, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
-            # Copy all files
-            for info in base_zip.infolist():
-                if info.is_dir():
-                    continue
-                data = base_zip.read(info.filename)
-                zout.writestr(info.filename, data)
-            # Add report as JSON
-            zout.writestr('masking_report.json', json.dumps(result['report'], indent=2))
-
-        zip_with_report.seek(0)
-        masking_jobs[job_id]['status'] = 'done'
-        masking_jobs[job_id]['result_zip'] = zip_with_report.read()
-        masking_jobs[job_id]['report'] = result['report']
+            progress(0, 1, 0)
+            result = process_single_file_for_masking(original_filename, upload.read())
+            progress(1, 1, upload.tell())
+
+        # The archive already carries masking_report.json
+        masking_jobs.save_result(job_id, result['zip_file'])
+        _update_job(job_id, status='done', report=result['report'], progress=progress.progress)
+    except MaskingCancelled:
+        _update_job(job_id, status='cancelled', progress=progress.progress)
     except Exception as e:
-        masking_jobs[job_id]['status'] = 'error'
-        masking_jobs[job_id]['error'] = 'processing_error'
+        _update_job(job_id, status='error', error='processing_error')
+    finally:
+        upload.close()
+        _forget_local_job(job_id)
 
 @app.route('/api/mask/upload', methods=['POST'])
 def upload_for_masking():
@@ -688,31 +2842,128 @@ def upload_for_masking():
 
         f = request.files['file']
         filename = f.filename or 'upload'
-        upload_bytes = f.read()
+        upload = spool_upload(f)
 
         job_id = secrets.token_urlsafe(16)
-        masking_jobs[job_id] = {
-            'status': 'queued',
-            'created_at': datetime.utcnow().isoformat(),
-            'original_name': filename
-        }
+        updated_ts = time.time()
+        masking_jobs.create(
+            job_id,
+            status='queued',
+            created_at=datetime.utcnow().isoformat(),
+            updated_ts=updated_ts,
+            original_name=filename
+        )
+        with _job_changed:
+            _job_updated_ts[job_id] = updated_ts
 
-        executor.submit(_run_masking_job, job_id, filename, upload_bytes)
+        with _mask_futures_lock:
+            _mask_futures[job_id] = (executor.submit(_run_masking_job, job_id, filename, upload), upload)
         return jsonify({'job_id': job_id, 'status': 'queued'})
     except Exception:
         return jsonify({'error': 'upload_error'}), 500
 
+def safe_job_status(job: dict) -> dict:
+    safe = {'status': job['status'], 'created_at': job.get('created_at'), 'updated_ts': job.get('updated_ts')}
+    if job.get('progress'):
+        safe['progress'] = job['progress']
+    if job.get('cancel_requested') and job['status'] not in MASK_JOB_TERMINAL_STATES:
+        safe['cancel_requested'] = True
+    if job['status'] == 'done':
+        safe['report'] = job.get('report', {})
+    if job['status'] == 'error':
+        safe['error'] = job.get('error', 'processing_error')
+    return safe
+
+def _wait_for_job_change(job_id: str, since: float, timeout: float) -> Optional[dict]:
+    """Return the job once it has changed after ``since``, finished, or timeout elapsed
+
+    A job running in this process announces each change through
+    _job_changed, so the store is read once, when the wait ends. Jobs run by
+    other worker processes are polled.
+    """
+    deadline = time.monotonic() + timeout
+    with _job_changed:
+        while _job_updated_ts.get(job_id, math.inf) <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _job_changed.wait(remaining)
+        local = job_id in _job_updated_ts
+    if local:
+        return masking_jobs.get(job_id)
+    while True:
+        job = masking_jobs.get(job_id)
+        if job is None or job.get('updated_ts', 0) > since or job['status'] in MASK_JOB_TERMINAL_STATES:
+            return job
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return job
+        # Another worker process owns the job; nothing here will announce its changes
+        time.sleep(min(remaining, 0.25))
+
+def job_event(job: Optional[dict], since: float) -> Tuple[str, float, bool]:
+    """Server-sent event for a job read after a wait: (event, new ``since``, whether the stream ends)"""
+    if job is None:
+        return f"event: error\ndata: {json.dumps({'error': 'not_found'})}\n\n", since, True
+    if job.get('updated_ts', 0) <= since and job['status'] not in MASK_JOB_TERMINAL_STATES:
+        return ": keep-alive\n\n", since, False
+    return (f"data: {json.dumps(safe_job_status(job))}\n\n", job.get('updated_ts', 0),
+            job['status'] in MASK_JOB_TERMINAL_STATES)
+
+
+def event_stream_response(events) -> Response:
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/mask/status/<job_id>', methods=['GET'])
 def masking_status(job_id):
     job = masking_jobs.get(job_id)
     if not job:
         return jsonify({'error': 'not_found'}), 404
-    safe = {'status': job['status'], 'created_at': job.get('created_at')}
-    if job['status'] == 'done':
-        safe['report'] = job.get('report', {})
-    if job['status'] == 'error':
-        safe['error'] = job.get('error', 'processing_error')
-    return jsonify(safe)
+    # Long-poll: ?wait=<seconds>[&since=<updated_ts>] blocks until the job changes
+    wait = min(request.args.get('wait', 0, type=float), MASK_STATUS_MAX_WAIT)
+    if wait > 0:
+        since = request.args.get('since', job.get('updated_ts', 0), type=float)
+        job = _wait_for_job_change(job_id, since, wait)
+        if not job:
+            return jsonify({'error': 'not_found'}), 404
+    return jsonify(safe_job_status(job))
+
+@app.route('/api/mask/events/<job_id>', methods=['GET'])
+def masking_events(job_id):
+    """Server-sent events stream of job status until the job finishes"""
+    if not masking_jobs.get(job_id):
+        return jsonify({'error': 'not_found'}), 404
+
+    def events():
+        since, finished = -1.0, False
+        while not finished:
+            event, since, finished = job_event(_wait_for_job_change(job_id, since, MASK_EVENTS_KEEPALIVE), since)
+            yield event
+
+    return event_stream_response(events())
+
+@app.route('/api/mask/cancel/<job_id>', methods=['POST'])
+def masking_cancel(job_id):
+    job = masking_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'not_found'}), 404
+    if job['status'] in MASK_JOB_TERMINAL_STATES:
+        return jsonify({'error': 'not_cancellable', 'status': job['status']}), 409
+
+    _cancel_requested.add(job_id)
+    _update_job(job_id, cancel_requested=True)
+    with _mask_futures_lock:
+        future, upload = _mask_futures.get(job_id, (None, None))
+    if future is not None and future.cancel():
+        # Never started: the executor slot is free already, so finish the job here
+        upload.close()
+        _update_job(job_id, status='cancelled')
+        _forget_local_job(job_id)
+    job = masking_jobs.get(job_id) or job
+    return jsonify({'job_id': job_id, **safe_job_status(job)}), 202
 
 @app.route('/api/mask/download/<job_id>', methods=['GET'])
 def masking_download(job_id):
@@ -721,13 +2972,15 @@ def masking_download(job_id):
         return jsonify({'error': 'not_found'}), 404
     if job.get('status') != 'done':
         return jsonify({'error': 'not_ready'}), 409
-    result_zip = job.get('result_zip')
-    if not result_zip:
+    result = masking_jobs.iter_result(job_id)
+    if result is None:
         return jsonify({'error': 'missing_result'}), 500
-    mem = io.BytesIO(result_zip)
-    mem.seek(0)
+    chunks, size = result
     download_name = f"masked_{job.get('original_name', 'files')}.zip"
-    return send_file(mem, mimetype='application/zip', as_attachment=True, download_name=download_name)
+    response = Response(chunks, mimetype='application/zip')
+    response.headers['Content-Length'] = str(size)
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
 
 @app.route('/detect', methods=['POST'])
 def detect_language():
@@ -735,9 +2988,9 @@ def detect_language():
         code = request.json.get('code', '')
         if not code:
             return jsonify({'error': 'No code provided'}), 400
-            
-        language = detect_language_simple(code)
-        return jsonify({'language': language})
+
+        language, confidence = detect_code_language(code, request.json.get('filename'))
+        return jsonify({'language': language, 'confidence': confidence})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -748,35 +3001,30 @@ def shorten():
         code = data.get('code', '')
         compression_percent = data.get('compressionPercent', 50)
         lang = data.get('lang', 'python').lower()  # Get language from request
+        mangle = lang == 'javascript' and bool(data.get('mangle', False))
 
         if not code:
             return jsonify({"error": "No code provided"}), 400
 
         # Language-specific minification
+        minifiers = {"python": minify_python, "javascript": minify_js, "java": minify_java}
+        for name, dialect in C_FAMILY_LANGUAGES.items():
+            minifiers.setdefault(name, partial(minify_c_family, dialect=dialect))
+        if lang not in minifiers:
+            return jsonify({"error": "Unsupported language"}), 415
+
+        cache_key = minify_cache.make_key(code, lang, compression_percent, 'mangle' if mangle else '')
         try:
-            if lang == "python":
-                compressed = minify_python(code)
-            elif lang == "javascript":
-                compressed = minify_js(code)
-            elif lang == "java":
-                compressed = minify_java(code)
-            else:
-                return jsonify({"error": "Unsupported language"}), 415
+            compressed = minify_cache.get_or_minify(
+                cache_key, lambda: minify_js(code, mangle=True) if mangle else minifiers[lang](code))
         except Exception as e:
             logger.error(f"Error during minification for language {lang}: {str(e)}")
             return jsonify({"error": f"Minification failed for {lang}: {str(e)}"}), 500
 
         # Persist processed file and return its ID for comments linkage
         current_user = _get_current_user_optional()
-        processed_file = ProcessedFile(
-            user_id=(current_user.id if current_user else None),
-            original=code,
-            shortened=compressed,
-            language=lang
-        )
         try:
-            db.session.add(processed_file)
-            db.session.commit()
+            file_id = processed_file_writer.submit(current_user.id if current_user else None, code, compressed, lang)
         except Exception as e:
             db.session.rollback()
             logger.error(f"Failed to persist processed file: {str(e)}")
@@ -787,13 +3035,26 @@ def shorten():
             "shortened": compressed,
             "language": lang,
             "compression": compression_percent,
-            "file_id": processed_file.id
+            "file_id": file_id
         })
         
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def minify_cache_stats():
+    return jsonify(minify_cache.stats())
+
+# /upgrade options in the order they are applied; asgi.py awaits 'docs' and runs the rest on its executor
+UPGRADE_STEPS = (
+    ('refactor', refactor_identifiers),
+    ('types', add_type_annotations),
+    ('lint', format_code),
+    ('docs', generate_docstrings_via_openai),
+    ('modern', modernize_syntax),
+)
+
 @app.route('/upgrade', methods=['POST'])
 def upgrade_code():
     try:
@@ -808,25 +3069,10 @@ def upgrade_code():
         applied = []
         
         # Apply transformations in order
-        if 'refactor' in options:
-            transformed = refactor_identifiers(transformed)
-            applied.append('refactor')
-        
-        if 'types' in options:
-            transformed = add_type_annotations(transformed)
-            applied.append('types')
-        
-        if 'lint' in options:
-            transformed = format_code(transformed)
-            applied.append('lint')
-        
-        if 'docs' in options:
-            transformed = generate_docstrings_via_openai(transformed)
-            applied.append('docs')
-        
-        if 'modern' in options:
-            transformed = modernize_syntax(transformed)
-            applied.append('modern')
+        for name, step in UPGRADE_STEPS:
+            if name in options:
+                transformed = step(transformed)
+                applied.append(name)
         
         return jsonify({
             "original": code,
@@ -836,6 +3082,23 @@ def upgrade_code():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/format', methods=['POST'])
+def format_files():
+    """Format one snippet (``code``) or many (``files``: [{filename, code}]) with black"""
+    data = request.get_json(silent=True) or {}
+    files = data.get('files')
+    if files is None:
+        if not data.get('code'):
+            return jsonify({"error": "No code provided"}), 400
+        return jsonify({"formatted": format_code(data['code'])})
+    if not isinstance(files, list) or not all(isinstance(f, dict) and isinstance(f.get('code'), str) for f in files):
+        return jsonify({"error": "files must be a list of {filename, code} objects"}), 400
+    formatted = format_batch([f['code'] for f in files])
+    return jsonify({"files": [
+        {'filename': f.get('filename'), 'formatted': text, 'changed': text != f['code']}
+        for f, text in zip(files, formatted)
+    ]})
+
 @app.route('/process-zip', methods=['POST'])
 def process_zip():
     """Process a zip file containing code files"""
@@ -847,9 +3110,12 @@ def process_zip():
         if not file.filename.endswith('.zip'):
             return jsonify({'error': 'File must be a zip archive'}), 400
             
-        # Read zip file
-        zip_data = file.read()
-        
+        # Open the upload in place; large uploads are already spooled to disk
+        zip_data = upload_stream(file)
+
+        if _wants_ndjson():
+            return Response(stream_with_context(_stream_zip_results(zip_data)), mimetype='application/x-ndjson')
+
         # Process zip file
         results = process_zip_file(zip_data)
         
@@ -871,6 +3137,26 @@ def process_zip():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _wants_ndjson() -> bool:
+    """True if the client explicitly asked for a streamed NDJSON response"""
+    if request.args.get('stream') in ('1', 'true', 'ndjson'):
+        return True
+    return any(mimetype == 'application/x-ndjson' and quality > 0 for mimetype, quality in request.accept_mimetypes)
+
+def _stream_zip_results(zip_data):
+    """Yield one NDJSON line per processed file, then a summary line"""
+    summary = {'total_files': 0, 'successful_files': 0, 'total_chars_saved': 0}
+    try:
+        for record in iter_zip_results(zip_data, window_bytes=ZIP_STREAM_WINDOW_BYTES):
+            summary['total_files'] += 1
+            if 'error' not in record:
+                summary['successful_files'] += 1
+                summary['total_chars_saved'] += record['stats']['chars_saved']
+            yield json.dumps({'type': 'file', **record}) + '\n'
+        yield json.dumps({'type': 'summary', 'success': True, 'summary': summary}) + '\n'
+    except Exception as e:
+        yield json.dumps({'type': 'summary', 'success': False, 'error': str(e), 'summary': summary}) + '\n'
+
 @app.route('/api/auth/register', methods=['POST'])
 def register_user():
     try:
@@ -909,15 +3195,85 @@ def login_user():
         if not user or not user.check_password(password):
             return jsonify({'message': 'Invalid credentials'}), 401
 
+        now = datetime.utcnow()
         token = jwt.encode({
             'user_id': str(user.id),
-            'exp': datetime.utcnow() + timedelta(hours=12)
+            'jti': secrets.token_urlsafe(16),
+            'iat': now,
+            'exp': now + timedelta(hours=TOKEN_LIFETIME_HOURS)
         }, app.config['SECRET_KEY'], algorithm="HS256")
 
         return jsonify({'token': token})
     except Exception as e:
         return jsonify({'error': 'login_failed', 'details': str(e)}), 500
 
+
+@app.route('/api/auth/logout', methods=['POST'])
+@jwt_required
+def logout_user(current_user):
+    revoke_token(_request_token())
+    return jsonify({'message': 'Logged out'}), 200
+
+# ===================== Snippets API =====================
+
+# Default and largest page for keyset-paginated listings
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+PAGE_MAX_SIZE = int(os.getenv('PAGE_MAX_SIZE', '200'))
+
+
+def encode_cursor(created_at: datetime, key: Any) -> str:
+    """Opaque cursor for the row after which the next page starts."""
+    raw = f'{created_at.isoformat()}|{key}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """``(created_at, key)`` from ``encode_cursor``; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, key = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), key
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def page_size(value: Optional[str]) -> int:
+    if value is None:
+        return PAGE_SIZE
+    return max(1, min(int(value), PAGE_MAX_SIZE))
+
+
+def keyset_page(query, created_column, key_column, cursor: Optional[str], limit: int):
+    """One page of ``query`` newest first, and the cursor of the next page or None.
+
+    Rows are ordered by ``(created_column, key_column)`` descending and the
+    page starts strictly after the cursor's row, so an index on the filter
+    columns followed by those two serves every page in O(limit) whatever
+    its depth.
+    """
+    if cursor:
+        created_at, key = decode_cursor(cursor)
+        if key_column.type.python_type is int:
+            key = int(key)
+        # The redundant bound lets the index seek straight to the cursor instead of filtering from the top
+        query = query.filter(created_column <= created_at,
+                             or_(created_column < created_at, and_(created_column == created_at, key_column < key)))
+    rows = query.order_by(created_column.desc(), key_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, key_column.key))
+
+
+def paged_response(items: List[Any], next_cursor: Optional[str]):
+    """List body as before; the next page's cursor travels in the ``X-Next-Cursor`` header."""
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
 @app.route('/api/snippets', methods=['POST'])
 @jwt_required
 def create_snippet(current_user):
@@ -930,20 +3286,22 @@ def create_snippet(current_user):
         if not code:
             return jsonify({'message': 'Code is required'}), 400
 
-        short_id = generate_short_id()
-        created_at = datetime.utcnow().isoformat()
-
-        snippets_db[short_id] = {
-            'short_id': short_id,
-            'user_id': current_user,
-            'code': code,
-            'language': language,
-            'title': title,
-            'created_at': created_at,
-            'updated_at': created_at
-        }
-        return jsonify({'message': 'Snippet created', 'snippet': snippets_db[short_id]}), 201
+        # Short ids are random; retry the rare collision with another one
+        for attempt in range(3):
+            created_at = datetime.utcnow()
+            snippet = Snippet(short_id=generate_short_id(), user_id=int(current_user), code=code,
+                              language=language, title=title, created_at=created_at, updated_at=created_at)
+            db.session.add(snippet)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 2:
+                    raise
+        return jsonify({'message': 'Snippet created', 'snippet': snippet.to_dict()}), 201
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -951,11 +3309,15 @@ def create_snippet(current_user):
 @jwt_required
 def get_user_snippets(current_user):
     try:
-        user_snippets = [
-            snippet for snippet in snippets_db.values()
-            if snippet['user_id'] == current_user
-        ]
-        return jsonify(user_snippets), 200
+        try:
+            snippets, next_cursor = keyset_page(
+                Snippet.query.filter_by(user_id=int(current_user)),
+                Snippet.created_at, Snippet.short_id,
+                request.args.get('cursor'), page_size(request.args.get('limit'))
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor or limit'}), 400
+        return paged_response([snippet.to_dict() for snippet in snippets], next_cursor), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -967,39 +3329,43 @@ def edit_snippet(current_user, short_id):
         new_code = data.get('code')
         new_title = data.get('title')
 
-        snippet = snippets_db.get(short_id)
+        snippet = db.session.get(Snippet, short_id)
 
         if not snippet:
             return jsonify({'message': 'Snippet not found'}), 404
 
-        if snippet['user_id'] != current_user:
+        if snippet.user_id != int(current_user):
             return jsonify({'message': 'Unauthorized to edit this snippet'}), 403
 
         if new_code:
-            snippet['code'] = new_code
+            snippet.code = new_code
         if new_title:
-            snippet['title'] = new_title
-        snippet['updated_at'] = datetime.utcnow().isoformat()
+            snippet.title = new_title
+        snippet.updated_at = datetime.utcnow()
+        db.session.commit()
 
-        return jsonify({'message': 'Snippet updated', 'snippet': snippet}), 200
+        return jsonify({'message': 'Snippet updated', 'snippet': snippet.to_dict()}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/snippets/<short_id>', methods=['DELETE'])
 @jwt_required
 def delete_snippet(current_user, short_id):
     try:
-        snippet = snippets_db.get(short_id)
+        snippet = db.session.get(Snippet, short_id)
 
         if not snippet:
             return jsonify({'message': 'Snippet not found'}), 404
 
-        if snippet['user_id'] != current_user:
+        if snippet.user_id != int(current_user):
             return jsonify({'message': 'Unauthorized to delete this snippet'}), 403
 
-        del snippets_db[short_id]
+        db.session.delete(snippet)
+        db.session.commit()
         return jsonify({'message': 'Snippet deleted'}), 204
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -1020,18 +3386,22 @@ def create_comment(current_user):
             return jsonify({'message': 'Comment too long'}), 400
 
         processed_file = db.session.get(ProcessedFile, file_id)
+        if not processed_file and isinstance(file_id, int) and processed_file_writer.wait_for(file_id):
+            # The file was still in the write-behind queue
+            processed_file = db.session.get(ProcessedFile, file_id)
         if not processed_file:
             return jsonify({'message': 'Processed file not found'}), 404
 
         # Sanitize input to prevent XSS
         safe_comment = bleach.clean(raw_comment, strip=True)
 
-        user_obj = db.session.get(User, int(current_user))
-        username = user_obj.email if user_obj else 'user'
+        identity = get_user_identity(int(current_user))
+        username = identity.email if identity else 'user'
 
         new_comment = Comment(file_id=processed_file.id, username=username, comment=safe_comment)
         db.session.add(new_comment)
         db.session.commit()
+        comment_pages.invalidate(processed_file.id)
 
         return jsonify({
             'id': new_comment.id,
@@ -1045,11 +3415,61 @@ def create_comment(current_user):
         return jsonify({'error': 'create_comment_failed', 'details': str(e)}), 500
 
 
-@app.route('/api/comments/<int:file_id>', methods=['GET'])
-def list_comments(file_id: int):
-    try:
-        comments = Comment.query.filter_by(file_id=file_id).order_by(Comment.created_at.desc()).all()
-        return jsonify([
+# Seconds a rendered page of comments is served without a query; other workers see new comments after this
+COMMENT_CACHE_TTL = float(os.getenv('COMMENT_CACHE_TTL', '5'))
+# Files whose comment pages are cached, and cached pages per file
+COMMENT_CACHE_FILES = int(os.getenv('COMMENT_CACHE_FILES', '1024'))
+COMMENT_CACHE_PAGES_PER_FILE = 16
+
+
+class CommentPageCache:
+    """Rendered comment pages per file for ``COMMENT_CACHE_TTL`` seconds, dropped when the file gets a comment.
+
+    Each invalidation bumps a generation, and a page read before one is not
+    stored, so a listing that raced a new comment cannot cache the old page.
+    """
+
+    def __init__(self, max_files: int, ttl: float):
+        self._files = TTLCache(max_files, ttl)
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, file_id: int, page_key):
+        pages = self._files.get(file_id)
+        return pages.get(page_key) if pages else None
+
+    def put(self, file_id: int, page_key, page, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            pages = self._files.get(file_id)
+            if pages is None:
+                pages = {}
+                self._files.put(file_id, pages)
+            if len(pages) < COMMENT_CACHE_PAGES_PER_FILE:
+                pages[page_key] = page
+
+    def invalidate(self, file_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._files.discard(file_id)
+
+    def stats(self) -> Dict[str, int]:
+        return self._files.stats()
+
+
+comment_pages = CommentPageCache(COMMENT_CACHE_FILES, COMMENT_CACHE_TTL)
+
+
+def comment_page(file_id: int, cursor: Optional[str], limit: int):
+    """``(body, etag, next_cursor)`` for one page of a file's comments, newest first."""
+    page_key = (cursor, limit)
+    page = comment_pages.get(file_id, page_key)
+    if page is None:
+        generation = comment_pages.generation
+        comments, next_cursor = keyset_page(Comment.query.filter_by(file_id=file_id),
+                                            Comment.created_at, Comment.id, cursor, limit)
+        body = app.json.dumps([
             {
                 'id': c.id,
                 'file_id': c.file_id,
@@ -1057,7 +3477,28 @@ def list_comments(file_id: int):
                 'comment': c.comment,
                 'timestamp': c.created_at.isoformat() + 'Z'
             } for c in comments
-        ])
+        ]).encode('utf-8')
+        etag = hashlib.blake2b(body + (next_cursor or '').encode('ascii'), digest_size=16).hexdigest()
+        page = (body, etag, next_cursor)
+        comment_pages.put(file_id, page_key, page, generation)
+    return page
+
+
+@app.route('/api/comments/<int:file_id>', methods=['GET'])
+def list_comments(file_id: int):
+    try:
+        try:
+            body, etag, next_cursor = comment_page(file_id, request.args.get('cursor'),
+                                                   page_size(request.args.get('limit')))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor or limit'}), 400
+        response = app.response_class(body, mimetype='application/json')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        # Clients revalidate every time; an unchanged page costs a 304 with no body
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': 'list_comments_failed', 'details': str(e)}), 500
 
@@ -1077,35 +3518,54 @@ def explain_code():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def static_summary_results(code: str) -> Dict:
+    """The /api/summarize-functions response body with the static function index filled in."""
+    analysis_results = {
+        'status': 'success',
+        'data': {'summaries': []},
+        'warnings': [],
+        'errors': []
+    }
+
+    # Static analysis fallback
+    try:
+        static_analysis = analyze_code_structure(code)
+        analysis_results['data']['summaries'] = static_analysis
+    except Exception as e:
+        analysis_results['warnings'].append(f'Static analysis failed: {str(e)}')
+    return analysis_results
+
+
+def add_ai_summaries(analysis_results: Dict, openai_summaries: List[Dict]) -> None:
+    analysis_results['data']['summaries'] = merge_summaries(
+        analysis_results['data']['summaries'], 
+        openai_summaries
+    )
+    cached = sum(1 for summary in openai_summaries if summary['cached'])
+    analysis_results['data']['ai'] = {'cached': cached, 'summarized': len(openai_summaries) - cached}
+
+
+def ai_summary_warning(error: Exception) -> str:
+    if isinstance(error, AIGatewayBusy):
+        return 'AI analysis skipped: too many AI requests in flight, try again shortly'
+    return f'AI analysis failed: {str(error)}'
+
+
 @app.route('/api/summarize-functions', methods=['POST'])
 def summarize_functions():
     try:
         code = request.json['code']
-
-        analysis_results = {
-            'status': 'success',
-            'data': {'summaries': []},
-            'warnings': [],
-            'errors': []
-        }
-
-        # Static analysis fallback
-        try:
-            static_analysis = analyze_code_structure(code)
-            analysis_results['data']['summaries'] = static_analysis
-        except Exception as e:
-            analysis_results['warnings'].append(f'Static analysis failed: {str(e)}')
+        analysis_results = static_summary_results(code)
 
         # OpenAI enhanced analysis if configured
         try:
-            if 'OPENAI_API_KEY' in os.environ:
-                openai_summaries = generate_ai_summaries(code)
-                analysis_results['data']['summaries'] = merge_summaries(
-                    analysis_results['data']['summaries'], 
-                    openai_summaries
+            if ai_gateway.enabled:
+                add_ai_summaries(
+                    analysis_results,
+                    generate_ai_summaries(code, analysis_results['data']['summaries'] or None)
                 )
         except Exception as e:
-            analysis_results['warnings'].append(f'AI analysis failed: {str(e)}')
+            analysis_results['warnings'].append(ai_summary_warning(e))
         
         return jsonify(analysis_results), 200
 
@@ -1117,49 +3577,153 @@ def summarize_functions():
             'warnings': []
         }), 500
 
-def parse_ai_response(response_content: str) -> List[Dict]:
-    """
-    Parses the string content from the AI response into a structured format.
-    This is a placeholder and should be implemented to correctly parse the AI's output.
+# Rows per query when loading stored summaries, below SQLite's bound parameter limit
+_SUMMARY_QUERY_CHUNK = 500
+
+
+def load_function_summaries(hashes: List[str], model: str) -> Dict[str, Dict]:
+    """Stored summaries by function hash; hashes without one are absent. Store errors load nothing."""
+    unique = list(dict.fromkeys(hashes))
+    found = {}
+    try:
+        for start in range(0, len(unique), _SUMMARY_QUERY_CHUNK):
+            rows = FunctionSummary.query.filter(
+                FunctionSummary.model == model,
+                FunctionSummary.function_hash.in_(unique[start:start + _SUMMARY_QUERY_CHUNK])
+            ).all()
+            for row in rows:
+                found[row.function_hash] = {
+                    'summary': row.summary,
+                    'suggestions': json.loads(row.suggestions),
+                    'complexity': row.complexity
+                }
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Loading function summaries failed: {e}")
+    return found
+
+
+def save_function_summaries(summaries: Dict[str, Dict], model: str) -> None:
+    """Store summaries by function hash, replacing older ones from the same model."""
+    pending = dict(summaries)
+    for _ in range(2):
+        if not pending:
+            return
+        try:
+            for digest, summary in pending.items():
+                db.session.merge(FunctionSummary(
+                    function_hash=digest,
+                    model=model,
+                    summary=summary['summary'],
+                    suggestions=json.dumps(summary['suggestions']),
+                    complexity=summary['complexity']
+                ))
+            db.session.commit()
+            return
+        except IntegrityError:
+            # A concurrent request stored some of the same functions first; keep theirs, store the rest
+            db.session.rollback()
+            stored = load_function_summaries(list(pending), model)
+            pending = {digest: summary for digest, summary in pending.items() if digest not in stored}
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Saving function summaries failed: {e}")
+            return
+
+
+def summary_items(code: str, functions: Optional[List[Dict]] = None) -> List[Dict]:
+    """Functions of ``code`` to summarize, each with its ``hash`` and ``source``.
+
+    ``functions`` is the index from ``analyze_python_functions(code, hashes=True)``
+    and is computed when not given. Code without parsable Python functions
+    becomes one ``<module>`` item.
     """
-    # Example: In a real scenario, you might parse JSON or a specific text format
-    print(f"AI Response Content to Parse: {response_content}") # For debugging
-    return [] # Return an empty list for now, or a dummy structure if you know the expected format.
+    if functions is None:
+        functions = analyze_python_functions(code, hashes=True)
+    if functions:
+        raw_lines = python_source(code)._raw_lines
+        return [
+            {'name': info['name'], 'start_line': info['start_line'], 'end_line': info['end_line'],
+             'hash': info['hash'], 'source': ''.join(raw_lines[info['start_line'] - 1:info['end_line']])}
+            for info in functions
+        ]
+    digest = hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    return [{'name': '<module>', 'start_line': 1, 'end_line': code.count('\n') + 1, 'hash': digest, 'source': code}]
 
-def generate_ai_summaries(code: str) -> List[Dict]:
-    """Use OpenAI API to generate function summaries and refactoring suggestions"""
-    client = openai.OpenAI()
-    
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[{
-            "role": "system",
-            "content": """Analyze this code and generate:
-            1. Function summaries with inputs/outputs
-            2. Refactoring suggestions
-            3. Complexity estimates"""
-        }, {
-            "role": "user",
-            "content": code
-        }],
-        temperature=0.2
-    )
-    
-    return parse_ai_response(response.choices[0].message.content)
+
+def missing_summary_items(items: List[Dict], stored: Dict[str, Dict]) -> List[Dict]:
+    """Items without a stored summary, one per distinct hash."""
+    return list({item['hash']: item for item in items if item['hash'] not in stored}.values())
+
+
+def summary_results(items: List[Dict], stored: Dict[str, Dict], fresh: Dict[str, Dict]) -> List[Dict]:
+    return [
+        {'name': item['name'], 'start_line': item['start_line'], 'end_line': item['end_line'], 'hash': item['hash'],
+         **(stored.get(item['hash']) or fresh[item['hash']]), 'cached': item['hash'] in stored}
+        for item in items
+    ]
+
+
+def generate_ai_summaries(code: str, functions: Optional[List[Dict]] = None) -> List[Dict]:
+    """AI summaries, refactoring suggestions and complexity estimates, one per function.
+
+    Functions whose hash already has a stored summary are served from the
+    store (``cached``); only the rest go to the AI gateway, so an edit costs
+    tokens in proportion to what it changed. See ``summary_items`` for
+    ``functions``. Raises AIGatewayError when the gateway cannot answer.
+    """
+    items = summary_items(code, functions)
+    model = ai_gateway.model
+    stored = load_function_summaries([item['hash'] for item in items], model)
+    missing = missing_summary_items(items, stored)
+    fresh = {}
+    if missing:
+        fresh = dict(zip((item['hash'] for item in missing), ai_gateway.summarize_functions(missing)))
+        save_function_summaries(fresh, model)
+    return summary_results(items, stored, fresh)
 
 def merge_summaries(static_summaries: List[Dict], ai_summaries: List[Dict]) -> List[Dict]:
-    """Merge results from static and AI analysis"""
-    # Implementation logic to merge analyses
-    return static_summaries  # Simplified for example
+    """Attach AI results to the static function index.
+
+    Entries are matched by function hash, taking the AI entry at the same
+    name and start line when identical functions share a hash, and by name
+    and start line alone when a side has no hash. Each matched static entry
+    gains an ``ai`` object; AI entries that match no function, such as a
+    whole-file ``<module>`` summary, are appended on their own.
+    """
+    by_hash = defaultdict(list)
+    by_position = {}
+    for summary in ai_summaries:
+        if summary.get('hash'):
+            by_hash[summary['hash']].append(summary)
+        by_position[(summary.get('name'), summary.get('start_line'))] = summary
+
+    used = set()
+    merged = []
+    for function in static_summaries:
+        at_position = by_position.get((function.get('name'), function.get('start_line')))
+        candidates = [c for c in by_hash.get(function.get('hash'), ()) if id(c) not in used]
+        if at_position is not None and (at_position in candidates or not function.get('hash')):
+            match = at_position
+        else:
+            match = candidates[0] if candidates else None
+        if match is None or id(match) in used:
+            merged.append(function)
+            continue
+        used.add(id(match))
+        ai = {key: match[key] for key in ('summary', 'suggestions', 'complexity', 'cached') if key in match}
+        merged.append({**function, 'ai': ai})
+    merged.extend(summary for summary in ai_summaries if id(summary) not in used)
+    return merged
 
 def parse_functions(code: str) -> List[Dict]:
     """
     Parses the code to extract function information based on detected language.
     This acts as a dispatcher to language-specific analysis functions.
     """
-    language = detect_language_simple(code)
+    language, _ = detect_code_language(code)
     if language == 'Python':
-        return analyze_python_functions(code)
+        return analyze_python_functions(code, hashes=True)
     # Add more language handlers here as needed
     return [] # Return empty for unsupported languages or if no functions are found
 
@@ -1172,55 +3736,119 @@ def analyze_code_structure(code: str) -> List[Dict]:
         logger.warning(f"Syntax error in code: {e}")
         return []
 
-def analyze_python_functions(code):
-    try:
-        tree = ast.parse(code)
+# Calls recorded as I/O side effects: builtins by name, methods by attribute
+_IO_CALL_NAMES = frozenset({'print', 'open'})
+_IO_CALL_ATTRS = frozenset({'write', 'read'})
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+def function_hash(node: ast.AST, known: Optional[Dict[int, str]] = None) -> str:
+    """Hash of a node's AST without positions or expression contexts.
+
+    Moving, reindenting or reformatting code, or editing comments, keeps the
+    hash. ``known`` maps ``id()`` of nested function nodes to their hashes
+    already computed, which stand in for their subtrees, so hashing every
+    function of a module innermost-first stays linear in its size.
+    """
+    parts = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ast.AST):
+            if known and item is not node and id(item) in known:
+                parts.append(known[id(item)])
+                continue
+            item_type = type(item)
+            parts.append(item_type.__name__)
+            stack.extend(getattr(item, name, None) for name in reversed(item_type._fields) if name != 'ctx')
+        elif isinstance(item, list):
+            parts.append(f'[{len(item)}')
+            stack.extend(reversed(item))
+        else:
+            parts.append(repr(item))
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def _function_info(node) -> Dict:
+    def param(arg, prefix=''):
+        return {'name': prefix + arg.arg, 'type': ast.unparse(arg.annotation) if arg.annotation else None}
+
+    args = node.args
+    inputs = [param(arg) for arg in args.posonlyargs + args.args]
+    if args.vararg:
+        inputs.append(param(args.vararg, '*'))
+    inputs.extend(param(arg) for arg in args.kwonlyargs)
+    if args.kwarg:
+        inputs.append(param(args.kwarg, '**'))
+    return {
+        'name': node.name,
+        'async': isinstance(node, ast.AsyncFunctionDef),
+        'inputs': inputs,
+        'returns': ast.unparse(node.returns) if node.returns else None,
+        'side_effects': {},  # used as an ordered set until the function is emitted
+        'start_line': node.lineno,
+        'end_line': node.end_lineno
+    }
+
+
+def _collect_functions(root: ast.AST, functions: List[Dict], nodes: Optional[List[ast.AST]] = None) -> None:
+    """Append info for every function under ``root`` to ``functions`` in source pre-order.
+
+    When ``nodes`` is given, the matching function nodes are appended to it.
+
+    Each node is visited once with the innermost enclosing function as its
+    owner, so globals and I/O calls are attributed to that function only.
+    Decorators, defaults and annotations belong to the enclosing scope. The
+    walk uses an explicit stack, so nesting depth is not limited by recursion.
+    """
+    stack = [(root, None)]
+    while stack:
+        node, owner = stack.pop()
+        if isinstance(node, _FUNCTION_NODES):
+            info = _function_info(node)
+            functions.append(info)
+            if nodes is not None:
+                nodes.append(node)
+            stack.extend((child, info) for child in reversed(node.body))
+            stack.extend((child, owner) for child in reversed(node.decorator_list))
+            stack.append((node.args, owner))
+            continue
+        if owner is not None:
+            if isinstance(node, ast.Global):
+                owner['side_effects'].update(dict.fromkeys(node.names))
+            elif isinstance(node, ast.Call):
+                func = node.func
+                if isinstance(func, ast.Name) and func.id in _IO_CALL_NAMES:
+                    owner['side_effects'][func.id] = None
+                elif isinstance(func, ast.Attribute) and func.attr in _IO_CALL_ATTRS:
+                    owner['side_effects'][func.attr] = None
+        children = list(ast.iter_child_nodes(node))
+        stack.extend((child, owner) for child in reversed(children))
+
+
+def iter_python_functions(code: str, hashes: bool = False):
+    """Yield function info for ``code`` in source order, one top-level statement at a time.
+
+    Callers can stream results or stop early without analysing the rest of
+    the module. With ``hashes``, each info also carries ``hash``, the
+    function's ``function_hash``. Raises SyntaxError if the code does not parse.
+    """
+    for statement in python_source(code).tree.body:
         functions = []
-        
-        class FunctionAnalyzer(ast.NodeVisitor):
-            def visit_FunctionDef(self, node):
-                func_info = {
-                    'name': node.name,
-                    'inputs': [],
-                    'returns': None,
-                    'side_effects': [],
-                    'start_line': node.lineno,
-                    'end_line': node.end_lineno
-                }
-                
-                # Analyze arguments
-                for arg in node.args.args:
-                    param = {
-                        'name': arg.arg,
-                        'type': ast.unparse(arg.annotation) if arg.annotation else None
-                    }
-                    func_info['inputs'].append(param)
-                
-                # Analyze return type
-                if node.returns:
-                    func_info['returns'] = ast.unparse(node.returns)
-                
-                # Detect side effects
-                side_effects = set()
-                for child in ast.walk(node):
-                    if isinstance(child, ast.Global):
-                        side_effects.update(child.names)
-                    elif isinstance(child, (ast.Call, ast.Expr)):
-                        # Detect I/O operations
-                        if isinstance(child.value, ast.Name) and child.value.id in ['print', 'open']:
-                            side_effects.add(child.value.id)
-                        elif isinstance(child.value, ast.Attribute) and child.value.attr in ['write', 'read']:
-                            side_effects.add(child.value.attr)
-                
-                func_info['side_effects'] = list(side_effects)
-                functions.append(func_info)
-                
-                self.generic_visit(node)
-        
-        analyzer = FunctionAnalyzer()
-        analyzer.visit(tree)
-        return functions
-    
+        nodes = [] if hashes else None
+        _collect_functions(statement, functions, nodes)
+        if hashes:
+            known = {}
+            for info, node in zip(reversed(functions), reversed(nodes)):
+                info['hash'] = known[id(node)] = function_hash(node, known)
+        for info in functions:
+            info['side_effects'] = list(info['side_effects'])
+            yield info
+
+
+def analyze_python_functions(code, hashes: bool = False):
+    try:
+        return list(iter_python_functions(code, hashes))
     except Exception as e:
         logger.error(f"Python analysis error: {e}")
         return []
@@ -1231,17 +3859,9 @@ def analyze_code():
     if not code_snippet:
         return jsonify({'error': 'No code provided'}), 400
 
-    language = 'unknown'
-    try:
-        # Pygments requires a filename to guess the lexer correctly
-        # We use a dummy filename to give it a hint
-        lexer = guess_lexer_for_filename('temp.txt', code_snippet)
-        language = lexer.aliases[0]
-    except (ClassNotFound, IndexError):
-        # If Pygments can't determine the language, we default to 'unknown'
-        language = 'unknown'
-
-    analysis_results = {'language': language}
+    detected, confidence = detect_code_language(code_snippet, request.json.get('filename'))
+    language = detected.lower()
+    analysis_results = {'language': language, 'confidence': confidence}
 
     # Now, based on the detected language, call the appropriate analysis function
     if language == 'python':
@@ -1256,21 +3876,32 @@ def analyze_code():
 
 # A sample analysis function that can be implemented for a specific language
 def analyze_python_code(code):
-    # This is where you'd integrate tools like Radon or Pylint
-    # Example using Radon (you would need to write code to execute and parse)
-    # import subprocess
-    # with open('temp_code.py', 'w') as f:
-    #     f.write(code)
-    # result = subprocess.run(['radon', 'cc', 'temp_code.py'], capture_output=True, text=True)
-    # ... and so on
+    """Metrics from python_metrics plus suggestions derived from them"""
+    try:
+        metrics = python_metrics(code)
+    except (SyntaxError, ValueError) as e:
+        return {'error': f'Python code could not be parsed: {e}'}
+
+    suggestions = []
+    complex_functions = [f"{block['name']} ({block['complexity']})" for block in metrics['functions']
+                         if block['rank'] not in ('A', 'B')]
+    if complex_functions:
+        suggestions.append(f"Split up functions with high cyclomatic complexity: {', '.join(complex_functions)}.")
+    undocumented = [block['name'] for block in metrics['functions'] if not block['has_docstring']]
+    if undocumented:
+        suggestions.append(f"Add docstrings to functions: {', '.join(undocumented)}.")
+    if metrics['maintainability_rank'] != 'A':
+        suggestions.append('Maintainability index is low; reduce function size and nesting.')
     return {
-        'complexity': 10,
-        'maintainability': 85,
-        'suggestions': ['Add docstrings to functions.']
+        'complexity': metrics['complexity'],
+        'maintainability': metrics['maintainability'],
+        'metrics': metrics,
+        'suggestions': suggestions
     }
 
 def analyze_javascript_code(code):
     return {"analysis": "JavaScript code analysis results go here."}
 
 if __name__ == '__main__':
+    init_database()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,411 @@
+"""ASGI entry point for the Flask app, for serving with an ASGI server:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+``/upgrade`` and ``/api/summarize-functions`` spend most of their time
+waiting on the AI API, and masking status long-polls and event streams
+wait on job progress, so they run as coroutines on the event loop and a
+waiting request holds no thread. Their CPU-bound steps, and every other
+route, run on a pool of ``ASGI_THREADS`` threads through the WSGI app.
+Request bodies are received on the loop before a thread is taken, so slow
+uploads do not hold one either. Both kinds of route go through Flask's
+request parsing, JSON responses and CORS handling, so the contracts are
+the same as under a WSGI server.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import sys
+from collections import defaultdict
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from flask import jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from ai_gateway import AIGatewayError
+from app import (
+    MASK_EVENTS_KEEPALIVE, MASK_JOB_TERMINAL_STATES, MASK_STATUS_MAX_WAIT, UPGRADE_STEPS, add_ai_summaries,
+    add_job_listener, ai_gateway, ai_summary_warning, app as flask_app, docstring_targets, event_stream_response,
+    init_database, insert_docstrings, job_event, load_function_summaries, local_job_changed, masking_jobs,
+    missing_summary_items, processed_file_writer, remove_job_listener, safe_job_status, save_function_summaries,
+    static_summary_results, summary_items, summary_results
+)
+
+logger = logging.getLogger(__name__)
+
+# Threads for WSGI routes and CPU-bound steps of the native routes
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '32'))
+# Request bodies above this size are spooled to disk while they are received
+ASGI_SPOOL_MAX_BYTES = 64 * 1024
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+
+
+def run_sync(func, *args):
+    """Run a blocking call on the thread pool and await its result."""
+    return asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args))
+
+
+def _with_app_context(func, *args):
+    with flask_app.app_context():
+        return func(*args)
+
+
+# ===================== WSGI Bridge =====================
+
+# Repeats of one request header accepted before the request is refused
+ASGI_DUPLICATE_HEADER_LIMIT = 100
+
+
+def build_environ(scope, body) -> dict:
+    """Build the WSGI environ for an HTTP scope whose body has been spooled to ``body``."""
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client') is not None:
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    headers = defaultdict(list)
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if len(headers[key]) >= ASGI_DUPLICATE_HEADER_LIMIT:
+            raise ValueError(f"Too many duplicate headers: {key}")
+        headers[key].append(value.decode('latin-1'))
+    environ.update((key, ','.join(values)) for key, values in headers.items())
+    return environ
+
+
+async def _receive_body(receive, body) -> bool:
+    """Spool the request body into ``body``; False if the client went away first."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return False
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            body.seek(0)
+            return True
+
+
+async def _send_bad_request(send, error: ValueError):
+    await send({'type': 'http.response.start', 'status': 400, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': f'Bad Request: {error}'.encode('latin-1')})
+
+
+def _response_start(status: str, headers) -> dict:
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+
+def _run_wsgi(environ, send, loop):
+    """Run the Flask app on a pool thread, sending each chunk it yields as it is produced."""
+    start = {}
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and start.get('sent'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        start['message'] = _response_start(status, headers)
+
+    output = flask_app(environ, start_response)
+    try:
+        for chunk in output:
+            if not start.get('sent'):
+                start['sent'] = True
+                send_sync(start['message'])
+            if chunk:
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not start.get('sent'):
+            send_sync(start['message'])
+        send_sync({'type': 'http.response.body'})
+    finally:
+        # Runs teardown for streamed responses (stream_with_context) and closes generators
+        if hasattr(output, 'close'):
+            output.close()
+
+
+# ===================== Native Coroutine Routes =====================
+
+async def generate_docstrings_async(code: str) -> str:
+    """generate_docstrings_via_openai without holding a thread while the AI answers."""
+    if not ai_gateway.enabled:
+        return code
+    try:
+        source, targets = await run_sync(docstring_targets, code)
+        if not targets:
+            return code
+        docstrings = await ai_gateway.agenerate_docstrings(
+            [{'name': node.name, 'source': source.segment(node)} for node in targets])
+    except (SyntaxError, ValueError, AIGatewayError) as e:
+        logger.warning(f"Docstring generation skipped: {e}")
+        return code
+    return await run_sync(insert_docstrings, source, targets, docstrings)
+
+
+async def generate_ai_summaries_async(code: str, functions=None):
+    """generate_ai_summaries without holding a thread while the AI answers."""
+    items = await run_sync(summary_items, code, functions)
+    model = ai_gateway.model
+    stored = await run_sync(_with_app_context, load_function_summaries, [item['hash'] for item in items], model)
+    missing = missing_summary_items(items, stored)
+    fresh = {}
+    if missing:
+        fresh = dict(zip((item['hash'] for item in missing), await ai_gateway.asummarize_functions(missing)))
+        await run_sync(_with_app_context, save_function_summaries, fresh, model)
+    return summary_results(items, stored, fresh)
+
+
+async def upgrade_code():
+    try:
+        data = request.get_json()
+        code = data.get('code', '')
+        options = data.get('upgradeOptions', [])
+
+        if not code:
+            return jsonify({"error": "No code provided"}), 400
+
+        transformed = code
+        applied = []
+        for name, step in UPGRADE_STEPS:
+            if name in options:
+                if name == 'docs':
+                    transformed = await generate_docstrings_async(transformed)
+                else:
+                    transformed = await run_sync(step, transformed)
+                applied.append(name)
+
+        return jsonify({
+            "original": code,
+            "upgraded": transformed,
+            "applied": applied
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+async def summarize_functions():
+    try:
+        code = request.json['code']
+        analysis_results = await run_sync(static_summary_results, code)
+
+        try:
+            if ai_gateway.enabled:
+                add_ai_summaries(
+                    analysis_results,
+                    await generate_ai_summaries_async(code, analysis_results['data']['summaries'] or None)
+                )
+        except Exception as e:
+            analysis_results['warnings'].append(ai_summary_warning(e))
+
+        return jsonify(analysis_results), 200
+
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e),
+            'data': {},
+            'warnings': []
+        }), 500
+
+
+async def wait_for_job_change(job_id: str, since: float, timeout: float):
+    """app._wait_for_job_change on the event loop, so a waiting long-poll or event stream holds no thread.
+
+    Changes to jobs running in this process are announced by a listener that
+    sets an event on this loop; jobs run by other workers are polled.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    changed = asyncio.Event()
+    listener = partial(loop.call_soon_threadsafe, changed.set)
+    add_job_listener(listener)
+    try:
+        while True:
+            changed.clear()
+            local = local_job_changed(job_id, since)
+            remaining = deadline - loop.time()
+            if local is not False or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        remove_job_listener(listener)
+    if local is not None:
+        return await run_sync(masking_jobs.get, job_id)
+    while True:
+        job = await run_sync(masking_jobs.get, job_id)
+        if job is None or job.get('updated_ts', 0) > since or job['status'] in MASK_JOB_TERMINAL_STATES:
+            return job
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return job
+        await asyncio.sleep(min(remaining, 0.25))
+
+
+async def masking_status(job_id):
+    job = await run_sync(masking_jobs.get, job_id)
+    if not job:
+        return jsonify({'error': 'not_found'}), 404
+    wait = min(request.args.get('wait', 0, type=float), MASK_STATUS_MAX_WAIT)
+    if wait > 0:
+        since = request.args.get('since', job.get('updated_ts', 0), type=float)
+        job = await wait_for_job_change(job_id, since, wait)
+        if not job:
+            return jsonify({'error': 'not_found'}), 404
+    return jsonify(safe_job_status(job))
+
+
+async def masking_events(job_id):
+    if not await run_sync(masking_jobs.get, job_id):
+        return jsonify({'error': 'not_found'}), 404
+
+    async def events():
+        since, finished = -1.0, False
+        while not finished:
+            event, since, finished = job_event(await wait_for_job_change(job_id, since, MASK_EVENTS_KEEPALIVE), since)
+            yield event
+
+    # _serve_native sends an async iterator body as it is produced
+    return event_stream_response(events())
+
+
+# (method, Flask endpoint) -> coroutine taking the route's view arguments
+NATIVE_ROUTES = {
+    ('POST', 'upgrade_code'): upgrade_code,
+    ('POST', 'summarize_functions'): summarize_functions,
+    ('GET', 'masking_status'): masking_status,
+    ('GET', 'masking_events'): masking_events,
+}
+
+
+def _native_route(environ):
+    """The native handler and view arguments for a request, or (None, None) to serve it through WSGI."""
+    try:
+        endpoint, view_args = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None, None
+    return NATIVE_ROUTES.get((environ['REQUEST_METHOD'], endpoint)), view_args
+
+
+async def _send_stream(chunks, receive, send):
+    """Send an async iterator of str chunks until it ends or the client disconnects."""
+    async def pump():
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body'})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(pump())
+    watching = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait((streaming, watching), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        streaming.cancel()
+        watching.cancel()
+        # The generator can only be closed once the task iterating it has stopped
+        await asyncio.gather(streaming, watching, return_exceptions=True)
+        await chunks.aclose()
+    if not streaming.cancelled():
+        streaming.result()
+
+
+async def _serve_native(handler, view_args, environ, receive, send):
+    # Flask's contexts are context variables, so each request task sees its own across awaits
+    with flask_app.request_context(environ):
+        # The same error handling as Flask.full_dispatch_request and Flask.wsgi_app
+        try:
+            try:
+                response = flask_app.preprocess_request()
+                if response is None:
+                    response = await handler(**view_args)
+            except Exception as e:
+                response = flask_app.handle_user_exception(e)
+            response = flask_app.finalize_request(response)
+        except Exception as e:
+            response = flask_app.handle_exception(e)
+        stream = response.response if hasattr(response.response, '__aiter__') else None
+        payload = None if stream is not None else response.get_data()
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    })
+    if stream is not None:
+        await _send_stream(stream, receive, send)
+    else:
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await asyncio.get_running_loop().run_in_executor(None, init_database)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Commit queued ProcessedFile rows before the server exits
+            await asyncio.get_running_loop().run_in_executor(None, processed_file_writer.close)
+            _executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+    with SpooledTemporaryFile(max_size=ASGI_SPOOL_MAX_BYTES) as body:
+        if not await _receive_body(receive, body):
+            return
+        try:
+            environ = build_environ(scope, body)
+        except ValueError as e:
+            await _send_bad_request(send, e)
+            return
+        handler, view_args = _native_route(environ)
+        if handler is not None:
+            await _serve_native(handler, view_args, environ, receive, send)
+        else:
+            await run_sync(_run_wsgi, environ, send, asyncio.get_running_loop())
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,217 @@
+"""Exercise the AI gateway against a local stub of the chat completions API.
+
+Run from the Backend directory:
+    python benchmarks/bench_ai_gateway.py [requests]
+
+The stub answers every prompt after STUB_LATENCY seconds with one JSON
+entry per function, fails the first attempt of any prompt containing
+"flaky", and records how many calls it served and how many overlapped.
+The checks cover batching, caching, retry, the in-flight limit, a batch
+shared by concurrent coroutines and docstring insertion. The timings compare concurrent /api/summarize-functions
+style requests made the old way (a fresh client and one call per file,
+no cache) with the gateway, starting from an empty summary store and then
+warm.
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import openai  # noqa: E402
+
+import app  # noqa: E402
+from ai_gateway import AIGateway, AIGatewayBusy  # noqa: E402
+
+STUB_LATENCY = 0.2
+_FUNCTION_HEADER_RE = re.compile(r'^### Function \d+: (\S+)$', re.MULTILINE)
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.prompt_chars = 0
+        self.seen = set()
+
+    def reset(self):
+        with self.lock:
+            self.calls = self.in_flight = self.peak = self.prompt_chars = 0
+            self.seen.clear()
+
+
+STATE = StubState()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        system, user = body['messages'][0]['content'], body['messages'][-1]['content']
+        with STATE.lock:
+            STATE.calls += 1
+            STATE.prompt_chars += len(system) + len(user)
+            STATE.in_flight += 1
+            STATE.peak = max(STATE.peak, STATE.in_flight)
+            first_attempt = user not in STATE.seen
+            STATE.seen.add(user)
+        try:
+            time.sleep(STUB_LATENCY)
+            if 'flaky' in user and first_attempt:
+                return self._reply(500, {'error': {'message': 'stub failure', 'type': 'server_error'}})
+            names = _FUNCTION_HEADER_RE.findall(user) or ['<module>']
+            if 'docstring' in system:
+                entries = [{'name': name, 'docstring': f'Does {name}.\n\nReturns:\n    Nothing.'} for name in names]
+            else:
+                entries = [{'name': name, 'summary': f'{name} summary', 'suggestions': [], 'complexity': 'low'}
+                           for name in names]
+            self._reply(200, {
+                'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': json.dumps({'functions': entries})}}]
+            })
+        finally:
+            with STATE.lock:
+                STATE.in_flight -= 1
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_file(index, functions=8):
+    return ''.join(f'def f{index}_{i}(x):\n    return x + {i}\n\n\n' for i in range(functions))
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def run_checks(base_url):
+    failures = 0
+    gateway = AIGateway(api_key='stub', base_url=base_url, max_concurrency=2, queue_timeout=0.05)
+    app.ai_gateway = gateway
+
+    STATE.reset()
+    summaries = app.generate_ai_summaries(make_file(0))
+    failures = check('8 functions of one file share one call', STATE.calls == 1 and len(summaries) == 8, failures)
+    app.generate_ai_summaries(make_file(0) + 'def extra():\n    pass\n')
+    failures = check('edited file only sends the new function', STATE.calls == 2, failures)
+
+    STATE.reset()
+    gateway.summarize_functions([{'name': 'flaky', 'source': 'def flaky(): pass'}])
+    failures = check('a 500 is retried', STATE.calls == 2, failures)
+
+    STATE.reset()
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        outcomes = list(pool.map(
+            lambda i: _busy_or_done(gateway, [{'name': f'g{i}', 'source': f'def g{i}(): pass'}]), range(8)))
+    failures = check('in-flight calls stay within the limit and extra callers are turned away',
+                     STATE.peak <= 2 and 'busy' in outcomes, failures)
+
+    STATE.reset()
+    items = [{'name': 'twice', 'source': 'def twice(x):\n    return 2 * x\n'}]
+
+    async def duplicates():
+        return await asyncio.gather(gateway.asummarize_functions(items), gateway.asummarize_functions(items))
+
+    first, second = asyncio.run(duplicates())
+    failures = check('concurrent identical coroutine calls share one call and both get the summary',
+                     STATE.calls == 1 and first == second and first[0]['summary'] == 'twice summary', failures)
+
+    code = 'class A:\n    def m(self, v):\n        return v\n\n\ndef f():\n    """Has one."""\n    pass\n'
+    documented = app.generate_docstrings_via_openai(code)
+    failures = check('docstrings are inserted only where missing',
+                     documented.count('"""') == 4 and '        """Does m.' in documented
+                     and compile(documented, '<doc>', 'exec') is not None, failures)
+    code = 'def outer():\n    @staticmethod\n    def inner():\n        pass\n    return inner\n'
+    documented = app.generate_docstrings_via_openai(code)
+    failures = check('a docstring goes above the decorators of a nested def',
+                     '    """Does outer.' in documented.split('@staticmethod')[0]
+                     and compile(documented, '<doc>', 'exec') is not None, failures)
+    return failures
+
+
+def _busy_or_done(gateway, items):
+    try:
+        gateway.summarize_functions(items)
+        return 'done'
+    except AIGatewayBusy:
+        return 'busy'
+
+
+def legacy_summary(base_url, code):
+    """The previous generate_ai_summaries: a new client per request and no cache or limit."""
+    client = openai.OpenAI(api_key='stub', base_url=base_url)
+    return client.chat.completions.create(
+        model='gpt-4-turbo',
+        messages=[{'role': 'system', 'content': 'Analyze this code'}, {'role': 'user', 'content': code}],
+        temperature=0.2
+    ).choices[0].message.content
+
+
+def in_app_context(func):
+    def run(*args):
+        with app.app.app_context():
+            return func(*args)
+    return run
+
+
+def clear_summary_store():
+    with app.app.app_context():
+        app.db.session.query(app.FunctionSummary).delete()
+        app.db.session.commit()
+
+
+def timed(func, files, concurrency=8):
+    STATE.reset()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(in_app_context(func), files))
+    return time.perf_counter() - start, STATE.calls
+
+
+def main():
+    app.init_database()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/v1'
+
+    failures = in_app_context(run_checks)(base_url)
+    clear_summary_store()
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    # Half the requests repeat a file already asked about, as when users re-run analysis
+    files = [make_file(i % (count // 2)) for i in range(count)]
+    app.ai_gateway = AIGateway(api_key='stub', base_url=base_url, max_concurrency=8, queue_timeout=30)
+    print(f"\n{count} requests, 8 concurrent, stub latency {STUB_LATENCY * 1000:.0f} ms")
+    print(f"{'':24} {'seconds':>8} {'API calls':>10}")
+    for name, func in (('legacy client per call', lambda code: legacy_summary(base_url, code)),
+                       ('gateway cold', app.generate_ai_summaries),
+                       ('gateway warm', app.generate_ai_summaries)):
+        elapsed, calls = timed(func, files)
+        print(f"{name:24} {elapsed:8.2f} {calls:10}")
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Check analyze_python_functions on a small corpus and time it on large generated modules.
+
+Run from the Backend directory:
+    python benchmarks/bench_analyze_functions.py [functions]
+
+The corpus pins down signatures (async defs, keyword-only and variadic
+parameters) and innermost-function attribution of side effects. The
+timings compare the single-pass analyzer with the previous one, which
+walked every function's whole subtree again for each enclosing function.
+"""
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import PythonSource, _collect_functions, analyze_python_functions  # noqa: E402
+
+# (source, [(name, inputs, side_effects), ...] in source order)
+CORPUS = [
+    ('def f(a, /, b: int = 1, *args, c, **kw) -> None:\n    print(a)\n',
+     [('f', ['a', 'b', '*args', 'c', '**kw'], ['print'])]),
+    ('async def fetch(url, *, timeout=5):\n    return await get(url)\n',
+     [('fetch', ['url', 'timeout'], [])]),
+    ('count = 0\ndef outer():\n    global count\n    def inner():\n        open("f").write("x")\n    return inner\n',
+     [('outer', [], ['count']), ('inner', [], ['write', 'open'])]),
+    ('class C:\n    @decorate(print)\n    def m(self):\n        sys.stdout.write("x")\n',
+     [('m', ['self'], ['write'])]),
+]
+
+
+def check_corpus():
+    failures = 0
+    for source, expected in CORPUS:
+        actual = [(info['name'], [p['name'] for p in info['inputs']], info['side_effects'])
+                  for info in analyze_python_functions(source)]
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH\n  source:   {source!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+    print(f"corpus: {len(CORPUS) - failures}/{len(CORPUS)} passed")
+    return failures
+
+
+def legacy_analyze(tree):
+    """The previous per-function ast.walk analyzer, kept as the baseline.
+
+    Its Call branch read ``child.value``, which Call nodes do not have; it is
+    corrected to ``child.func`` here so the baseline completes at all.
+    """
+    functions = []
+
+    class FunctionAnalyzer(ast.NodeVisitor):
+        def visit_FunctionDef(self, node):
+            info = {'name': node.name, 'inputs': [{'name': arg.arg} for arg in node.args.args]}
+            side_effects = set()
+            for child in ast.walk(node):
+                if isinstance(child, ast.Global):
+                    side_effects.update(child.names)
+                elif isinstance(child, ast.Call):
+                    if isinstance(child.func, ast.Name) and child.func.id in ['print', 'open']:
+                        side_effects.add(child.func.id)
+                    elif isinstance(child.func, ast.Attribute) and child.func.attr in ['write', 'read']:
+                        side_effects.add(child.func.attr)
+            info['side_effects'] = list(side_effects)
+            functions.append(info)
+            self.generic_visit(node)
+
+    FunctionAnalyzer().visit(tree)
+    return functions
+
+
+def flat_module(count):
+    return ''.join(
+        f'def f{i}(a, b=1, *, c=None):\n    x = a + b\n    if x > {i}:\n        print(x)\n    return open("f").read()\n\n'
+        for i in range(count)
+    )
+
+
+def nested_module(count, depth=60):
+    """``count`` top-level functions, each a chain of ``depth`` nested functions."""
+    chunks = []
+    for i in range(count):
+        for level in range(depth):
+            pad = '    ' * level
+            chunks.append(f'{pad}def g{i}_{level}(v):\n{pad}    w = [v, v + 1, str(v)]\n{pad}    print(w)\n')
+        chunks.append('    ' * depth + 'return v\n')
+    return ''.join(chunks)
+
+
+def best_of(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    failures = check_corpus()
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'module':28} {'functions':>9} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    for name, code in (('flat', flat_module(count)), ('nested depth 60', nested_module(count // 60 or 1))):
+        tree = PythonSource(code).tree  # both analyzers are timed on an already parsed tree
+        functions = len(legacy_analyze(tree))
+        legacy = best_of(lambda: legacy_analyze(tree))
+        single = best_of(lambda: [_collect_functions(statement, []) for statement in tree.body])
+        print(f"{name:28} {functions:9} {legacy * 1000:10.1f} {single * 1000:15.1f} {legacy / single:8.1f}x")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
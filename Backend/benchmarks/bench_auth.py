@@ -0,0 +1,120 @@
+"""Time the authentication path of /api/shorten and jwt_required routes with the token and identity caches.
+
+Run from the Backend directory:
+    python benchmarks/bench_auth.py [requests]
+
+The checks cover a cached token expiring on time, a tampered token,
+logout and revoking a user's tokens, including in a worker that starts
+with empty caches, and the identity cache following a revocation. The
+timings call the auth functions directly: the old path of
+_get_current_user_optional (verify the HS256 signature, then load the User
+in a fresh session, as each request had) against ``authenticate`` with
+warm caches.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import jwt  # noqa: E402
+
+import app  # noqa: E402
+
+
+def login(client, email):
+    return client.post('/api/auth/login', json={'email': email, 'password': 'secret'}).get_json()['token']
+
+
+def old_current_user(token):
+    """The previous _get_current_user_optional: a signature check and a query on every request."""
+    data = jwt.decode(token, app.app.config['SECRET_KEY'], algorithms=["HS256"])
+    user = app.db.session.get(app.User, int(data.get('user_id')))
+    app.db.session.remove()
+    return user
+
+
+def authorized(client, token):
+    return client.get('/api/snippets', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+
+def fresh_worker():
+    """Forget everything this process cached, as a newly started worker would have."""
+    app._verified_tokens.clear()
+    app._user_identities.clear()
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def per_call(func, token, count):
+    with app.app.app_context():
+        func(token)
+        start = time.perf_counter()
+        for _ in range(count):
+            func(token)
+        return (time.perf_counter() - start) / count
+
+
+def main():
+    app.init_database()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    client = app.app.test_client()
+    failures = 0
+    for email in ('bench@example.com', 'other@example.com'):
+        client.post('/api/auth/register', json={'email': email, 'password': 'secret'})
+    token = login(client, 'bench@example.com')
+    with app.app.app_context():
+        user_id = app.User.query.filter_by(email='bench@example.com').one().id
+
+    failures = check('a login token authorizes requests, twice from the cache',
+                     authorized(client, token) and authorized(client, token), failures)
+    short_lived = jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(seconds=1)},
+                             app.app.config['SECRET_KEY'], algorithm='HS256')
+    fresh = authorized(client, short_lived)
+    time.sleep(2)
+    failures = check('a cached token is rejected once it expires', fresh and not authorized(client, short_lived),
+                     failures)
+    tampered = token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')
+    failures = check('a tampered token is rejected', not authorized(client, tampered), failures)
+
+    other = login(client, 'other@example.com')
+    second = login(client, 'other@example.com')
+    authorized(client, other)
+    client.post('/api/auth/logout', headers={'Authorization': f'Bearer {other}'})
+    logged_out = not authorized(client, other)
+    fresh_worker()
+    failures = check('logout rejects that token, also in a fresh worker, and keeps other sessions',
+                     logged_out and not authorized(client, other) and authorized(client, second), failures)
+
+    with app.app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        before = app._get_current_user_optional()
+    with app.app.app_context():
+        app.db.session.get(app.User, user_id).email = 'renamed@example.com'
+        app.db.session.commit()
+    time.sleep(1)
+    with app.app.app_context():
+        app.revoke_user(user_id)
+    renewed = login(client, 'renamed@example.com')
+    with app.app.test_request_context(headers={'Authorization': f'Bearer {renewed}'}):
+        after = app._get_current_user_optional()
+    revoked = not authorized(client, token) and authorized(client, renewed)
+    fresh_worker()
+    failures = check('revoke_user rejects older tokens, also in a fresh worker, and new ones carry the fresh identity',
+                     revoked and not authorized(client, token) and authorized(client, renewed)
+                     and before.email == 'bench@example.com' and after.email == 'renamed@example.com', failures)
+
+    old = per_call(old_current_user, renewed, count)
+    new = per_call(app.authenticate, renewed, count)
+    print(f"\n{count} calls; microseconds per call")
+    print(f"{'old: verify + query':28} {old * 1e6:8.1f}")
+    print(f"{'authenticate, cached':28} {new * 1e6:8.1f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Compare storing /api/shorten results inline with the content-addressed blob store.
+
+Run from the Backend directory:
+    python benchmarks/bench_blob_store.py [requests]
+
+Replays ``requests`` submissions (2,000 by default) drawn with a skewed
+distribution from 60 standard library modules, so popular files are
+submitted many times, as with pasted snippets. Each submission is
+persisted the old way, as a ProcessedFile row holding both texts, and
+through ``save_processed_file``. The checks read every row back and count
+blobs. The report gives database growth and milliseconds per insert, for
+content seen for the first time and for repeats.
+"""
+import os
+import random
+import sys
+import sysconfig
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import text  # noqa: E402
+
+import app  # noqa: E402
+
+MODULES = 60
+
+
+def corpus():
+    stdlib = sysconfig.get_paths()['stdlib']
+    names = sorted(name for name in os.listdir(stdlib) if name.endswith('.py'))
+    files = []
+    for name in names:
+        with open(os.path.join(stdlib, name), encoding='utf-8', errors='surrogateescape') as f:
+            source = f.read()
+        if 2_000 <= len(source) <= 60_000:
+            files.append(source)
+        if len(files) == MODULES:
+            break
+    return [(source, app.minify_python(source)) for source in files]
+
+
+def database_bytes():
+    page_size = app.db.session.execute(text('PRAGMA page_size')).scalar()
+    return app.db.session.execute(text('PRAGMA page_count')).scalar() * page_size
+
+
+def old_insert(original, shortened):
+    """The previous /api/shorten persistence, including reading back the id it returns."""
+    processed_file = app.ProcessedFile(original_inline=original, shortened_inline=shortened, language='python')
+    app.db.session.add(processed_file)
+    app.db.session.commit()
+    return processed_file.id
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def main():
+    app.init_database()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    files = corpus()
+    rng = random.Random(7)
+    picks = rng.choices(range(len(files)), weights=[1 / (i + 1) for i in range(len(files))], k=count)
+    failures = 0
+    with app.app.app_context():
+        start_bytes = database_bytes()
+        start = time.perf_counter()
+        for index in picks:
+            old_insert(*files[index])
+        old_seconds = time.perf_counter() - start
+        old_bytes = database_bytes() - start_bytes
+
+        start_bytes = database_bytes()
+        seen, first, repeat, ids = set(), [], [], []
+        for index in picks:
+            start = time.perf_counter()
+            ids.append((index, app.save_processed_file(None, *files[index], 'python')))
+            (repeat if index in seen else first).append(time.perf_counter() - start)
+            seen.add(index)
+        new_bytes = database_bytes() - start_bytes
+
+        app.db.session.expire_all()
+        failures = check('every row reads back its original and shortened text', all(
+            (row.original, row.shortened) == files[index]
+            for index, row in ((index, app.db.session.get(app.ProcessedFile, file_id)) for index, file_id in ids)
+        ), failures)
+        unique_texts = {text for index in seen for text in files[index]}
+        failures = check('one blob per distinct text',
+                         app.db.session.query(app.ContentBlob).count() == len(unique_texts), failures)
+
+    print(f"\n{count} submissions of {len(seen)} distinct files, compression {app.BLOB_COMPRESSION}")
+    print(f"{'':26} {'DB growth MB':>12} {'ms/insert':>10}")
+    print(f"{'inline rows':26} {old_bytes / 1e6:12.2f} {old_seconds / count * 1000:10.3f}")
+    print(f"{'blob store, first seen':26} {'':12} {sum(first) / len(first) * 1000:10.3f}")
+    print(f"{'blob store, repeat':26} {'':12} {sum(repeat) / max(len(repeat), 1) * 1000:10.3f}")
+    print(f"{'blob store, all':26} {new_bytes / 1e6:12.2f} {(sum(first) + sum(repeat)) / count * 1000:10.3f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Time GET /api/comments/<file_id> on a popular file.
+
+Run from the Backend directory:
+    python benchmarks/bench_comments.py [comments]
+
+Seeds one file with ``comments`` comments (5,000 by default), many sharing
+a timestamp, next to 100,000 comments on other files. The checks walk
+every page, confirm that SQLite lists a file from ``ix_comments_file_created``
+without sorting, that an unchanged page revalidates with a 304, and that
+a new comment is listed immediately. The timings compare the old listing
+of every comment with a page read from the database, from the page cache,
+and revalidated by ETag.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import jwt  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import app  # noqa: E402
+
+OTHER_COMMENTS = 100_000
+
+
+def seed(count):
+    user = app.User(email='bench@example.com')
+    user.set_password('bench')
+    app.db.session.add(user)
+    app.db.session.commit()
+    files = [app.save_processed_file(None, 'x = 1', 'x=1', 'python') for _ in range(100)]
+    base = datetime(2024, 1, 1)
+    hot = files[0]
+    rows = [{'file_id': hot, 'username': 'bench', 'comment': f'comment {i}',
+             'created_at': base + timedelta(seconds=i // 5)} for i in range(count)]
+    rows += [{'file_id': files[1 + i % 99], 'username': 'bench', 'comment': f'other {i}',
+              'created_at': base + timedelta(seconds=i)} for i in range(OTHER_COMMENTS)]
+    app.db.session.execute(app.Comment.__table__.insert(), rows)
+    app.db.session.commit()
+    return user.id, hot
+
+
+def old_listing(file_id):
+    """The previous list_comments: every comment of the file, sorted by the database."""
+    comments = app.Comment.query.filter_by(file_id=file_id).order_by(app.Comment.created_at.desc()).all()
+    return app.json.dumps([{'id': c.id, 'file_id': c.file_id, 'username': c.username, 'comment': c.comment,
+                            'timestamp': c.created_at.isoformat() + 'Z'} for c in comments])
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def best_of(func, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    app.init_database()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    client = app.app.test_client()
+    failures = 0
+    with app.app.app_context():
+        user_id, hot = seed(count)
+        plan = app.db.session.execute(text(
+            f"EXPLAIN QUERY PLAN SELECT * FROM comments WHERE file_id = {hot} AND created_at <= '2024-02-01' AND "
+            "(created_at < '2024-02-01' OR (created_at = '2024-02-01' AND id < 10)) "
+            "ORDER BY created_at DESC, id DESC LIMIT 51")).all()
+        failures = check('listing is served by ix_comments_file_created without a sort',
+                         any('ix_comments_file_created' in str(row) for row in plan)
+                         and not any('TEMP B-TREE' in str(row) for row in plan), failures)
+    url = f'/api/comments/{hot}'
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url, query_string={'limit': 200, **({'cursor': cursor} if cursor else {})})
+        seen.extend(comment['id'] for comment in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        pages += 1
+        if not cursor:
+            break
+    failures = check(f'walking {pages} pages returns each comment once, newest first',
+                     len(seen) == count and len(set(seen)) == count and seen == sorted(seen, reverse=True), failures)
+
+    first = client.get(url)
+    etag = first.headers['ETag']
+    failures = check('an unchanged page revalidates with a 304',
+                     client.get(url, headers={'If-None-Match': etag}).status_code == 304, failures)
+    token = jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       app.app.config['SECRET_KEY'], algorithm='HS256')
+    created = client.post('/api/comments', json={'file_id': hot, 'comment': 'fresh'},
+                          headers={'Authorization': f'Bearer {token}'}).get_json()
+    after = client.get(url, headers={'If-None-Match': etag})
+    failures = check('a new comment is listed at once with a new ETag',
+                     after.status_code == 200 and after.get_json()[0]['id'] == created['id'], failures)
+
+    def cold_page():
+        app.comment_pages.invalidate(hot)
+        client.get(url)
+
+    print(f"\n{'':34} {'ms':>8} {'bytes':>9}")
+    with app.app.app_context():
+        print(f"{'old: every comment':34} {best_of(lambda: old_listing(hot), 5) * 1000:8.2f} "
+              f"{len(old_listing(hot)):9}")
+    for name, func, size in (
+            ('page of 50 from the database', cold_page, len(first.data)),
+            ('page of 50 from the cache', lambda: client.get(url), len(first.data)),
+            ('revalidated by ETag (304)', lambda: client.get(url, headers={'If-None-Match': after.headers['ETag']}), 0)):
+        print(f"{name:34} {best_of(func) * 1000:8.2f} {size:9}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
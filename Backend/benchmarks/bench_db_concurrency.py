@@ -0,0 +1,135 @@
+"""Compare the old SQLite journal settings with WAL under concurrent reads and writes from several processes.
+
+Run from the Backend directory:
+    python benchmarks/bench_db_concurrency.py [seconds]
+
+For each configuration a fresh database file is shared by 4 processes of
+8 threads each, like gunicorn workers sharing app.db. For ``seconds``
+(5 by default) each thread sends a mix of requests through the Flask test
+client: 70% GET /api/comments/<file_id> with the page cache disabled,
+15% POST /api/comments and 15% POST /api/shorten with new code. The report
+gives throughput, 99th percentile latency of reads and writes, and failed
+requests, which were "database is locked" errors.
+"""
+import concurrent.futures
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSES = 4
+THREADS = 8
+CONFIGS = (
+    ('rollback journal, FULL', {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'}),
+    ('WAL, NORMAL (default)', {}),
+)
+
+
+def setup():
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    app.init_database()
+    with app.app.app_context():
+        user = app.User(email='bench@example.com')
+        user.set_password('bench')
+        app.db.session.add(user)
+        app.db.session.commit()
+        user_id = user.id
+        file_id = app.save_processed_file(user_id, 'x = 1', 'x=1', 'python')
+        for i in range(200):
+            app.db.session.add(app.Comment(file_id=file_id, username='bench', comment=f'seed {i}'))
+        app.db.session.commit()
+    print(json.dumps({'user_id': user_id, 'file_id': file_id}))
+
+
+def worker(seconds, user_id, file_id, process):
+    sys.path.insert(0, BACKEND_DIR)
+    from datetime import datetime, timedelta
+
+    import jwt
+
+    import app
+    token = jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       app.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    deadline = time.monotonic() + seconds
+
+    def run(thread):
+        client = app.app.test_client()
+        rng = random.Random(process * 100 + thread)
+        reads, writes, errors, n = [], [], 0, 0
+        while time.monotonic() < deadline:
+            n += 1
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < 0.70:
+                response = client.get(f'/api/comments/{file_id}')
+                latencies = reads
+            elif roll < 0.85:
+                response = client.post('/api/comments', json={'file_id': file_id, 'comment': f'c {process} {thread} {n}'},
+                                       headers=headers)
+                latencies = writes
+            else:
+                code = f'def f_{process}_{thread}_{n}(x):\n    # note\n    return x\n'
+                response = client.post('/api/shorten', json={'code': code, 'lang': 'python'})
+                latencies = writes
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        return reads, writes, errors
+
+    with concurrent.futures.ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(run, range(THREADS)))
+    print(json.dumps({
+        'reads': [latency for result in results for latency in result[0]],
+        'writes': [latency for result in results for latency in result[1]],
+        'errors': sum(result[2] for result in results)
+    }))
+
+
+def run_config(seconds, overrides, db_path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', COMMENT_CACHE_TTL='0', **overrides)
+    ids = json.loads(subprocess.run([sys.executable, __file__, '--setup'], cwd=BACKEND_DIR, env=env,
+                                    capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1])
+    children = [subprocess.Popen([sys.executable, __file__, '--worker', str(seconds), str(ids['user_id']),
+                                  str(ids['file_id']), str(p)], cwd=BACKEND_DIR, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                for p in range(PROCESSES)]
+    reads, writes, errors = [], [], 0
+    for child in children:
+        out, _ = child.communicate()
+        result = json.loads(out.strip().splitlines()[-1])
+        reads += result['reads']
+        writes += result['writes']
+        errors += result['errors']
+    return sorted(reads), sorted(writes), errors
+
+
+def p99(latencies):
+    return latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{PROCESSES} processes x {THREADS} threads for {seconds:g} s")
+    print(f"{'':24} {'reads/s':>8} {'writes/s':>9} {'read p99 ms':>12} {'write p99 ms':>13} {'errors':>7}")
+    failures = 0
+    with tempfile.TemporaryDirectory(dir=BACKEND_DIR) as tmp:
+        for index, (name, overrides) in enumerate(CONFIGS):
+            reads, writes, errors = run_config(seconds, overrides, os.path.join(tmp, f'bench{index}.db'))
+            print(f"{name:24} {len(reads) / seconds:8.0f} {len(writes) / seconds:9.0f} {p99(reads):12.1f} "
+                  f"{p99(writes):13.1f} {errors:7}")
+            failures += bool(errors) and not overrides
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--setup']:
+        setup()
+    elif sys.argv[1:2] == ['--worker']:
+        worker(float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        main()
@@ -0,0 +1,146 @@
+"""Check detect_code_language against a labelled corpus and measure its throughput.
+
+Run from the Backend directory:
+    python benchmarks/bench_detect_language.py [repeat]
+
+Every corpus snippet is detected from its content alone; the script exits
+non-zero if accuracy drops below MIN_ACCURACY. Detections per second are
+reported next to the substring detector and the Pygments guesser it replaced.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import detect_code_language  # noqa: E402
+
+MIN_ACCURACY = 0.9
+
+# (language, snippet)
+CORPUS = [
+    ('Python', 'import os\nfrom pathlib import Path\n\n\ndef walk(root):\n    for path in Path(root).iterdir():\n'
+               '        if path.is_dir():\n            yield from walk(path)\n        else:\n            yield path\n'),
+    ('Python', 'class Stack:\n    def __init__(self):\n        self.items = []\n\n    def pop(self):\n'
+               '        if not self.items:\n            raise IndexError("empty")\n        return self.items.pop()\n'),
+    ('Python', '@app.route("/x")\ndef view():\n    try:\n        return load(None)\n    except KeyError as e:\n'
+               '        logger.error(e)\n        return {"ok": False}\n'),
+    ('JavaScript', 'const express = require("express");\nconst app = express();\n\napp.get("/", (req, res) => {\n'
+                   '  res.send("hello");\n});\nmodule.exports = app;\n'),
+    ('JavaScript', 'function debounce(fn, wait) {\n  let timer;\n  return function (...args) {\n'
+                   '    clearTimeout(timer);\n    timer = setTimeout(() => fn.apply(this, args), wait);\n  };\n}\n'),
+    ('JavaScript', 'document.querySelector("#btn").addEventListener("click", () => {\n'
+                   '  if (window.data === undefined) console.log("missing");\n});\n'),
+    ('TypeScript', 'interface User {\n  id: number;\n  name: string;\n}\n\nexport function greet(user: User): string {\n'
+                   '  return `hi ${user.name}`;\n}\n'),
+    ('TypeScript', 'import type { Config } from "./config";\n\nexport class Store<T> {\n'
+                   '  private readonly items: T[] = [];\n  add(item: T): void {\n    this.items.push(item);\n  }\n}\n'),
+    ('Java', 'package com.example;\n\nimport java.util.List;\n\npublic class Main {\n'
+             '    public static void main(String[] args) {\n        System.out.println("Hello");\n    }\n}\n'),
+    ('Java', 'public interface Shape {\n    double area();\n}\n\nclass Circle implements Shape {\n'
+             '    private final double r;\n    @Override\n    public double area() { return Math.PI * r * r; }\n}\n'),
+    ('C', '#include <stdio.h>\n#include <stdlib.h>\n\nint main(void) {\n    char *buf = malloc(64);\n'
+          '    if (buf == NULL) return 1;\n    printf("%s\\n", buf);\n    free(buf);\n    return 0;\n}\n'),
+    ('C', 'typedef struct node {\n    int value;\n    struct node *next;\n} node_t;\n\n'
+          'static size_t length(const node_t *n) {\n    size_t len = 0;\n    for (; n; n = n->next) len++;\n'
+          '    return len;\n}\n'),
+    ('C++', '#include <iostream>\n#include <vector>\n\nint main() {\n    std::vector<int> v{1, 2, 3};\n'
+            '    for (auto x : v) std::cout << x << std::endl;\n}\n'),
+    ('C++', 'template <typename T>\nclass Box {\npublic:\n    explicit Box(T v) : value_(v) {}\n'
+            '    T get() const noexcept { return value_; }\nprivate:\n    T value_;\n};\n'),
+    ('C#', 'using System;\nusing System.Linq;\n\nnamespace Demo\n{\n    class Program\n    {\n'
+           '        static void Main(string[] args)\n        {\n            Console.WriteLine("Hello");\n        }\n    }\n}\n'),
+    ('C#', 'public class Person\n{\n    public string Name { get; set; }\n'
+           '    public async Task SaveAsync() => await repo.SaveAsync(this);\n}\n'),
+    ('PHP', '<?php\nnamespace App;\n\nclass Cart {\n    private $items = [];\n\n    public function add($item) {\n'
+            '        $this->items[] = $item;\n        return count($this->items);\n    }\n}\n'),
+    ('PHP', '<?php\nif (isset($_GET["id"])) {\n    $id = (int) $_GET["id"];\n    echo "Item " . $id;\n}\n'),
+    ('Go', 'package main\n\nimport "fmt"\n\nfunc main() {\n\tch := make(chan int)\n'
+           '\tgo func() { ch <- 42 }()\n\tfmt.Println(<-ch)\n}\n'),
+    ('Go', 'func (s *Server) Close() error {\n\tif s.conn == nil {\n\t\treturn nil\n\t}\n'
+           '\tdefer s.mu.Unlock()\n\ts.mu.Lock()\n\terr := s.conn.Close()\n\treturn err\n}\n'),
+    ('Kotlin', 'package demo\n\ndata class User(val id: Int, val name: String)\n\nfun main() {\n'
+               '    val users = listOf(User(1, "a"))\n    users.forEach { println(it.name) }\n}\n'),
+    ('Kotlin', 'class Repo {\n    companion object {\n        lateinit var instance: Repo\n    }\n\n'
+               '    suspend fun load(id: Int): String? = when (id) {\n        0 -> null\n        else -> "x"\n    }\n}\n'),
+    ('Swift', 'import Foundation\n\nstruct Point {\n    var x: Double\n    var y: Double\n}\n\n'
+              'func distance(_ a: Point, _ b: Point) -> Double {\n    return hypot(a.x - b.x, a.y - b.y)\n}\n'),
+    ('Swift', 'func load(name: String?) {\n    guard let name = name else { return }\n    print("Hello, \\(name)")\n}\n'),
+    ('Ruby', 'require "json"\n\nclass Greeter\n  attr_reader :name\n\n  def initialize(name)\n    @name = name\n'
+             '  end\n\n  def greet\n    puts "Hello #{name}"\n  end\nend\n'),
+    ('Ruby', '[1, 2, 3].each do |n|\n  puts n unless n.even?\nend\n'),
+    ('Rust', 'use std::collections::HashMap;\n\nfn main() {\n    let mut counts: HashMap<&str, usize> = HashMap::new();\n'
+             '    *counts.entry("a").or_insert(0) += 1;\n    println!("{:?}", counts);\n}\n'),
+    ('Rust', 'pub struct Stack<T> {\n    items: Vec<T>,\n}\n\nimpl<T> Stack<T> {\n'
+             '    pub fn pop(&mut self) -> Option<T> {\n        self.items.pop()\n    }\n}\n'),
+    ('HTML', '<!DOCTYPE html>\n<html>\n<head><title>Demo</title></head>\n<body>\n'
+             '  <div class="box"><a href="/x">link</a></div>\n</body>\n</html>\n'),
+    ('CSS', 'body {\n  margin: 0;\n  font-family: sans-serif;\n}\n\n.box {\n  padding: 8px 12px;\n'
+            '  border: 1px solid #ccc;\n  color: rgba(0, 0, 0, 0.8) !important;\n}\n'),
+    ('SQL', 'CREATE TABLE users (\n  id INTEGER PRIMARY KEY,\n  name VARCHAR(80) NOT NULL\n);\n\n'
+            'SELECT u.name FROM users u JOIN orders o ON o.user_id = u.id WHERE o.total > 10 ORDER BY u.name;\n'),
+    ('Shell', '#!/bin/bash\nset -e\nfor f in *.log; do\n  echo "$f"\ndone\n'),
+    ('Shell', 'PREFIX=/usr/local\nif [ -d "$PREFIX" ]; then\n  mkdir -p "$PREFIX/bin"\n  chmod 755 "$PREFIX/bin"\nfi\n'),
+]
+
+
+def check_corpus():
+    correct = 0
+    for language, snippet in CORPUS:
+        detected, confidence = detect_code_language(snippet)
+        if detected == language:
+            correct += 1
+        else:
+            print(f"MISDETECTED as {detected} ({confidence:.2f}), expected {language}:\n  {snippet[:60]!r}")
+    accuracy = correct / len(CORPUS)
+    print(f"accuracy: {correct}/{len(CORPUS)} ({accuracy:.0%})")
+    return accuracy
+
+
+def legacy_detect(code):
+    """The substring detector previously used by /detect and the zip pipeline, kept as the baseline."""
+    if 'def ' in code or 'import ' in code or 'print(' in code:
+        return 'Python'
+    elif 'function ' in code or 'const ' in code or 'let ' in code:
+        return 'JavaScript'
+    elif 'public class' in code or 'void ' in code:
+        return 'Java'
+    return 'unknown'
+
+
+def rate(func, snippets, repeat):
+    """Best-of-three detections per second over ``repeat`` passes of ``snippets``."""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for snippet in snippets:
+                func(snippet)
+        best = min(best, time.perf_counter() - start)
+    return repeat * len(snippets) / best
+
+
+def main():
+    accuracy = check_corpus()
+    legacy_correct = sum(legacy_detect(snippet) == language for language, snippet in CORPUS)
+    print(f"legacy substring detector accuracy: {legacy_correct}/{len(CORPUS)}")
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    snippets = [snippet for _, snippet in CORPUS]
+    large = [snippet * (16 * 1024 // len(snippet) + 1) for snippet in snippets]
+    print(f"{'detector':24} {'snippets/s':>11} {'16 KB files/s':>14}")
+    rows = [('legacy substring', legacy_detect), ('detect_code_language', detect_code_language)]
+    try:
+        from pygments.lexers import guess_lexer
+        rows.append(('pygments guess_lexer', guess_lexer))
+    except ImportError:
+        pass
+    for name, func in rows:
+        quick = 1 if name.startswith('pygments') else repeat
+        print(f"{name:24} {rate(func, snippets, quick):11.0f} {rate(func, large, 1):14.0f}")
+    sys.exit(0 if accuracy >= MIN_ACCURACY else 1)
+
+
+if __name__ == '__main__':
+    main()
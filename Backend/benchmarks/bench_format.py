@@ -0,0 +1,115 @@
+"""Check format_code on a small corpus and compare its latency with the black subprocess it replaced.
+
+Run from the Backend directory:
+    python benchmarks/bench_format.py [max_files]
+
+"subprocess" is the previous implementation: write a temp file, run the
+black CLI on it, read it back. "in-process" formats with black's library
+API on a cold cache; "cached" repeats the same sources. The batch rows
+format the standard library's top-level modules inline and through the
+warm worker pool.
+"""
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app  # noqa: E402
+from app import _format_cache, format_batch, format_code, format_uncached  # noqa: E402
+
+# (source, expected output)
+CORPUS = [
+    ("x = {  'a':37,'b':42,\n'c':927}\n", 'x = {"a": 37, "b": 42, "c": 927}\n'),
+    ('def f(a,):\n  return a\n', 'def f(\n    a,\n):\n    return a\n'),
+    ('print("already formatted")\n', 'print("already formatted")\n'),
+    ('def broken(:\n', 'def broken(:\n'),
+]
+
+
+def check_corpus():
+    failures = 0
+    for source, expected in CORPUS:
+        actual = format_code(source)
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH\n  source:   {source!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+    print(f"corpus: {len(CORPUS) - failures}/{len(CORPUS)} passed")
+    return failures
+
+
+def legacy_format(code):
+    """The previous temp file + black CLI implementation, kept as the baseline."""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp:
+        temp.write(code)
+        temp_path = temp.name
+    try:
+        subprocess.run(['black', '-q', temp_path], check=True)
+        with open(temp_path) as temp:
+            return temp.read()
+    except subprocess.CalledProcessError:
+        return code
+    finally:
+        os.unlink(temp_path)
+
+
+def load_files(limit):
+    paths = sorted(glob.glob(os.path.join(sysconfig.get_paths()['stdlib'], '*.py')))[:limit]
+    sources = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            sources.append(f.read())
+    return sources
+
+
+def latency_ms(func, sources):
+    timings = []
+    for code in sources:
+        start = time.perf_counter()
+        func(code)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    failures = check_corpus()
+
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    sources = load_files(limit)
+    snippets = [code for code in sources if 1024 <= len(code) <= 8192][:10] or sources[:10]
+    print(f"{'per request (1-8 KB files)':30} {'median ms':>10} {'max ms':>8}")
+    rows = [('in-process', format_uncached), ('cached', format_code)]
+    for code in snippets:
+        format_code(code)
+    try:
+        subprocess.run(['black', '--version'], check=True, capture_output=True)
+        rows.insert(0, ('subprocess (previous)', legacy_format))
+    except (OSError, subprocess.CalledProcessError):
+        print("black CLI not on PATH, skipping the subprocess baseline")
+    for name, func in rows:
+        median, worst = latency_ms(func, snippets)
+        print(f"{name:30} {median:10.2f} {worst:8.2f}")
+
+    size_kb = sum(map(len, sources)) / 1024
+    print(f"\nbatch of {len(sources)} stdlib files ({size_kb:.0f} KB)")
+    pool_workers = max(2, app.FORMAT_WORKERS)
+    for name, workers in (('inline', 1), (f'pool ({pool_workers} workers)', pool_workers)):
+        if workers > 1:
+            pool = app._get_format_pool(workers)
+            list(pool.map(format_uncached, ['pass\n'] * workers))  # start the workers
+        _format_cache.clear()
+        start = time.perf_counter()
+        format_batch(sources, workers)
+        elapsed = time.perf_counter() - start
+        print(f"{name:30} {elapsed * 1000:10.0f} ms {len(sources) / elapsed:8.1f} files/s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure how much an edit costs /api/summarize-functions once summaries are stored per function hash.
+
+Run from the Backend directory:
+    python benchmarks/bench_incremental_summaries.py [functions]
+
+A generated module of ``functions`` ten-line functions (3,000 lines by
+default) is summarized against the stub server from bench_ai_gateway.py,
+then summarized again after three kinds of change. Each run uses a fresh
+gateway, so only the persistent summary store carries results over, as
+after a restart or on another worker.
+"""
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app  # noqa: E402
+from ai_gateway import AIGateway  # noqa: E402
+from bench_ai_gateway import STATE, StubHandler  # noqa: E402
+
+
+def make_module(count):
+    return ''.join(
+        f'def handler_{i}(request, retries=3):\n'
+        f'    """Handle request {i}."""\n'
+        f'    for attempt in range(retries):\n'
+        f'        value = request.get("v{i}")\n'
+        f'        if value is not None:\n'
+        f'            return value * {i}\n'
+        f'    return None\n'
+        f'\n\n\n'
+        for i in range(count)
+    )
+
+
+def summarize(base_url, code):
+    app.ai_gateway = AIGateway(api_key='stub', base_url=base_url, max_concurrency=8, queue_timeout=30)
+    STATE.reset()
+    start = time.perf_counter()
+    static = app.analyze_code_structure(code)
+    merged = app.merge_summaries(static, app.generate_ai_summaries(code, static))
+    elapsed = time.perf_counter() - start
+    with_ai = sum(1 for entry in merged if 'ai' in entry)
+    return elapsed, STATE.calls, STATE.prompt_chars, with_ai, len(static)
+
+
+def main():
+    app.init_database()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/v1'
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    code = make_module(count)
+    edited = code.replace('return value * 7\n', 'return value * 7 + 1\n', 1)
+    reformatted = code.replace('    return None\n', '    return None  # nothing found\n').replace('def ', '\n\ndef ')
+    cases = [('cold store', code), ('unchanged', code), ('one function edited', edited),
+             ('comments and blank lines only', reformatted)]
+
+    failures = 0
+    print(f"{count} functions, {code.count(chr(10))} lines; the previous endpoint sent all "
+          f"{len(code)} characters on every run")
+    print(f"{'run':32} {'seconds':>8} {'API calls':>10} {'prompt chars':>13} {'with AI':>8}")
+    with app.app.app_context():
+        app.db.session.query(app.FunctionSummary).delete()
+        app.db.session.commit()
+        for name, source in cases:
+            elapsed, calls, chars, with_ai, total = summarize(base_url, source)
+            print(f"{name:32} {elapsed:8.2f} {calls:10} {chars:13} {with_ai:>4}/{total}")
+            if with_ai != total or (name != 'cold store' and calls > 1):
+                failures += 1
+                print(f"MISMATCH: {name} should summarize every function with at most one call")
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
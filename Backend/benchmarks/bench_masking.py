@@ -0,0 +1,87 @@
+"""Benchmark mask_sensitive_content against the previous per-rule subn loop.
+
+Run from the Backend directory:
+    python benchmarks/bench_masking.py [size_mb]
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import _build_masking_rules, mask_sensitive_content  # noqa: E402
+
+
+def legacy_mask_sensitive_content(filename, text):
+    """The previous loop: rules rebuilt per call, one closure and full subn per rule."""
+    masked_text = text
+    detections_map = {}
+    for rule in _build_masking_rules():
+        def _replace(match):
+            detections_map[rule['name']] = detections_map.get(rule['name'], 0) + 1
+            return rule['mask'](match)
+        masked_text, _ = rule['regex'].subn(_replace, masked_text)
+    return {'masked_text': masked_text, 'detections': [{'type': k, 'count': v} for k, v in detections_map.items()]}
+
+
+def _token(rng, n):
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(n))
+
+
+def make_env(rng, size):
+    lines = []
+    total = 0
+    while total < size:
+        roll = rng.random()
+        if roll < 0.02:
+            line = f"OPENAI_API_KEY=sk-{_token(rng, 32)}"
+        elif roll < 0.04:
+            line = f"DB_PASSWORD={_token(rng, 12)}"
+        else:
+            line = f"FEATURE_{_token(rng, 6).upper()}_ENABLED={rng.choice(['true', 'false'])}"
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines)
+
+
+def make_json(rng, size):
+    records = []
+    total = 0
+    while total < size:
+        record = {'id': _token(rng, 10), 'name': _token(rng, 16), 'tags': [_token(rng, 5) for _ in range(3)]}
+        if rng.random() < 0.01:
+            record['auth'] = f"Bearer {_token(rng, 20)}.{_token(rng, 30)}.{_token(rng, 20)}"
+        records.append(record)
+        total += 90
+    return json.dumps(records, indent=2)
+
+
+def best_of(func, *args, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    size = int(float(sys.argv[1] if len(sys.argv) > 1 else 4) * 1024 * 1024)
+    rng = random.Random(1234)
+    for filename, text in (('config.env', make_env(rng, size)), ('data.json', make_json(rng, size))):
+        size_mb = len(text) / (1024 * 1024)
+        legacy_time, legacy = best_of(legacy_mask_sensitive_content, filename, text)
+        current_time, current = best_of(mask_sensitive_content, filename, text)
+        assert current['masked_text'] == legacy['masked_text'], f"{filename}: masked output differs"
+        assert current['detections'] == legacy['detections'], f"{filename}: detections differ"
+        print(f"{filename}: {size_mb:.1f} MB, detections {current['detections']}")
+        print(f"  legacy:  {legacy_time * 1000:8.1f} ms  ({size_mb / legacy_time:7.1f} MB/s)")
+        print(f"  current: {current_time * 1000:8.1f} ms  ({size_mb / current_time:7.1f} MB/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Check python_metrics on a small corpus and measure files analysed per second.
+
+Run from the Backend directory:
+    python benchmarks/bench_metrics.py [max_files]
+
+The throughput corpus is the standard library's top-level modules. "cold"
+parses and measures every file; "cached" repeats the same files, which are
+then served from the content-hash cache. When Radon is importable its
+in-process analysis of the same files is timed for comparison.
+"""
+import glob
+import os
+import sys
+import sysconfig
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import PythonSource, python_metrics  # noqa: E402
+
+# (source, expected subset of the metrics, {function: cyclomatic complexity})
+CORPUS = [
+    ('def f(x):\n    if x and y or z:\n        return 1\n    for i in x:\n        pass\n    else:\n        return 2\n',
+     {'complexity': 6, 'loc': 7, 'sloc': 7}, {'f': 6}),
+    ('def outer(items):\n    """Doc\n\n    string."""\n    def inner(v):\n        return [i for i in v if i]\n'
+     '    try:\n        pass\n    except ValueError:\n        pass\n    except KeyError:\n        pass\n',
+     {'complexity': 5, 'multi': 2, 'blank': 1}, {'outer': 3, 'inner': 3}),
+    ('class A:\n    # comment\n    def m(self, v):  # inline\n        match v:\n            case 1:\n                pass\n'
+     '            case _:\n                pass\n        assert v\n',
+     {'comments': 2, 'single_comments': 1}, {'A.m': 3}),
+]
+
+
+def check_corpus():
+    failures = 0
+    for source, expected, functions in CORPUS:
+        metrics = PythonSource(source).metrics
+        actual = {key: metrics[key] for key in expected}
+        actual_functions = {block['name']: block['complexity'] for block in metrics['functions']}
+        if actual != expected or actual_functions != functions:
+            failures += 1
+            print(f"MISMATCH\n  source:   {source!r}\n  expected: {expected} {functions}\n"
+                  f"  actual:   {actual} {actual_functions}")
+    print(f"corpus: {len(CORPUS) - failures}/{len(CORPUS)} passed")
+    return failures
+
+
+def load_files(limit):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(sysconfig.get_paths()['stdlib'], '*.py'))):
+        with open(path, encoding='utf-8') as f:
+            code = f.read()
+        try:
+            compile(code, path, 'exec', dont_inherit=True)
+        except SyntaxError:
+            continue
+        sources.append(code)
+        if len(sources) >= limit:
+            break
+    return sources
+
+
+def files_per_second(func, sources):
+    start = time.perf_counter()
+    for code in sources:
+        func(code)
+    return len(sources) / (time.perf_counter() - start)
+
+
+def main():
+    failures = check_corpus()
+
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sources = load_files(limit)
+    size_kb = sum(len(code) for code in sources) / len(sources) / 1024
+    print(f"{len(sources)} stdlib files, {size_kb:.1f} KB average")
+    print(f"cold (parse + metrics):  {files_per_second(lambda c: PythonSource(c).metrics, sources):8.0f} files/s")
+    for code in sources:
+        python_metrics(code)
+    print(f"cached (content hash):   {files_per_second(python_metrics, sources):8.0f} files/s")
+    try:
+        from radon.complexity import cc_visit
+        from radon.metrics import h_visit, mi_visit
+        from radon.raw import analyze
+    except ImportError:
+        print("radon not installed, skipping comparison")
+    else:
+        def radon_all(code):
+            cc_visit(code), h_visit(code), mi_visit(code, True), analyze(code)
+        print(f"radon in-process:        {files_per_second(radon_all, sources):8.0f} files/s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Check minify_c_family against a correctness corpus and measure its throughput.
+
+Run from the Backend directory:
+    python benchmarks/bench_minify_c_family.py [target_kb]
+
+Every corpus case must minify to its expected output. Throughput is
+reported per dialect, next to the regex fallback these languages used to get.
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minifiers import C_FAMILY_DIALECTS, minify_c_family  # noqa: E402
+
+# (dialect, source, expected minified output)
+CORPUS = [
+    # Comment markers inside string and char literals survive
+    ('java', 'String url = "http://x/*y*/"; // tail\nchar q = \'"\';',
+     'String url="http://x/*y*/";char q=\'"\';'),
+    ('java', 'int x = a - -b + +c;\nList<List<Integer>> l = f(x >> 1);',
+     'int x=a- -b+ +c;List<List<Integer>>l=f(x>>1);'),
+    ('java', 'String t = """\n    keep   this\n    """;',
+     'String t="""\n    keep   this\n    """;'),
+    # Preprocessor lines keep their own line, continuations included
+    ('c', '#include <stdio.h>\n#define SQ(x) \\\n  ((x) * (x))\nint main(void) { /* x */ return SQ(2) & &y; }',
+     '#include <stdio.h>\n#define SQ(x) \\\n  ((x) * (x))\nint main(void){return SQ(2)& &y;}'),
+    # A // comment ending in a backslash swallows the next line in C and C++
+    ('cpp', 'int x = 3; // reset \\\nx = 100;\nint y = x;',
+     'int x=3;int y=x;'),
+    ('cpp', 'auto s = R"d(a // b\n  c)d"; int n = 1\'000\'000;\nvector<vector<int> > v;',
+     'auto s=R"d(a // b\n  c)d";int n=1\'000\'000;vector<vector<int> >v;'),
+    ('csharp', '#region R\nvar s = @"a ""//"" b"; var t = $"{n}  x";\n#endregion',
+     '#region R\nvar s=@"a ""//"" b";var t=$"{n}  x";\n#endregion'),
+    # Inline HTML is copied verbatim; '.' next to a number keeps its space
+    ('php', '<b><?php $a = 1 . 2; // c ?> html <?php echo $a . .5, new \\DateTime(); ?>\n',
+     '<b><?php\n$a=1 . 2;?> html <?php\necho $a. .5,new \\DateTime();?>\n'),
+    ('php', '<?php\necho <<<EOT\n  hi $a\n  EOT;\n',
+     '<?php\necho<<<EOT\n  hi $a\n  EOT;'),
+    # Line breaks stay where Go, Kotlin and Swift end statements
+    ('go', 'package main\n\nimport "fmt" // fmt\n\n//go:noinline\nfunc f(x int) int {\n\ty := x +\n\t\t1\n\treturn y\n}\n',
+     'package main\nimport"fmt"\n//go:noinline\nfunc f(x int)int{y:=x+1\nreturn y}'),
+    ('kotlin', 'val s = "v=${m["k"]} // not a comment"\nval r = listOf(1, 2)\n    .map { it * 2 } /* a /* nested */ b */\n'
+               'if (1 !in r) println(1..3)',
+     'val s="v=${m["k"]} // not a comment"\nval r=listOf(1,2).map{it*2}\nif(1 !in r)println(1..3)'),
+    # Swift operators keep the whitespace that makes them prefix, postfix or infix
+    ('swift', 'let b = -a\nlet c = a + b // sum\nlet s = "x \\(d["k"]!) y"\n#if DEBUG\nprint(s)\n#endif',
+     'let b = -a\nlet c = a + b\nlet s = "x \\(d["k"]!) y"\n#if DEBUG\nprint(s)\n#endif'),
+]
+
+
+def check_corpus():
+    failures = 0
+    for dialect, source, expected in CORPUS:
+        actual = minify_c_family(source, dialect)
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH [{dialect}]\n  source:   {source!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+    print(f"corpus: {len(CORPUS) - failures}/{len(CORPUS)} passed")
+    return failures
+
+
+def legacy_shorten(code):
+    """The regex fallback previously used for these languages, kept as the baseline."""
+    code = re.sub(r'//.*', '', code)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+    code = re.sub(r'\n\s*\n', '\n', code)
+    code = re.sub(r'^\s+', '', code, flags=re.MULTILINE)
+    return code.strip()
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    failures = check_corpus()
+
+    target_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    print(f"{'dialect':8} {'regex MB/s':>10} {'lexer MB/s':>10} {'ratio':>6}")
+    for dialect in C_FAMILY_DIALECTS:
+        sample = '\n'.join(source for name, source, _ in CORPUS if name == dialect) + '\n'
+        code = sample * (target_kb * 1024 // len(sample) + 1)
+        size_mb = len(code) / (1024 * 1024)
+        legacy = best_of(lambda: legacy_shorten(code))
+        current = best_of(lambda: minify_c_family(code, dialect))
+        ratio = len(minify_c_family(code, dialect)) / len(code)
+        print(f"{dialect:8} {size_mb / legacy:10.2f} {size_mb / current:10.2f} {ratio:6.2f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
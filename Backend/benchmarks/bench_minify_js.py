@@ -0,0 +1,144 @@
+"""Check minify_js against a correctness corpus and measure its throughput.
+
+Run from the Backend directory:
+    python benchmarks/bench_minify_js.py [target_kb]
+
+Every corpus case must minify to its expected output. When ``node`` is on
+PATH, each case is also executed before and after minification (with and
+without mangling) and the printed output must match.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import minify_js  # noqa: E402
+
+# (source, expected minified output)
+CORPUS = [
+    # Comment markers inside strings, templates and regex literals survive
+    ('const url = "http://example.com/*x*/"; // trailing\nconsole.log(url)',
+     'const url="http://example.com/*x*/";console.log(url)'),
+    ("const re = /\\/\\/[^/]*\\/*/g; console.log('a//b/*c'.replace(re, '-'))",
+     "const re=/\\/\\/[^/]*\\/*/g;console.log('a//b/*c'.replace(re,'-'))"),
+    ('const a = 2, g = 3, x = 12;\nconsole.log(x / a / g, x /a/ g)',
+     'const a=2,g=3,x=12;console.log(x/a/g,x/a/g)'),
+    ('const s = `line  one\n  // not a comment ${ 1 + `${ "}" }` }`;\nconsole.log(s)',
+     'const s=`line  one\n  // not a comment ${1+`${"}"}`}`;console.log(s)'),
+    ('const re = /[/]/;\nconsole.log(re.test("/"))',
+     'const re=/[/]/;console.log(re.test("/"))'),
+    # Automatic semicolon insertion
+    ('let a = 1\nlet b = a\n++b\nconsole.log(a, b)',
+     'let a=1\nlet b=a\n++b\nconsole.log(a,b)'),
+    ('function f() {\n  return\n  42\n}\nconsole.log(f())',
+     'function f(){return\n42}\nconsole.log(f())'),
+    ('const x = [1, 2]\n  .map(v => v * 2)\n  .join(",")\nconsole.log(x)',
+     'const x=[1,2].map(v=>v*2).join(",")\nconsole.log(x)'),
+    ('let i = 0 /*\n*/ i++\nconsole.log(i)',
+     'let i=0\ni++\nconsole.log(i)'),
+    # Operators that would merge without a space
+    ('let a = 1, b = 2\nconsole.log(a + +b, a - -b, a+ ++b, 1 .toString())',
+     'let a=1,b=2\nconsole.log(a+ +b,a- -b,a+ ++b,1 .toString())'),
+    ('const o = { "k": typeof /x/ }\nconsole.log(o.k, void 0, 1e3 in [])',
+     'const o={"k":typeof/x/}\nconsole.log(o.k,void 0,1e3 in[])'),
+]
+
+# Programs whose output must not change when mangled
+MANGLE_CASES = [
+    '''function total(items, rate) {
+  var subtotal = 0
+  for (var index = 0; index < items.length; index++) subtotal += items[index].price
+  const taxed = subtotal * (1 + rate)
+  return { subtotal, taxed: Math.round(taxed), rate }
+}
+console.log(JSON.stringify(total([{ price: 10 }, { price: 5 }], 0.2)))''',
+    '''function outer(value) {
+  function inner(value) { return value * 2 }
+  let result = inner(value) + value
+  return result
+}
+console.log(outer(4))''',
+    '''var zed = 10
+function shadowed() {
+  const inner = () => { var zed = 3; return zed }
+  return zed + inner()
+}
+console.log(shadowed())''',
+]
+
+
+def run_node(source):
+    return subprocess.run(['node', '-e', source], capture_output=True, text=True, timeout=30).stdout
+
+
+def check_corpus():
+    failures = 0
+    node = shutil.which('node') is not None
+    for source, expected in CORPUS:
+        actual = minify_js(source)
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH\n  source:   {source!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+        elif node and run_node(source) != run_node(actual):
+            failures += 1
+            print(f"BEHAVIOUR CHANGED: {source!r}")
+    for source in MANGLE_CASES:
+        mangled = minify_js(source, mangle=True)
+        if len(mangled) >= len(minify_js(source)):
+            failures += 1
+            print(f"NOT MANGLED: {source!r}")
+        elif node and run_node(source) != run_node(mangled):
+            failures += 1
+            print(f"MANGLING CHANGED BEHAVIOUR: {mangled!r}")
+    checked = len(CORPUS) + len(MANGLE_CASES)
+    print(f"corpus: {checked - failures}/{checked} passed" + ('' if node else ' (node not found, outputs not executed)'))
+    return failures
+
+
+def legacy_minify_js(code):
+    """The regex fallback previously used for JavaScript, kept as the baseline."""
+    code = re.sub(r'//.*', '', code)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+    code = re.sub(r'\n\s*\n', '\n', code)
+    code = re.sub(r'^\s+', '', code, flags=re.MULTILINE)
+    code = re.sub(r'\s+', ' ', code)
+    return code.strip()
+
+
+def best_of(func, arg, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    failures = check_corpus()
+
+    target_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    sample = '\n'.join(source for source, _ in CORPUS) + '\n' + '\n'.join(MANGLE_CASES) + '\n'
+    code = sample * (target_kb * 1024 // len(sample) + 1)
+    size_mb = len(code) / (1024 * 1024)
+
+    legacy = best_of(legacy_minify_js, code)
+    current = best_of(minify_js, code)
+    mangled = best_of(lambda c: minify_js(c, mangle=True), code)
+
+    print(f"input: {size_mb:.2f} MB")
+    print(f"legacy regex fallback: {legacy * 1000:8.1f} ms  ({size_mb / legacy:6.2f} MB/s, not string-safe)")
+    print(f"lexer minify_js:       {current * 1000:8.1f} ms  ({size_mb / current:6.2f} MB/s)"
+          f"  output ratio {len(minify_js(code)) / len(code):.2f}")
+    print(f"lexer + mangle:        {mangled * 1000:8.1f} ms  ({size_mb / mangled:6.2f} MB/s)"
+          f"  output ratio {len(minify_js(code, mangle=True)) / len(code):.2f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark the tokenize-based minify_python against the previous fast_strip/AST path.
+
+Run from the Backend directory:
+    python benchmarks/bench_minify_python.py [target_kb]
+"""
+import ast
+import os
+import re
+import sys
+import time
+
+import astor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import minify_python  # noqa: E402
+
+SAMPLE = '''
+class Account:
+    """A bank account."""
+
+    rate = 0.02  # annual interest
+
+    def __init__(self, owner, balance=0):
+        """Create an account for *owner*."""
+        self.owner = owner
+        self.balance = balance
+
+    def deposit(self, amount):
+        # Reject non-positive deposits
+        if amount <= 0:
+            raise ValueError("amount must be positive # not a comment")
+        self.balance += amount
+        return self.balance
+
+
+def interest(account, years):
+    """Compound interest over *years*."""
+    total = account.balance
+    for _ in range(years):
+        total *= 1 + Account.rate
+    return round(total, 2)
+'''
+
+
+def legacy_minify_python(code):
+    """The previous implementation, kept here as the comparison baseline."""
+    def fast_strip(code_str):
+        result_lines = []
+        in_multiline_comment = False
+        for line in code_str.split('\n'):
+            if '"""' in line or "'''" in line:
+                in_multiline_comment = not in_multiline_comment
+                continue
+            if in_multiline_comment:
+                continue
+            temp = re.sub(r'#.*', '', line).rstrip()
+            if temp:
+                result_lines.append(temp)
+        return '\n'.join(result_lines)
+
+    if len(code) > 5000:
+        fast_stripped = fast_strip(code)
+        try:
+            compile(fast_stripped, '<string>', 'exec')
+            return fast_stripped
+        except SyntaxError:
+            pass
+    tree = ast.parse(code)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Module)):
+            if node.body and isinstance(node.body[0], ast.Expr) and isinstance(node.body[0].value, ast.Constant):
+                node.body.pop(0)
+    minified = astor.to_source(tree)
+    minified = re.sub(r'\n\s*\n', '\n', minified)
+    minified = re.sub(r'^\s+', '', minified, flags=re.MULTILINE)
+    minified = re.sub(r'\s+$', '', minified, flags=re.MULTILINE)
+    return minified.strip()
+
+
+def best_of(func, arg, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    target_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    code = SAMPLE * (target_kb * 1024 // len(SAMPLE) + 1)
+    size_mb = len(code) / (1024 * 1024)
+
+    legacy = best_of(legacy_minify_python, code)
+    current = best_of(minify_python, code)
+    ratio = len(minify_python(code)) / len(code)
+
+    print(f"input: {size_mb:.2f} MB")
+    print(f"legacy fast_strip/AST: {legacy * 1000:8.1f} ms  ({size_mb / legacy:6.2f} MB/s)")
+    print(f"tokenize single pass:  {current * 1000:8.1f} ms  ({size_mb / current:6.2f} MB/s)")
+    print(f"speedup: {legacy / current:.2f}x, output ratio {ratio:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Time GET /api/snippets against a large snippet table.
+
+Run from the Backend directory:
+    python benchmarks/bench_snippets.py [snippets]
+
+Seeds ``snippets`` rows (500,000 by default) spread over 1,000 users, with
+one heavy user owning a tenth of them and many rows sharing a timestamp.
+The checks walk every page of the heavy user and confirm each snippet
+comes back once, newest first, and that SQLite answers the listing from
+``ix_snippets_user_created``. The timings compare the old in-memory scan
+of every snippet with the first and a deep page of the keyset listing.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import jwt  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import app  # noqa: E402
+
+USERS = 1000
+HEAVY_USER = 1
+
+
+def seed(count):
+    base = datetime(2024, 1, 1)
+    heavy = count // 10
+    rows = []
+    for i in range(count):
+        user_id = HEAVY_USER if i < heavy else 2 + i % (USERS - 1)
+        # Groups of ten rows share a timestamp, so pages must break ties on short_id
+        created_at = base + timedelta(seconds=i // 10)
+        rows.append({'short_id': f's{i:09d}', 'user_id': user_id, 'title': f'Snippet {i}',
+                     'code': f'print({i})', 'language': 'python', 'created_at': created_at,
+                     'updated_at': created_at})
+    # jwt_required only accepts tokens of existing users
+    app.db.session.execute(app.User.__table__.insert(), [
+        {'id': user_id, 'email': f'user{user_id}@example.com', 'password_hash': '-', 'created_at': base}
+        for user_id in range(1, USERS + 1)])
+    app.db.session.execute(app.Snippet.__table__.insert(), rows)
+    app.db.session.commit()
+    return rows, heavy
+
+
+def token(user_id):
+    return jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                      app.app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def get_page(client, headers, cursor=None, limit=None):
+    query = {key: value for key, value in (('cursor', cursor), ('limit', limit)) if value}
+    response = client.get('/api/snippets', headers=headers, query_string=query)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json(), response.headers.get('X-Next-Cursor')
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    app.init_database()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    client = app.app.test_client()
+    headers = {'Authorization': f'Bearer {token(HEAVY_USER)}'}
+    failures = 0
+    with app.app.app_context():
+        app.db.session.query(app.Snippet).delete()
+        start = time.perf_counter()
+        rows, heavy = seed(count)
+        print(f"seeded {count} snippets in {time.perf_counter() - start:.1f} s; user {HEAVY_USER} owns {heavy}\n")
+
+        plan = app.db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM snippets WHERE user_id = 1 AND created_at <= '2024-02-01' AND "
+            "(created_at < '2024-02-01' OR (created_at = '2024-02-01' AND short_id < 'x')) "
+            "ORDER BY created_at DESC, short_id DESC LIMIT 51")).all()
+        failures = check('listing is served by ix_snippets_user_created',
+                         any('ix_snippets_user_created' in str(row) for row in plan)
+                         and not any('TEMP B-TREE' in str(row) for row in plan), failures)
+
+    seen, cursor, pages, deep_cursor = [], None, 0, None
+    while True:
+        page, cursor = get_page(client, headers, cursor, limit=200)
+        seen.extend(snippet['short_id'] for snippet in page)
+        pages += 1
+        if pages == heavy // 400:
+            deep_cursor = cursor
+        if not cursor:
+            break
+    expected = [row['short_id'] for row in reversed(rows[:heavy])]
+    failures = check(f'walking {pages} pages returns each snippet once, newest first', seen == expected, failures)
+    response = client.get('/api/snippets', headers=headers, query_string={'cursor': 'not a cursor'})
+    failures = check('a malformed cursor is a 400', response.status_code == 400, failures)
+
+    # The previous store: a dict of every snippet, scanned on each GET
+    snippets_db = {row['short_id']: dict(row, user_id=str(row['user_id'])) for row in rows}
+
+    def old_listing():
+        return [snippet for snippet in snippets_db.values() if snippet['user_id'] == str(HEAVY_USER)]
+
+    print(f"\n{'':34} {'ms':>8}")
+    for name, func in (('old scan of every snippet', old_listing),
+                       ('keyset first page (50)', lambda: get_page(client, headers)),
+                       ('keyset page halfway down (50)', lambda: get_page(client, headers, deep_cursor))):
+        print(f"{name:34} {best_of(func) * 1000:8.2f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Compare per-request commits with the write-behind ProcessedFile queue under concurrent load.
+
+Run from the Backend directory:
+    python benchmarks/bench_write_behind.py [requests] [commit latency ms]
+
+Every session commit sleeps for the given latency (10 ms by default)
+after it completes, standing in for the round trip to a hosted database.
+``requests`` submissions (4,000 by default) are made from 16 threads, the
+way /api/shorten persists its result: one commit per request as before,
+then through ProcessedFileWriter in sync and async mode. The checks
+confirm that every id is distinct and its row exists, that ``close``
+commits rows still queued, and that a comment can be posted on a file
+that is still queued.
+"""
+import concurrent.futures
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import jwt  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import app  # noqa: E402
+
+THREADS = 16
+
+
+def make_code(i):
+    return f'def handler_{i}(request):\n    # request {i}\n    return request.get("v{i}")\n'
+
+
+def run(persist, count):
+    def worker(indexes):
+        latencies, ids = [], []
+        with app.app.app_context():
+            for i in indexes:
+                code = make_code(i)
+                start = time.perf_counter()
+                ids.append(persist(None, code, app.minify_python(code), 'python'))
+                latencies.append(time.perf_counter() - start)
+        return latencies, ids
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(worker, [range(t, count, THREADS) for t in range(THREADS)]))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result[0])
+    return elapsed, latencies, [file_id for result in results for file_id in result[1]]
+
+
+def rows_exist(ids):
+    with app.app.app_context():
+        found = app.db.session.scalar(app.db.select(app.db.func.count()).where(app.ProcessedFile.id.in_(ids)))
+    return found == len(ids) == len(set(ids))
+
+
+def check(name, condition, failures):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}")
+    return failures + (not condition)
+
+
+def main():
+    app.init_database()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 10) / 1000
+    commits = [0]
+
+    @event.listens_for(Session, 'after_commit')
+    def slow_commit(session):
+        commits[0] += 1
+        time.sleep(latency)
+
+    failures = 0
+    report = []
+    for name, make_writer in (('commit per request', None),
+                              ('write-behind, sync', lambda: app.ProcessedFileWriter('sync', 500, 0.05, 10_000)),
+                              ('write-behind, async', lambda: app.ProcessedFileWriter('async', 500, 0.05, 10_000))):
+        writer = make_writer() if make_writer else None
+        commits[0] = 0
+        elapsed, latencies, ids = run(writer.submit if writer else app.save_processed_file, count)
+        if writer:
+            writer.close()
+        failures = check(f'{name}: every id is distinct and its row is stored', rows_exist(ids), failures)
+        report.append((name, elapsed, latencies, commits[0]))
+
+    writer = app.ProcessedFileWriter('async', 500, 60, 10_000)
+    with app.app.app_context():
+        queued = [writer.submit(None, make_code(i), make_code(i), 'python') for i in range(10)]
+    writer.close()
+    failures = check('close commits rows still waiting for their window', rows_exist(queued), failures)
+
+    app.processed_file_writer = app.ProcessedFileWriter('async', 500, 60, 10_000)
+    client = app.app.test_client()
+    with app.app.app_context():
+        user = app.User(email='bench@example.com')
+        user.set_password('bench')
+        app.db.session.add(user)
+        app.db.session.commit()
+        token = jwt.encode({'user_id': str(user.id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                           app.app.config['SECRET_KEY'], algorithm='HS256')
+    file_id = client.post('/api/shorten', json={'code': make_code(-1), 'lang': 'python'}).get_json()['file_id']
+    response = client.post('/api/comments', json={'file_id': file_id, 'comment': 'queued'},
+                           headers={'Authorization': f'Bearer {token}'})
+    failures = check('a comment on a still-queued file is accepted', response.status_code == 201, failures)
+    app.processed_file_writer.close()
+
+    print(f"\n{count} requests from {THREADS} threads, {latency * 1000:g} ms per commit")
+    print(f"{'':24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'commits':>8}")
+    for name, elapsed, latencies, commit_count in report:
+        print(f"{name:24} {count / elapsed:8.0f} {statistics.median(latencies) * 1000:8.2f} "
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:8.2f} {commit_count:8}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
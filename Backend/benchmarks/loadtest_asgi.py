@@ -0,0 +1,162 @@
+"""Load-test /api/summarize-functions under gunicorn (WSGI) and uvicorn (ASGI) against a slow AI stub.
+
+Run from the Backend directory:
+    python benchmarks/loadtest_asgi.py [concurrency ...]
+
+Each server runs in a subprocess with OPENAI_BASE_URL pointing at an
+asyncio stub that answers after STUB_LATENCY seconds and records how many
+AI calls overlapped. For every concurrency level, that many requests are
+sent at once, each with distinct code so no summary is stored yet. The
+peak overlap at the stub shows how many requests the server really had in
+flight: the gunicorn thread count under WSGI, and every request under
+ASGI. Both servers get a high AI_MAX_CONCURRENCY so the gateway's own
+limit does not hide the difference.
+"""
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_LATENCY = 1.0
+WSGI_THREADS = 8
+_FUNCTION_HEADER_RE = re.compile(r'^### Function \d+: (\S+)$', re.MULTILINE)
+
+
+class Stub:
+    """Minimal HTTP/1.1 chat completions server that can hold thousands of slow requests open."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int(re.search(rb'(?i)content-length:\s*(\d+)', head).group(1))
+                body = json.loads(await reader.readexactly(length))
+                self.calls += 1
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                try:
+                    await asyncio.sleep(STUB_LATENCY)
+                finally:
+                    self.in_flight -= 1
+                names = _FUNCTION_HEADER_RE.findall(body['messages'][-1]['content']) or ['<module>']
+                entries = [{'name': name, 'summary': f'{name} summary', 'suggestions': [], 'complexity': 'low'}
+                           for name in names]
+                payload = json.dumps({
+                    'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': json.dumps({'functions': entries})}}]
+                }).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(payload), payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def start_server(mode, port, stub_port, db_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{db_path}',
+        OPENAI_API_KEY='stub',
+        OPENAI_BASE_URL=f'http://127.0.0.1:{stub_port}/v1',
+        AI_MAX_CONCURRENCY='10000',
+        AI_QUEUE_TIMEOUT='300',
+    )
+    if mode == 'wsgi':
+        command = ['gunicorn', '--workers', '1', '--threads', str(WSGI_THREADS), '--bind', f'127.0.0.1:{port}',
+                   '--timeout', '600', '--backlog', '4096', '--worker-connections', '100000', 'app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning',
+                   '--backlog', '4096', '--limit-concurrency', '100000']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f'{base_url}/api/cache/stats')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not start')
+
+
+async def run_level(base_url, stub, concurrency):
+    run = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        async def one(i):
+            code = f'def handler_{run}_{i}(request):\n    return request.get("v{i}")\n'
+            start = time.perf_counter()
+            try:
+                response = await client.post('/api/summarize-functions', json={'code': code})
+                body = response.json()
+                ok = response.status_code == 200 and not body['warnings'] and 'ai' in body['data']['summaries'][0]
+            except (httpx.HTTPError, ValueError, KeyError, IndexError):
+                ok = False
+            return ok, time.perf_counter() - start
+
+        stub.peak = stub.calls = 0
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, latency in results)
+    return {
+        'elapsed': elapsed,
+        'errors': sum(1 for ok, _ in results if not ok),
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'peak': stub.peak,
+    }
+
+
+async def main():
+    levels = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 2000]
+    stub = Stub()
+    stub_server = await asyncio.start_server(stub.handle, '127.0.0.1', 0, backlog=8192)
+    stub_port = stub_server.sockets[0].getsockname()[1]
+
+    print(f"stub latency {STUB_LATENCY:g} s; gunicorn runs 1 worker with {WSGI_THREADS} threads")
+    print(f"{'server':8} {'requests':>8} {'seconds':>8} {'req/s':>7} {'p50 s':>7} {'p99 s':>7} "
+          f"{'in flight':>9} {'errors':>6}")
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for index, mode in enumerate(('wsgi', 'asgi')):
+            port = 5600 + index
+            server = start_server(mode, port, stub_port, os.path.join(tmp, f'{mode}.db'))
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                await wait_ready(base_url)
+                for concurrency in levels:
+                    result = await run_level(base_url, stub, concurrency)
+                    failures += result['errors']
+                    print(f"{mode:8} {concurrency:8} {result['elapsed']:8.2f} {concurrency / result['elapsed']:7.0f} "
+                          f"{result['p50']:7.2f} {result['p99']:7.2f} {result['peak']:9} {result['errors']:6}")
+            finally:
+                server.terminate()
+                server.wait()
+                await asyncio.sleep(0.5)  # let the stub see its connections close
+    stub_server.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
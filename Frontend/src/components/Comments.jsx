@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useCallback } from 'react';
+import React, { useEffect, useState, useCallback, useRef } from 'react';
 import {
   Box,
   Heading,
@@ -14,12 +14,23 @@ import {
 } from '@chakra-ui/react';
 import { useAuth } from '../context/AuthContext';
 
+// Newest first, as the API lists them; a comment already shown is replaced by its latest copy
+const mergeComments = (current, incoming) => {
+  const byId = new Map(current.map((c) => [c.id, c]));
+  incoming.forEach((c) => byId.set(c.id, c));
+  return [...byId.values()].sort((a, b) => (new Date(b.timestamp) - new Date(a.timestamp)) || (b.id - a.id));
+};
+
 const Comments = ({ fileId }) => {
   const { user } = useAuth();
   const toast = useToast();
   const [comments, setComments] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [newComment, setNewComment] = useState('');
   const [isSubmitting, setIsSubmitting] = useState(false);
+  // Once older pages are shown, polling the first page must not reset the cursor
+  const loadedOlder = useRef(false);
 
   const fetchComments = useCallback(async () => {
     if (!fileId) return;
@@ -27,13 +38,34 @@ const Comments = ({ fileId }) => {
       const res = await fetch(`/api/comments/${fileId}`);
       if (!res.ok) return;
       const data = await res.json();
-      setComments(Array.isArray(data) ? data : []);
+      setComments((prev) => mergeComments(prev, Array.isArray(data) ? data : []));
+      if (!loadedOlder.current) setNextCursor(res.headers.get('X-Next-Cursor'));
     } catch (e) {
       // ignore
     }
   }, [fileId]);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setIsLoadingMore(true);
+      const res = await fetch(`/api/comments/${fileId}?cursor=${encodeURIComponent(nextCursor)}`);
+      if (!res.ok) return;
+      const data = await res.json();
+      loadedOlder.current = true;
+      setComments((prev) => mergeComments(prev, Array.isArray(data) ? data : []));
+      setNextCursor(res.headers.get('X-Next-Cursor'));
+    } catch (e) {
+      // ignore
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
+    setComments([]);
+    setNextCursor(null);
+    loadedOlder.current = false;
     fetchComments();
     if (!fileId) return;
     const interval = setInterval(fetchComments, 5000);
@@ -62,7 +94,7 @@ const Comments = ({ fileId }) => {
       }
       const saved = await res.json();
       setNewComment('');
-      setComments((prev) => [saved, ...prev]);
+      setComments((prev) => mergeComments(prev, [saved]));
       toast({ title: 'Comment posted', status: 'success', duration: 1500 });
     } catch (e) {
       toast({ title: 'Error', description: e.message, status: 'error', duration: 2000 });
@@ -89,6 +121,9 @@ const Comments = ({ fileId }) => {
             <Text whiteSpace="pre-wrap">{c.comment}</Text>
           </Box>
         ))}
+        {nextCursor && (
+          <Button variant="ghost" onClick={loadMore} isLoading={isLoadingMore}>Load older comments</Button>
+        )}
       </VStack>
 
       <Box opacity={user ? 1 : 0.6} pointerEvents={user ? 'auto' : 'none'}>
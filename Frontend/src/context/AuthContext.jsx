@@ -19,6 +19,14 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const token = localStorage.getItem('token');
+    if (token) {
+      // Let the server reject this token from now on; signing out locally does not wait for it
+      fetch('/api/auth/logout', {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${token}` }
+      }).catch(() => {});
+    }
     setUser(null);
     localStorage.removeItem('token');
   };